@@ -284,6 +284,39 @@ class FileWriteRequest(_Request):
            to be written"""
         return _copy.copy(self._checksums)
 
+    def upload_to_blobstore(self, bucket):
+        """Write the source files of this request to their destination
+           keys in 'bucket' using the BlobStore, with the blobs owned
+           by the account paying for this request. The contents of each
+           file are only uploaded if they are not already held for this
+           account (the BlobStore calculates the checksum of each file
+           itself, and checks the size against this request). This
+           returns the list of destination keys whose contents were
+           uploaded. Note that this is only possible from the copy of
+           the object that created the request
+        """
+        from Acquire.ObjectStore import BlobStore as _BlobStore
+
+        if self.is_null():
+            return []
+
+        if len(self._source_filenames) != len(self._destination_keys):
+            raise PermissionError(
+                "The source files are only available from the copy of "
+                "the request that was created for them")
+
+        uploaded = []
+
+        for (filename, key, size) in zip(self._source_filenames,
+                                         self._destination_keys,
+                                         self._file_sizes):
+            if _BlobStore.set_object_from_file(bucket, self._account_uid,
+                                               key, filename,
+                                               filesize=size):
+                uploaded.append(key)
+
+        return uploaded
+
     def account_uid(self):
         """Return the UID of the account from which payment should be
            taken for the file storage
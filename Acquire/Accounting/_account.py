@@ -8,6 +8,8 @@ import re as _re
 from Acquire.Service import login_to_service_account \
                         as _login_to_service_account
 from Acquire.ObjectStore import ObjectStore as _ObjectStore
+from Acquire.ObjectStore import encode_json_object as _encode_json_object
+from Acquire.ObjectStore import decode_json_object as _decode_json_object
 
 from Acquire.Identity import Authorisation as _Authorisation
 
@@ -16,6 +18,7 @@ from ._debitnote import DebitNote as _DebitNote
 from ._creditnote import CreditNote as _CreditNote
 from ._lineitem import LineItem as _LineItem
 from ._decimal import create_decimal as _create_decimal
+from ._decimal import FixedPoint as _FixedPoint
 from ._transactioninfo import TransactionInfo as _TransactionInfo
 from ._transactioninfo import TransactionCode as _TransactionCode
 from ._receipt import Receipt as _Receipt
@@ -25,6 +28,22 @@ from ._errors import AccountError, InsufficientFundsError
 
 __all__ = ["Account"]
 
+# line items are only included in the persisted balance checkpoint of
+# an account once they are older than this number of seconds, so that
+# line items that are written late by concurrent transactions (or
+# rolled back by a failed debit) are not missed by the checkpoint
+_checkpoint_lag = 60
+
+# line items are written into sub-day partitions of this number of
+# seconds (one hour), so that listing the line items in a time window
+# only lists the partitions that overlap that window. This must divide
+# a day into whole minutes, and must not be changed once line items
+# have been written
+_partition_seconds = 3600
+
+# the number of partitions in each day
+_partitions_per_day = 86400 // _partition_seconds
+
 
 def _account_root():
     return "accounts"
@@ -36,6 +55,35 @@ def _get_key_from_day(start, datetime):
                                  datetime.month, datetime.day)
 
 
+def _get_partition(datetime):
+    """Return the name of the sub-day partition that contains the
+       passed datetime, e.g. '2018-06-01T0900'"""
+    seconds = 3600*datetime.hour + 60*datetime.minute + datetime.second
+    seconds -= seconds % _partition_seconds
+
+    return "%4d-%02d-%02dT%02d%02d" % (datetime.year, datetime.month,
+                                       datetime.day, seconds // 3600,
+                                       (seconds % 3600) // 60)
+
+
+def _get_partitions_between(day, start_time, end_time):
+    """Return the names of the partitions of the day with ordinal 'day'
+       that overlap the time window from 'start_time' to 'end_time'"""
+    day_start = _datetime.datetime.fromordinal(day)
+
+    start = max(0, (start_time - day_start).total_seconds())
+    end = min(86399, (end_time - day_start).total_seconds())
+
+    partitions = []
+
+    for i in range(int(start // _partition_seconds),
+                   int(end // _partition_seconds) + 1):
+        partitions.append(_get_partition(
+            day_start + _datetime.timedelta(seconds=i*_partition_seconds)))
+
+    return partitions
+
+
 def _get_day_from_key(key):
     """Return the date that is encoded in the passed key"""
     m = _re.search(r"(\d\d\d\d)-(\d\d)-(\d\d)", key)
@@ -48,41 +96,55 @@ def _get_day_from_key(key):
         raise AccountError("Could not find a date in the key '%s'" % key)
 
 
+def _get_timestamp_from_key(key):
+    """Return the timestamp that is encoded in the passed line item key,
+       which ends with '<timestamp>/<uid>/<encoded value>'"""
+    try:
+        return float(key.split("/")[-3])
+    except:
+        return 0
+
+
+def _get_sort_key(key):
+    """Return the key used to sort line item keys into time order"""
+    return (_get_timestamp_from_key(key), key)
+
+
 def _sum_transactions(keys):
     """Internal function that sums all of the transactions identified
-        by the passed keys. This returns a tuple of
+        by the passed keys. This returns a tuple of FixedPoint values
         (balance, liability, receivable, spent_today)
     """
-    balance = _create_decimal(0)
-    liability = _create_decimal(0)
-    receivable = _create_decimal(0)
-    spent_today = _create_decimal(0)
-
-    for key in keys:
-        v = _TransactionInfo(key)
-
-        if v.is_credit():
-            balance += v.value()
-        elif v.is_debit():
-            balance -= v.value()
-            spent_today += v.value()
-        elif v.is_liability():
-            liability += v.value()
-            spent_today += v.value()
-        elif v.is_accounts_receivable():
-            receivable += v.value()
-        elif v.is_received_receipt():
-            balance -= v.receipted_value()
-            liability -= v.value()
-        elif v.is_sent_receipt():
-            balance += v.receipted_value()
-            receivable -= v.value()
-        elif v.is_received_refund():
-            balance += v.value()
-        elif v.is_sent_refund():
-            balance -= v.value()
-
-    return (balance, liability, receivable, spent_today)
+    # sum using integer micro-units, as this is much faster than
+    # summing Decimals
+    totals = _TransactionInfo.sum_values(keys)
+
+    def _value(code):
+        return totals.get(code, (0, 0))[0]
+
+    def _receipted_value(code):
+        return totals.get(code, (0, 0))[1]
+
+    balance = _value(_TransactionCode.CREDIT) - \
+        _value(_TransactionCode.DEBIT) - \
+        _receipted_value(_TransactionCode.RECEIVED_RECEIPT) + \
+        _receipted_value(_TransactionCode.SENT_RECEIPT) + \
+        _value(_TransactionCode.RECEIVED_REFUND) - \
+        _value(_TransactionCode.SENT_REFUND)
+
+    liability = _value(_TransactionCode.CURRENT_LIABILITY) - \
+        _value(_TransactionCode.RECEIVED_RECEIPT)
+
+    receivable = _value(_TransactionCode.ACCOUNT_RECEIVABLE) - \
+        _value(_TransactionCode.SENT_RECEIPT)
+
+    spent_today = _value(_TransactionCode.DEBIT) + \
+        _value(_TransactionCode.CURRENT_LIABILITY)
+
+    return (_FixedPoint.from_micro(balance),
+            _FixedPoint.from_micro(liability),
+            _FixedPoint.from_micro(receivable),
+            _FixedPoint.from_micro(spent_today))
 
 
 class Account:
@@ -157,6 +219,9 @@ class Account:
         self._maximum_daily_limit = 0
         self._last_update_ordinal = None
 
+        # all line items of new accounts are written into partitions
+        self._partitioned_from = _datetime.datetime.now().toordinal()
+
         # initialise the account with a balance of zero
         bucket = _login_to_service_account()
         self._record_daily_balance(0, 0, 0, bucket=bucket)
@@ -265,9 +330,9 @@ class Account:
                                    keys[-1])
 
         # what was the balance on the last day?
-        result = (_create_decimal(last_data["balance"]),
-                  _create_decimal(last_data["liability"]),
-                  _create_decimal(last_data["receivable"]))
+        result = (_FixedPoint(last_data["balance"]),
+                  _FixedPoint(last_data["liability"]),
+                  _FixedPoint(last_data["receivable"]))
 
         # ok, now we go from the last day until today and sum up the
         # line items from each day to create the daily balances
@@ -295,7 +360,7 @@ class Account:
 
     def _get_daily_balance(self, bucket=None, datetime=None):
         """Get the daily starting balance for the passed datetime. This
-           returns a tuple of
+           returns a tuple of FixedPoint values
            (balance, liability, receivable).
 
            where 'balance' is the current real balance of the account,
@@ -334,9 +399,9 @@ class Account:
                 raise AccountError("The daily balance for account at date %s "
                                    "is not available" % str(datetime))
 
-        return (_create_decimal(data["balance"]),
-                _create_decimal(data["liability"]),
-                _create_decimal(data["receivable"]))
+        return (_FixedPoint(data["balance"]),
+                _FixedPoint(data["liability"]),
+                _FixedPoint(data["receivable"]))
 
     def _get_balance(self, bucket=None, datetime=None):
         """Get the balance of the account for the passed datetime. This
@@ -383,21 +448,119 @@ class Account:
         keys = []
 
         for day in range(start_day, end_day+1):
-            day_date = _datetime.datetime.fromordinal(day)
+            # this day may have line items written directly under the
+            # day, before the line items were partitioned
+            legacy = self._partitioned_from is None or \
+                day < self._partitioned_from
+
+            partitions = _get_partitions_between(day, start_time, end_time)
+
+            if 2 * len(partitions) > _partitions_per_day:
+                # the window covers most of the day, so list the whole
+                # day at once rather than each partition in turn
+                day_keys = self._list_day_line_items(
+                                bucket, day, legacy, partitions[0],
+                                start_timestamp, end_timestamp)
+            else:
+                prefixes = []
 
-            prefix = "%s/%4d-%02d-%02d" % (self._key(), day_date.year,
-                                           day_date.month, day_date.day)
+                if legacy:
+                    prefixes.append(_get_key_from_day(
+                                        self._key(),
+                                        _datetime.datetime.fromordinal(day)))
 
-            day_keys = _ObjectStore.get_all_object_names(bucket, prefix)
+                for partition in partitions:
+                    prefixes.append("%s/%s" % (self._key(), partition))
 
-            for day_key in day_keys:
-                try:
-                    timestamp = float(day_key.split("/")[0])
-                except:
-                    timestamp = 0
+                day_keys = []
 
-                if timestamp >= start_timestamp and timestamp <= end_timestamp:
-                        keys.append("%s/%s" % (prefix, day_key))
+                for prefix in prefixes:
+                    day_keys += self._list_line_items(bucket, prefix,
+                                                      start_timestamp,
+                                                      end_timestamp)
+
+            if legacy:
+                # the unpartitioned and partitioned line items of the day
+                # must be merged into time order
+                day_keys.sort(key=_get_sort_key)
+
+            keys += day_keys
+
+        return keys
+
+    def _list_line_items(self, bucket, prefix, start_timestamp,
+                         end_timestamp):
+        """Internal function that returns the keys of the line items
+           under 'prefix' (a day or a partition) whose timestamps are
+           between 'start_timestamp' and 'end_timestamp' (inclusive)
+        """
+        keys = []
+
+        # the keys start with the timestamp, and so are listed
+        # in time order. This means that we can start the listing
+        # from 'start_timestamp' and stop as soon as we pass
+        # 'end_timestamp'
+        item_keys = _ObjectStore.iter_object_names(
+                                bucket, prefix,
+                                start_after=str(start_timestamp))
+
+        for item_key in item_keys:
+            try:
+                timestamp = float(item_key.split("/")[0])
+            except:
+                timestamp = 0
+
+            if timestamp > end_timestamp:
+                break
+            elif timestamp >= start_timestamp:
+                keys.append("%s/%s" % (prefix, item_key))
+
+        return keys
+
+    def _list_day_line_items(self, bucket, day, legacy, first_partition,
+                             start_timestamp, end_timestamp):
+        """Internal function that returns the keys of the line items
+           of the day with ordinal 'day' whose timestamps are between
+           'start_timestamp' and 'end_timestamp' (inclusive), using a
+           single listing of the account that starts from the partition
+           'first_partition', or from the start of the day if 'legacy'
+           line items written directly under the day must be included
+        """
+        day_name = _datetime.datetime.fromordinal(day).strftime("%Y-%m-%d")
+
+        if legacy:
+            # line items under the day sort before all of its partitions
+            start_after = day_name
+        else:
+            start_after = first_partition
+
+        prefix = self._key()
+        keys = []
+
+        for name in _ObjectStore.iter_object_names(bucket, prefix,
+                                                   start_after=start_after):
+            parts = name.split("/")
+
+            if not parts[0].startswith(day_name):
+                # we have listed past the end of the day
+                break
+
+            try:
+                timestamp = float(parts[1])
+            except:
+                timestamp = 0
+
+            if timestamp > end_timestamp:
+                if parts[0] == day_name:
+                    # legacy line items are not in time order with the
+                    # partitions that follow them
+                    continue
+
+                # the partitions are in time order, so every later
+                # line item is after 'end_timestamp'
+                break
+            elif timestamp >= start_timestamp:
+                keys.append("%s/%s" % (prefix, name))
 
         return keys
 
@@ -413,16 +576,15 @@ class Account:
                             _datetime.datetime.fromordinal(now.toordinal()),
                             now)
 
-        total = _sum_transactions(transaction_keys)
+        start_of_day = _datetime.datetime.fromordinal(now.toordinal())
 
-        result = (balance+total[0], liability+total[1], receivable+total[2],
-                  total[3])
+        self._last_update_timestamp = start_of_day.timestamp()
+        self._last_update_key = None
 
-        self._last_update_ordinal = now.toordinal()
-        self._last_update_timestamp = now.timestamp()
-        self._last_update = result
-
-        return result
+        return self._advance_current_balance(
+                    bucket, now,
+                    (balance, liability, receivable, _FixedPoint(0)),
+                    transaction_keys)
 
     def _last_update_datetime(self):
         """Return the last time the balance was updated, as a datetime
@@ -439,27 +601,136 @@ class Account:
            by updating the balance etc. from transactions that have
            occurred since the last update
         """
-        (balance, liability, receivable, spent_today) = self._last_update
-
         # now sum up all of the transactions since the last update
         transaction_keys = self._get_transaction_keys_between(
                                             self._last_update_datetime(),
                                             now)
 
-        total = _sum_transactions(transaction_keys)
+        # skip the transactions that were included in the last update
+        if self._last_update_key is not None:
+            last_update = _get_sort_key(self._last_update_key)
+            transaction_keys = [key for key in transaction_keys
+                                if _get_sort_key(key) > last_update]
+
+        return self._advance_current_balance(bucket, now, self._last_update,
+                                             transaction_keys)
+
+    def _advance_current_balance(self, bucket, now, result, keys):
+        """Internal function that adds the line items at 'keys' (which
+           follow the last update, in time order) to 'result', which is
+           the (balance, liability, receivable, spent_today) at the
+           last update, and returns the updated result. The line items
+           that are older than the checkpoint lag are then included
+           in the last update, which is saved as the balance
+           checkpoint for this account if it has changed
+        """
+        # line items after 'now' have not been listed, so can never
+        # be settled, whatever the checkpoint lag
+        settle_timestamp = min(now.timestamp() - _checkpoint_lag,
+                               now.timestamp())
+        num_settled = 0
+
+        for key in keys:
+            if _get_timestamp_from_key(key) > settle_timestamp:
+                break
+
+            num_settled += 1
+
+        if num_settled > 0:
+            total = _sum_transactions(keys[0:num_settled])
 
-        result = (balance+total[0], liability+total[1], receivable+total[2],
-                  spent_today+total[3])
+            result = (result[0]+total[0], result[1]+total[1],
+                      result[2]+total[2], result[3]+total[3])
+
+            self._last_update_key = keys[num_settled-1]
 
+        # all line items up to the settle time are now included, so the
+        # next update only needs to list the line items after this time
+        self._last_update_timestamp = max(self._last_update_timestamp,
+                                          settle_timestamp)
         self._last_update_ordinal = now.toordinal()
-        self._last_update_timestamp = now.timestamp()
         self._last_update = result
 
+        if num_settled > 0:
+            self._save_checkpoint(bucket)
+
+        if num_settled < len(keys):
+            # add on the recent transactions that are not yet settled
+            total = _sum_transactions(keys[num_settled:])
+
+            result = (result[0]+total[0], result[1]+total[1],
+                      result[2]+total[2], result[3]+total[3])
+
         return result
 
-    def _get_current_balance(self, bucket=None):
+    def _get_checkpoint_key(self):
+        """Return the key of the object that holds the balance checkpoint
+           of this account"""
+        return "%s/checkpoint" % self._key()
+
+    def _save_checkpoint(self, bucket):
+        """Internal function that saves the last update of the balance
+           as the balance checkpoint of this account"""
+        (balance, liability, receivable, spent_today) = self._last_update
+
+        data = {"balance": str(balance),
+                "liability": str(liability),
+                "receivable": str(receivable),
+                "spent_today": str(spent_today),
+                "timestamp": self._last_update_timestamp,
+                "key": self._last_update_key}
+
+        _ObjectStore.set_object_from_json(bucket, self._get_checkpoint_key(),
+                                          data)
+
+    def _load_checkpoint(self, bucket, now):
+        """Internal function that loads the balance checkpoint of this
+           account as the last update, if the checkpoint was saved
+           today. This returns whether or not the checkpoint was loaded
+        """
+        data = _ObjectStore.get_object_from_json(bucket,
+                                                 self._get_checkpoint_key())
+
+        if data is None:
+            return False
+
+        try:
+            timestamp = float(data["timestamp"])
+
+            if _datetime.datetime.fromtimestamp(timestamp).toordinal() != \
+                    now.toordinal():
+                # the checkpoint is from a previous day
+                return False
+
+            result = (_FixedPoint(data["balance"]),
+                      _FixedPoint(data["liability"]),
+                      _FixedPoint(data["receivable"]),
+                      _FixedPoint(data["spent_today"]))
+            key = data["key"]
+        except:
+            return False
+
+        self._last_update_ordinal = now.toordinal()
+        self._last_update_timestamp = timestamp
+        self._last_update_key = key
+        self._last_update = result
+
+        return True
+
+    def _clear_checkpoint(self, bucket):
+        """Internal function that removes the balance checkpoint of this
+           account (and the last update), e.g. because a line item that
+           may have been included has been deleted"""
+        self._last_update_ordinal = None
+
+        try:
+            _ObjectStore.delete_object(bucket, self._get_checkpoint_key())
+        except:
+            pass
+
+    def _get_current_balance(self, bucket=None, now=None):
         """Get the balance of the account now (the current balance). This
-           returns a tuple of
+           returns a tuple of FixedPoint values
            (balance, liability, receivable, spent_today).
 
            where 'balance' is the current real balance of the account,
@@ -467,12 +738,14 @@ class Account:
            where 'liability' is the current total liabilities,
            where 'receivable' is the current total accounts receivable, and
            where 'spent_today' is how much has been spent today (from midnight
-           until now)
+           until now). If 'now' is passed then this is used as the
+           current time
         """
         if bucket is None:
             bucket = _login_to_service_account()
 
-        now = _datetime.datetime.now()
+        if now is None:
+            now = _datetime.datetime.now()
         now_ordinal = now.toordinal()
 
         try:
@@ -481,14 +754,16 @@ class Account:
             last_update_ordinal = None
 
         if last_update_ordinal != now_ordinal:
-            # we are on a new day since the last update, so recalculate
-            # the balance from scratch
-            return self._recalculate_current_balance(bucket, now)
-        else:
-            # we have calculated the total before today. Get the transactions
-            # since the last update and use these to update the daily spend
-            # etc.
-            return self._update_current_balance(bucket, now)
+            # we are on a new day since the last update (or this account
+            # was just loaded), so continue from the balance checkpoint
+            # saved today, or else recalculate the balance from scratch
+            if not self._load_checkpoint(bucket, now):
+                return self._recalculate_current_balance(bucket, now)
+
+        # we have calculated the total before today. Get the transactions
+        # since the last update and use these to update the daily spend
+        # etc.
+        return self._update_current_balance(bucket, now)
 
     def is_null(self):
         """Return whether or not this is a null account"""
@@ -530,6 +805,46 @@ class Account:
         data = _ObjectStore.get_object_from_json(bucket, self._key())
         self.__dict__ = _copy(Account.from_data(data).__dict__)
 
+        if not self.is_null() and self._partitioned_from is None:
+            # this account was created before the line items were
+            # partitioned. Line items written from tomorrow will all be
+            # partitioned, so only days before then need the slower
+            # listing of the unpartitioned line items
+            self._partitioned_from = self._save_partitioned_from(
+                            bucket, _datetime.datetime.now().toordinal() + 1)
+
+    def _save_partitioned_from(self, bucket, partitioned_from):
+        """Internal function that records in the object store that the
+           line items of this (pre-partitioning) account are partitioned
+           from the day with ordinal 'partitioned_from'. This only
+           changes the account if no-one else has changed it since it
+           was read, so cannot overwrite a concurrent update. This
+           returns the day that is recorded, which may have been set
+           by someone else. Failing to record the day is not an error,
+           as it is safe to use 'partitioned_from' in this process
+        """
+        key = self._key()
+
+        # this is a compare-and-swap loop - the account is only written
+        # back if no-one else has changed it since it was read
+        try:
+            while True:
+                (data, etag) = _ObjectStore.get_object_with_etag(bucket,
+                                                                 key)
+                data = _decode_json_object(data)
+
+                if data.get("partitioned_from", None) is not None:
+                    return data["partitioned_from"]
+
+                data["partitioned_from"] = partitioned_from
+                data = _encode_json_object(key, data)
+
+                if _ObjectStore.set_object_if_match(bucket, key, data,
+                                                    etag) is not None:
+                    return partitioned_from
+        except:
+            return partitioned_from
+
     def _save_account(self, bucket=None):
         """Save this account back to the object store"""
         if bucket is None:
@@ -546,6 +861,7 @@ class Account:
             data["description"] = self._description
             data["overdraft_limit"] = str(self._overdraft_limit)
             data["maximum_daily_limit"] = str(self._maximum_daily_limit)
+            data["partitioned_from"] = self._partitioned_from
 
         return data
 
@@ -564,6 +880,10 @@ class Account:
             account._maximum_daily_limit = _create_decimal(
                                                 data["maximum_daily_limit"])
 
+            # accounts created before line items were partitioned
+            # may have line items written directly under each day
+            account._partitioned_from = data.get("partitioned_from", None)
+
         return account
 
     def assert_valid_authorisation(self, authorisation):
@@ -626,6 +946,8 @@ class Account:
                 except:
                     pass
 
+            self._clear_checkpoint(bucket)
+
     def _credit_refund(self, debit_note, refund, bucket=None):
         """Credit the value of the passed 'refund' to this account. The
            refund must be for a previous completed debit, hence the
@@ -661,8 +983,7 @@ class Account:
 
         # and to create a key to find this credit later. The key is made
         # up from the date and timestamp of the credit and a random string
-        day_key = "%4d-%02d-%02d/%s" % (now.year, now.month, now.day,
-                                        timestamp)
+        day_key = "%s/%s" % (_get_partition(now), timestamp)
         uid = "%s/%s" % (day_key, str(_uuid.uuid4())[0:8])
 
         item_key = "%s/%s/%s" % (self._key(), uid, encoded_value)
@@ -700,8 +1021,7 @@ class Account:
 
         # and to create a key to find this debit later. The key is made
         # up from the date and timestamp of the debit and a random string
-        day_key = "%4d-%02d-%02d/%s" % (now.year, now.month, now.day,
-                                        timestamp)
+        day_key = "%s/%s" % (_get_partition(now), timestamp)
         uid = "%s/%s" % (day_key, str(_uuid.uuid4())[0:8])
 
         item_key = "%s/%s/%s" % (self._key(), uid, encoded_value)
@@ -746,8 +1066,7 @@ class Account:
 
         # and to create a key to find this credit later. The key is made
         # up from the date and timestamp of the credit and a random string
-        day_key = "%4d-%02d-%02d/%s" % (now.year, now.month, now.day,
-                                        timestamp)
+        day_key = "%s/%s" % (_get_partition(now), timestamp)
         uid = "%s/%s" % (day_key, str(_uuid.uuid4())[0:8])
 
         item_key = "%s/%s/%s" % (self._key(), uid, encoded_value)
@@ -784,8 +1103,7 @@ class Account:
 
         # and to create a key to find this debit later. The key is made
         # up from the date and timestamp of the debit and a random string
-        day_key = "%4d-%02d-%02d/%s" % (now.year, now.month, now.day,
-                                        timestamp)
+        day_key = "%s/%s" % (_get_partition(now), timestamp)
         uid = "%s/%s" % (day_key, str(_uuid.uuid4())[0:8])
 
         item_key = "%s/%s/%s" % (self._key(), uid, encoded_value)
@@ -829,8 +1147,7 @@ class Account:
 
         # and to create a key to find this credit later. The key is made
         # up from the date and timestamp of the credit and a random string
-        day_key = "%4d-%02d-%02d/%s" % (now.year, now.month, now.day,
-                                        timestamp)
+        day_key = "%s/%s" % (_get_partition(now), timestamp)
         uid = "%s/%s" % (day_key, str(_uuid.uuid4())[0:8])
 
         item_key = "%s/%s/%s" % (self._key(), uid, encoded_value)
@@ -874,7 +1191,11 @@ class Account:
         if bucket is None:
             bucket = _login_to_service_account()
 
-        if self.available_balance(bucket) < transaction.value():
+        # evaluate the balance once, before the debit
+        balance_time = _datetime.datetime.now()
+        result = self._get_current_balance(bucket, balance_time)
+
+        if self._get_available_balance(result) < transaction.value():
             raise InsufficientFundsError(
                 "You cannot debit '%s' from account %s as there "
                 "are insufficient funds in this account." %
@@ -889,8 +1210,7 @@ class Account:
 
         # and to create a key to find this debit later. The key is made
         # up from the date and timestamp of the debit and a random string
-        day_key = "%4d-%02d-%02d/%s" % (now.year, now.month, now.day,
-                                        timestamp)
+        day_key = "%s/%s" % (_get_partition(now), timestamp)
         uid = "%s/%s" % (day_key, str(_uuid.uuid4())[0:8])
 
         # the key in the object store is a combination of the key for this
@@ -914,12 +1234,32 @@ class Account:
         _ObjectStore.set_object_from_json(bucket, item_key,
                                           line_item.to_data())
 
-        if self.is_beyond_overdraft_limit(bucket):
+        # rather than evaluating the balance again, advance the balance
+        # from before the debit by the line items that have been written
+        # since, which are this debit plus any concurrent transactions
+        balance_timestamp = balance_time.timestamp()
+
+        transaction_keys = self._get_transaction_keys_between(
+                                balance_time, _datetime.datetime.now(),
+                                bucket)
+
+        transaction_keys = [key for key in transaction_keys
+                            if key != item_key and
+                            _get_timestamp_from_key(key) > balance_timestamp]
+        transaction_keys.append(item_key)
+
+        total = _sum_transactions(transaction_keys)
+
+        result = (result[0]+total[0], result[1]+total[1],
+                  result[2]+total[2], result[3]+total[3])
+
+        if self._is_beyond_overdraft_limit(result):
             # This transaction has helped push the account beyond the
             # overdraft limit. Delete the transaction and raise
             # an InsufficientFundsError
 
             _ObjectStore.delete_object(bucket, item_key)
+            self._clear_checkpoint(bucket)
             raise InsufficientFundsError(
                 "You cannot debit '%s' from account %s as there "
                 "are insufficient funds in this account." %
@@ -932,38 +1272,45 @@ class Account:
            of value that can be spent (e.g. includes overdraft and fixed daily
            spend limits, and except any outstanding liabilities)
         """
-        result = self._get_current_balance(bucket)
+        return self._get_available_balance(
+                        self._get_current_balance(bucket)).to_decimal()
 
+    def _get_available_balance(self, result):
+        """Internal function that returns the available balance from the
+           current balance 'result', as returned by _get_current_balance
+        """
         balance = result[0]
         liabilities = result[1]
-        spent_today = result[2]
+        spent_today = result[3]
 
         available = balance - liabilities + self.get_overdraft_limit()
 
         if self._maximum_daily_limit:
-            return min(available, self._maximum_daily_limit - spent_today)
-        else:
-            return available
+            available = min(available,
+                            _FixedPoint(self._maximum_daily_limit) -
+                            spent_today)
+
+        return available
 
     def balance(self, bucket=None):
         """Return the current balance of this account"""
         result = self._get_current_balance(bucket)
-        return result[0]
+        return result[0].to_decimal()
 
     def liability(self, bucket=None):
         """Return the current total liability of this account"""
         result = self._get_current_balance(bucket)
-        return result[1]
+        return result[1].to_decimal()
 
     def receivable(self, bucket=None):
         """Return the current total accounts receivable of this account"""
         result = self._get_current_balance(bucket)
-        return result[2]
+        return result[2].to_decimal()
 
     def spent_today(self, bucket=None):
         """Return the current amount spent today on this account"""
         result = self._get_current_balance(bucket)
-        return result[3]
+        return result[3].to_decimal()
 
     def balance_status(self, bucket=None):
         """Return the overall balance status as a dictionary
@@ -972,10 +1319,10 @@ class Account:
         """
         result = self._get_current_balance(bucket)
         d = {}
-        d["balance"] = result[0]
-        d["liability"] = result[1]
-        d["receivable"] = result[2]
-        d["spent_today"] = result[3]
+        d["balance"] = result[0].to_decimal()
+        d["liability"] = result[1].to_decimal()
+        d["receivable"] = result[2].to_decimal()
+        d["spent_today"] = result[3].to_decimal()
         return d
 
     def get_overdraft_limit(self):
@@ -1014,6 +1361,12 @@ class Account:
         """Return whether or not the current balance is beyond
            the overdraft limit
         """
-        result = self._get_current_balance(bucket)
+        return self._is_beyond_overdraft_limit(
+                        self._get_current_balance(bucket))
 
+    def _is_beyond_overdraft_limit(self, result):
+        """Internal function that returns whether or not the current
+           balance 'result', as returned by _get_current_balance, is
+           beyond the overdraft limit
+        """
         return (result[0] - result[1]) < -(self.get_overdraft_limit())
@@ -1,8 +1,10 @@
 
+import datetime as _datetime
+import time as _time
+
 from ._account import Account as _Account
 
 from Acquire.ObjectStore import ObjectStore as _ObjectStore
-from Acquire.ObjectStore import Mutex as _Mutex
 from Acquire.ObjectStore import string_to_encoded as _string_to_encoded
 from Acquire.ObjectStore import encoded_to_string as _encoded_to_string
 
@@ -52,11 +54,9 @@ class Accounts:
         if bucket is None:
             bucket = _login_to_service_account()
 
-        keys = _ObjectStore.get_all_object_names(bucket, self._root())
-
         accounts = []
 
-        for key in keys:
+        for key in _ObjectStore.iter_object_names(bucket, self._root()):
             accounts.append(_encoded_to_string(key))
 
         return accounts
@@ -101,6 +101,33 @@ class Accounts:
 
         return account.uid() == account_uid
 
+    def _wait_for_account_uid(self, account_key, bucket, timeout=600):
+        """Internal function that waits until the account at 'account_key'
+           has been created by another function, returning its UID. This
+           returns None if the other function failed to create the account,
+           and raises an AccountError if this takes longer than 'timeout'
+           seconds
+        """
+        endtime = _datetime.datetime.now() + \
+            _datetime.timedelta(seconds=timeout)
+
+        while True:
+            try:
+                account_uid = _ObjectStore.get_string_object(bucket,
+                                                             account_key)
+            except:
+                return None
+
+            if account_uid != "under_construction":
+                return account_uid
+
+            if _datetime.datetime.now() > endtime:
+                raise AccountError(
+                    "Timed out waiting for the account at '%s' to be "
+                    "created" % account_key)
+
+            _time.sleep(0.25)
+
     def create_account(self, name, description=None,
                        overdraft_limit=None, bucket=None):
         """Create a new account called 'name' in this group. This will
@@ -128,17 +155,20 @@ class Accounts:
 
             return account
 
-        # make sure that no-one has created this account before
-        m = _Mutex(account_key, timeout=600, lease_time=600, bucket=bucket)
-
-        try:
-            account_uid = _ObjectStore.get_string_object(bucket, account_key)
-        except:
-            account_uid = None
+        # write a temporary UID to the object store so that we
+        # can ensure we are the only function to create it. This is
+        # a conditional write, so only one function can succeed
+        if _ObjectStore.set_object_if_absent(
+                bucket, account_key, "under_construction".encode("utf-8")) \
+                is None:
+            # someone else has created, or is creating, this account
+            account_uid = self._wait_for_account_uid(account_key, bucket)
+
+            if account_uid is None:
+                # the other function failed to create the account
+                return self.create_account(name, description,
+                                           overdraft_limit, bucket)
 
-        if account_uid is not None:
-            m.unlock()
-            # this account already exists - just return it
             account = _Account(uid=account_uid, bucket=bucket)
 
             if overdraft_limit is not None:
@@ -146,17 +176,6 @@ class Accounts:
 
             return account
 
-        # write a temporary UID to the object store so that we
-        # can ensure we are the only function to create it
-        try:
-            _ObjectStore.set_string_object(bucket, account_key,
-                                           "under_construction")
-        except:
-            m.unlock()
-            raise
-
-        m.unlock()
-
         # ok - we are the only function creating this account. Let's try
         # to create it properly
         try:
@@ -1,10 +1,18 @@
 
 from decimal import Decimal as _Decimal
 from decimal import Context as _Context
+from decimal import ROUND_HALF_EVEN as _ROUND_HALF_EVEN
+
+from fractions import Fraction as _Fraction
 
 from ._errors import AccountError
 
-__all__ = ["create_decimal", "get_decimal_context"]
+__all__ = ["create_decimal", "get_decimal_context", "FixedPoint"]
+
+# the number of micro-units in one unit of value
+_scale = 1000000
+
+_context = _Context(prec=24)
 
 
 def get_decimal_context():
@@ -14,7 +22,7 @@ def get_decimal_context():
        (i.e. everything up to just under one quadrillion - I doubt we will
         ever have an account that has more than a trillion units in it!)
     """
-    return _Context(prec=24)
+    return _context
 
 
 def create_decimal(value):
@@ -22,11 +30,14 @@ def create_decimal(value):
        has 6 decimal places and is clamped between
        -1 quadrillion < value < 1 quadrillion
     """
-    try:
-        d = _Decimal("%.6f" % value, get_decimal_context())
-    except:
-        value = _Decimal(value, get_decimal_context())
-        d = _Decimal("%.6f" % value, get_decimal_context())
+    if isinstance(value, FixedPoint):
+        d = _Decimal(str(value), _context)
+    else:
+        try:
+            d = _Decimal("%.6f" % value, _context)
+        except:
+            value = _Decimal(value, _context)
+            d = _Decimal("%.6f" % value, _context)
 
     if d <= -1000000000000:
         raise AccountError(
@@ -39,3 +50,177 @@ def create_decimal(value):
                 "1 quadrillion! (%s)" % (value))
 
     return d
+
+
+def _parse_string(value, rounded=False):
+    """Return the number of micro-units in the passed string, which is
+       a decimal number, e.g. '-000100.005000'"""
+    s = value.strip()
+    negative = s.startswith("-")
+
+    if negative or s.startswith("+"):
+        s = s[1:]
+
+    (whole, _, fraction) = s.partition(".")
+
+    if len(fraction) > 6 or not (whole + fraction).isdigit():
+        if rounded:
+            raise ValueError("Cannot convert '%s' to a FixedPoint" % value)
+
+        # round to 6 decimal places in the same way as 'create_decimal'
+        return _parse_string("%.6f" % _Decimal(value, _context), True)
+
+    micro = int(whole or "0") * _scale + int(fraction.ljust(6, "0"))
+
+    if negative:
+        return -micro
+    else:
+        return micro
+
+
+def _to_micro(value):
+    """Return the number of micro-units in the passed value"""
+    if isinstance(value, FixedPoint):
+        return value._micro
+    elif isinstance(value, bool):
+        raise TypeError("Cannot convert a bool to a FixedPoint")
+    elif isinstance(value, int):
+        return value * _scale
+    elif isinstance(value, str):
+        return _parse_string(value)
+    elif isinstance(value, _Decimal):
+        return int(value.scaleb(6, _context).quantize(
+                                _Decimal(1), rounding=_ROUND_HALF_EVEN))
+    elif isinstance(value, float):
+        return _parse_string("%.6f" % value, True)
+    else:
+        raise TypeError("Cannot convert '%s' to a FixedPoint" % str(value))
+
+
+class FixedPoint:
+    """This is a compact fixed-point value with 6 decimal places, held as
+       an integer number of micro-units. This is used in place of
+       Decimal for the internal arithmetic of the accounting code
+       (e.g. summing the line items of an account), as integer
+       arithmetic is much faster than creating new Decimals.
+       FixedPoint values can be added to, subtracted from and
+       compared with Decimals, ints and other FixedPoints, and
+       have the same string representation as the Decimals
+       returned by 'create_decimal', to which they can be
+       converted using 'to_decimal'
+    """
+    __slots__ = ("_micro",)
+
+    def __init__(self, value=0):
+        self._micro = _to_micro(value)
+
+    @staticmethod
+    def from_micro(micro):
+        """Return a FixedPoint of the passed integer number of
+           micro-units"""
+        f = FixedPoint.__new__(FixedPoint)
+        f._micro = micro
+        return f
+
+    def micro(self):
+        """Return the integer number of micro-units of this value"""
+        return self._micro
+
+    def to_decimal(self):
+        """Return this value as a Decimal, as created by 'create_decimal'"""
+        return create_decimal(self)
+
+    def __str__(self):
+        (whole, fraction) = divmod(abs(self._micro), _scale)
+
+        if self._micro < 0:
+            return "-%d.%06d" % (whole, fraction)
+        else:
+            return "%d.%06d" % (whole, fraction)
+
+    def __repr__(self):
+        return "FixedPoint(%s)" % str(self)
+
+    def __hash__(self):
+        # this matches the hash of equal Decimals and ints
+        return hash(_Fraction(self._micro, _scale))
+
+    def __float__(self):
+        return self._micro / _scale
+
+    def __int__(self):
+        if self._micro < 0:
+            return -(-self._micro // _scale)
+        else:
+            return self._micro // _scale
+
+    def __bool__(self):
+        return self._micro != 0
+
+    def __neg__(self):
+        return FixedPoint.from_micro(-self._micro)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return FixedPoint.from_micro(abs(self._micro))
+
+    def __add__(self, other):
+        try:
+            return FixedPoint.from_micro(self._micro + _to_micro(other))
+        except TypeError:
+            return NotImplemented
+
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        try:
+            return FixedPoint.from_micro(self._micro - _to_micro(other))
+        except TypeError:
+            return NotImplemented
+
+    def __rsub__(self, other):
+        try:
+            return FixedPoint.from_micro(_to_micro(other) - self._micro)
+        except TypeError:
+            return NotImplemented
+
+    def __eq__(self, other):
+        try:
+            return self._micro == _to_micro(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+
+        if result is NotImplemented:
+            return result
+
+        return not result
+
+    def __lt__(self, other):
+        try:
+            return self._micro < _to_micro(other)
+        except TypeError:
+            return NotImplemented
+
+    def __le__(self, other):
+        try:
+            return self._micro <= _to_micro(other)
+        except TypeError:
+            return NotImplemented
+
+    def __gt__(self, other):
+        try:
+            return self._micro > _to_micro(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ge__(self, other):
+        try:
+            return self._micro >= _to_micro(other)
+        except TypeError:
+            return NotImplemented
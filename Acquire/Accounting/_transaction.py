@@ -1,7 +1,8 @@
 
 from decimal import Decimal as _Decimal
-from decimal import Context as _Context
 
+from ._decimal import get_decimal_context as _get_decimal_context
+from ._decimal import FixedPoint as _FixedPoint
 from ._errors import TransactionError
 
 __all__ = ["Transaction"]
@@ -14,18 +15,21 @@ def _getcontext():
        (i.e. everything up to just under one quadrillion - I doubt we will
         ever have an account that has more than a trillion units in it!)
     """
-    return _Context(prec=24)
+    return _get_decimal_context()
 
 
 def _create_decimal(value):
     """Create a decimal from the passed value. This is a decimal that
        has 6 decimal places and is clamped between 0 <= value < 1 quadrillion
     """
-    try:
-        d = _Decimal("%.6f" % value, _getcontext())
-    except:
-        value = _Decimal(value, _getcontext())
-        d = _Decimal("%.6f" % value, _getcontext())
+    if isinstance(value, _FixedPoint):
+        d = _Decimal(str(value), _getcontext())
+    else:
+        try:
+            d = _Decimal("%.6f" % value, _getcontext())
+        except:
+            value = _Decimal(value, _getcontext())
+            d = _Decimal("%.6f" % value, _getcontext())
 
     if d < 0:
         raise TransactionError(
@@ -155,22 +159,19 @@ class Transaction:
             t = Transaction(value, description)
             return [t]
         else:
-            orig_value = value
-            values = []
-
-            while value > Transaction.maximum_transaction_value():
-                values.append(Transaction.maximum_transaction_value())
-                value -= Transaction.maximum_transaction_value()
+            # split using integer micro-units so that the values of
+            # the transactions sum exactly to the original value
+            maximum = _FixedPoint(Transaction.maximum_transaction_value())
+            remainder = _FixedPoint(value).micro()
 
-            if value > 0:
-                values.append(value)
+            values = []
 
-            total = 0
-            for value in values:
-                total += value
+            while remainder > maximum.micro():
+                values.append(maximum)
+                remainder -= maximum.micro()
 
-            if total != orig_value:
-                values[-1] -= (total - orig_value)
+            if remainder > 0:
+                values.append(_FixedPoint.from_micro(remainder))
 
             transactions = []
 
@@ -178,19 +179,14 @@ class Transaction:
                 transactions.append(Transaction(values[i], "%s: %d of %d" %
                                     (description, i+1, len(values))))
 
-            values = None
-
-            total = 0
+            total = _FixedPoint(0)
             for transaction in transactions:
                 total += transaction.value()
 
-            # ensure that the total is also rounded to 6 dp
-            total = _create_decimal(total)
-
-            if total != orig_value:
+            if total != value:
                 raise TransactionError(
                     "Error as split sum (%s) is not equal to the original "
-                    "value (%s)" % (total, orig_value))
+                    "value (%s)" % (total, value))
 
             return transactions
 
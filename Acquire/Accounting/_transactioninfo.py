@@ -1,10 +1,20 @@
 
+import re as _re
+
 from enum import Enum as _Enum
 
-from ._decimal import create_decimal as _create_decimal
+from ._decimal import FixedPoint as _FixedPoint
 
 __all__ = ["TransactionInfo", "TransactionCode"]
 
+# regular expression that matches the encoded transaction code and
+# value(s) at the end of each key in a string of keys that are each
+# terminated by a newline. The digits before and after the decimal
+# point are captured separately so that they can be joined into the
+# value in micro-units
+_encoded_value_regex = _re.compile(
+    r"/([A-Z]{2})(\d+)\.(\d{6})(?:T(\d+)\.(\d{6}))?\n")
+
 
 class TransactionCode(_Enum):
     CREDIT = "CR"
@@ -57,8 +67,8 @@ class TransactionInfo:
 
                     values = part[2:].split("T")
                     try:
-                        value = _create_decimal(values[0])
-                        receipted_value = _create_decimal(values[1])
+                        value = _FixedPoint(values[0])
+                        receipted_value = _FixedPoint(values[1])
                         self._code = code
                         self._value = value
                         self._receipted_value = receipted_value
@@ -66,7 +76,7 @@ class TransactionInfo:
                     except:
                         pass
 
-                value = _create_decimal(part[2:])
+                value = _FixedPoint(part[2:])
 
                 self._code = code
                 self._value = value
@@ -109,14 +119,95 @@ class TransactionInfo:
         else:
             return "%2s%013.6fT%013.6f" % (code.value, value, receipted_value)
 
+    @staticmethod
+    def sum_values(keys):
+        """Return the total values of the transactions encoded in all of
+           the passed object store keys, as a dictionary of the tuple
+           (total value, total receipted value) for each TransactionCode,
+           in integer micro-units. The keys are parsed together using
+           a single regular expression search, rather than by
+           constructing a TransactionInfo for every key
+        """
+        keys = list(keys)
+
+        if len(keys) == 0:
+            return {}
+
+        matches = _encoded_value_regex.findall("%s\n" % "\n".join(keys))
+
+        if len(matches) != len(keys):
+            # at least one key is not in the standard format, so
+            # fall back to parsing the keys one at a time
+            return TransactionInfo._sum_values_slowly(keys)
+
+        totals = {}
+        receipted_codes = set()
+
+        for (code, whole, fraction, r_whole, r_fraction) in matches:
+            value = int(whole + fraction)
+
+            try:
+                total = totals[code]
+            except KeyError:
+                total = [0, 0]
+                totals[code] = total
+
+            total[0] += value
+
+            if r_whole:
+                total[1] += int(r_whole + r_fraction)
+                receipted_codes.add(code)
+            else:
+                total[1] += value
+
+        receipt_codes = (TransactionCode.SENT_RECEIPT.value,
+                         TransactionCode.RECEIVED_RECEIPT.value)
+
+        if not receipted_codes.issubset(receipt_codes):
+            # only receipts can have a separate receipted value
+            return TransactionInfo._sum_values_slowly(keys)
+
+        values = {}
+
+        for (code, total) in totals.items():
+            try:
+                code = TransactionCode(code)
+            except ValueError:
+                return TransactionInfo._sum_values_slowly(keys)
+
+            values[code] = tuple(total)
+
+        return values
+
+    @staticmethod
+    def _sum_values_slowly(keys):
+        """Internal function used by 'sum_values' that sums the values
+           by constructing a TransactionInfo for each key"""
+        values = {}
+
+        for key in keys:
+            v = TransactionInfo(key)
+
+            try:
+                total = values[v._code]
+            except KeyError:
+                total = [0, 0]
+                values[v._code] = total
+
+            total[0] += v.value().micro()
+            total[1] += v.receipted_value().micro()
+
+        return dict((code, tuple(total)) for (code, total) in values.items())
+
     def value(self):
-        """Return the value of the transaction"""
+        """Return the value of the transaction (as a FixedPoint)"""
         return self._value
 
     def receipted_value(self):
         """Return the receipted value of the transaction. This may be
            different to value() when the transaction was provisional,
            and the receipted value is less than the provisional value
+           (as a FixedPoint)
         """
         return self._receipted_value
 
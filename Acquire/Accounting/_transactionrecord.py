@@ -8,7 +8,8 @@ from Acquire.Service import login_to_service_account \
                     as _login_to_service_account
 
 from Acquire.ObjectStore import ObjectStore as _ObjectStore
-from Acquire.ObjectStore import Mutex as _Mutex
+from Acquire.ObjectStore import encode_json_object as _encode_json_object
+from Acquire.ObjectStore import decode_json_object as _decode_json_object
 
 from ._account import Account as _Account
 from ._transaction import Transaction as _Transaction
@@ -305,14 +306,20 @@ class TransactionRecord:
 
         from ._ledger import Ledger as _Ledger
 
-        try:
-            mutex = _Mutex(uid, timeout=600, lease_time=600)
-        except Exception as e:
-            raise LedgerError("Cannot secure a Ledger mutex for transaction "
-                              "'%s'. Error = %s" % (uid, str(e)))
+        key = _Ledger.get_key(uid)
 
-        try:
-            transaction = _Ledger.load_transaction(uid, bucket)
+        # this is a compare-and-swap loop - the transaction is only
+        # written back if no-one else has changed it since it was read
+        while True:
+            try:
+                (data, etag) = _ObjectStore.get_object_with_etag(bucket, key)
+            except:
+                raise LedgerError("There is no transaction recorded in the "
+                                  "ledger with UID=%s (at key %s)" %
+                                  (uid, key))
+
+            transaction = TransactionRecord.from_data(
+                                        _decode_json_object(data))
 
             if transaction.transaction_state() != expected_state:
                 raise TransactionError(
@@ -321,32 +328,16 @@ class TransactionRecord:
                     (str(transaction), expected_state.value, new_state.value))
 
             transaction._transaction_state = new_state
-        except:
-            mutex.unlock()
-            raise
-
-        # now need to write anything back if the state isn't changed
-        if expected_state == new_state:
-            return transaction
-
-        # make sure we have enough time remaining on the lease to be
-        # able to write this result back to the object store...
-        if mutex.seconds_remaining_on_lease() < 100:
-            try:
-                mutex.fully_unlock()
-            except:
-                pass
 
-            return TransactionRecord.load_test_and_set(uid, expected_state,
-                                                       new_state, bucket)
+            # now need to write anything back if the state isn't changed
+            if expected_state == new_state:
+                return transaction
 
-        try:
-            _Ledger.save_transaction(transaction, bucket)
-        except:
-            mutex.unlock()
-            raise
+            data = _encode_json_object(key, transaction.to_data())
 
-        return transaction
+            if _ObjectStore.set_object_if_match(bucket, key, data,
+                                                etag) is not None:
+                return transaction
 
     @staticmethod
     def from_data(data):
@@ -13,6 +13,8 @@ import tarfile as _tarfile
 import tempfile as _tempfile
 
 from ._objstore import ObjectStore as objstore
+from Acquire.ObjectStore import ObjectStoreLog as _ObjectStoreLog
+from Acquire.ObjectStore import encode_chunk_manifest as _encode_chunk_manifest
 
 try:
     from watchdog.observers import Observer as _Observer
@@ -40,9 +42,10 @@ class _FileWatcher:
        uploading chunks of the file to an object store
        when the watcher is updated"""
     def __init__(self, filename, bucket, rootkey,
-                 sizetrigger, timetrigger):
+                 sizetrigger, timetrigger, log=None):
         self._filename = filename
         self._bucket = bucket
+        self._log = log
         self._rootkey = rootkey
         self._handle = None
         self._key = None
@@ -65,7 +68,7 @@ class _FileWatcher:
         self._next_chunk += 1
         self._last_upload_time = _datetime.datetime.now()
 
-        objstore.log(self._bucket, "Upload %s chunk (%f KB) to %s/%s" % \
+        self.log("Upload %s chunk (%f KB) to %s/%s" % \
                        (self._filename, float(len(self._buffer))/1024.0,
                         self._key, self._next_chunk))
 
@@ -73,8 +76,21 @@ class _FileWatcher:
                             "%s/%d" % (self._key,self._next_chunk),
                             self._buffer)
 
+        # record the number of chunks in the manifest at the key so that
+        # readers can download all of the chunks in parallel
+        objstore.set_object(self._bucket, self._key,
+                            _encode_chunk_manifest(self._next_chunk))
+
         self._buffer = None
 
+    def log(self, message):
+        """Log the passed message, using the log function passed
+           to the constructor if there was one"""
+        if self._log:
+            self._log(message)
+        else:
+            objstore.log(self._bucket, message)
+
     def finishUploads(self):
         """Finalise the uploads"""
         self._uploadBuffer()
@@ -119,7 +135,7 @@ class _FileWatcher:
                 bufsize = 0
 
             if bufsize > 0:
-                objstore.log(self._bucket, "Uploading last of %s (%d bytes)" % \
+                self.log("Uploading last of %s (%d bytes)" % \
                                     (self._filename, 0))
 
                 self._uploadBuffer()
@@ -137,9 +153,10 @@ if _have_watchdog:
            a background thread by watchdog"""
 
         def __init__(self, bucket, rootkey=None,
-                     sizetrigger=8*1024*1024, timetrigger=5):
+                     sizetrigger=8*1024*1024, timetrigger=5, log=None):
             _FileSystemEventHandler.__init__(self)
             self._bucket = bucket
+            self._log = log
             self._rootkey = rootkey
             self._sizetrigger = int(sizetrigger)
             self._timetrigger = int(timetrigger)
@@ -180,14 +197,18 @@ if _have_watchdog:
                 self._files[filename] = _FileWatcher(filename, bucket=self._bucket, 
                                                      rootkey=self._rootkey,
                                                      sizetrigger=self.chunkSizeTrigger(),
-                                                     timetrigger=self.chunkTimeTrigger())
+                                                     timetrigger=self.chunkTimeTrigger(),
+                                                     log=self._log)
 
             self._files[filename].update()
 
         def finaliseUploads(self):
             """Ensure that the last parts of any files are uploaded
                before this observer exits"""
-            objstore.log(self._bucket, "Finalising upload...")
+            if self._log:
+                self._log("Finalising upload...")
+            else:
+                objstore.log(self._bucket, "Finalising upload...")
 
             for filename in self._files:
                 self._files[filename].update(True)
@@ -213,8 +234,21 @@ class GromacsRunner:
         # Clear the log for this simulation
         objstore.clear_log(bucket)
 
-        # create a log function for logging messages to this bucket
-        log = lambda message: objstore.log(bucket,message)
+        # create a log function for logging messages to this bucket.
+        # Messages are buffered and written in segments, rather than
+        # writing one object per message
+        logger = _ObjectStoreLog(bucket)
+        log = logger.log
+
+        try:
+            return GromacsRunner._run(bucket, gmx, log)
+        finally:
+            logger.close()
+
+    @staticmethod
+    def _run(bucket, gmx, log):
+        """Internal function that runs the simulation, logging messages
+           using the passed 'log' function"""
 
         # create a set_status function for setting the simulation status
         set_status = lambda status: objstore.set_string_object(bucket, "status", status)
@@ -308,7 +342,8 @@ class GromacsRunner:
             observer = _Observer()
             event_handler = _PosixToObjstoreEventHandler(bucket,
                                                          rootkey="interim",
-                                                         timetrigger=1)
+                                                         timetrigger=1,
+                                                         log=log)
 
             observer.schedule(event_handler, ".", recursive=False)
 
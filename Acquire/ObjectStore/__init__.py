@@ -8,6 +8,15 @@ by most of the other modules.
 """
 
 from ._objstore import *
+from ._caching_objstore import *
+from ._trace import *
+from ._compression import *
+from ._chunked import *
+from ._binaryjson import *
+from ._async_objstore import *
+from ._objstorelog import *
+from ._sharded_objstore import *
+from ._blobstore import *
 from ._encoding import *
 from ._mutex import *
 from ._errors import *
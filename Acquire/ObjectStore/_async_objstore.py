@@ -0,0 +1,186 @@
+
+import asyncio as _asyncio
+import functools as _functools
+import itertools as _itertools
+import threading as _threading
+
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+
+from ._objstore import ObjectStore as _ObjectStore
+
+__all__ = ["AsyncObjectStore"]
+
+# the maximum number of object store calls that are run at the same time
+_max_workers = 16
+
+# the number of names fetched at a time by iter_object_names
+_names_batch_size = 1000
+
+_executor = None
+_executor_lock = _threading.Lock()
+
+
+def _get_executor():
+    """Return the thread pool used to run the object store calls"""
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = _ThreadPoolExecutor(
+                                max_workers=_max_workers,
+                                thread_name_prefix="AsyncObjectStore")
+
+    return _executor
+
+
+async def _run(func, *args):
+    """Run 'func(*args)' in the thread pool, returning the result"""
+    loop = _asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(),
+                                      _functools.partial(func, *args))
+
+
+class AsyncObjectStore:
+    """This is an asyncio version of ObjectStore. Each function is a
+       coroutine that runs the matching ObjectStore function in a
+       thread pool, so that the event loop is not blocked while
+       waiting for the object store, and so that independent calls
+       can be overlapped, e.g.
+
+       (a, b) = await asyncio.gather(
+                    AsyncObjectStore.get_object_from_json(bucket, key_a),
+                    AsyncObjectStore.get_object_from_json(bucket, key_b))
+
+       All calls go via ObjectStore, so use the same backend, and are
+       included in the ObjectStore statistics
+    """
+
+    @staticmethod
+    async def run(func, *args):
+        """Run 'func(*args)' (e.g. a function that makes several
+           ObjectStore calls) in the thread pool"""
+        return await _run(func, *args)
+
+    @staticmethod
+    async def get_object_as_file(bucket, key, filename):
+        return await _run(_ObjectStore.get_object_as_file,
+                          bucket, key, filename)
+
+    @staticmethod
+    async def get_object(bucket, key):
+        return await _run(_ObjectStore.get_object, bucket, key)
+
+    @staticmethod
+    async def open_object(bucket, key):
+        return await _run(_ObjectStore.open_object, bucket, key)
+
+    @staticmethod
+    async def get_string_object(bucket, key):
+        return await _run(_ObjectStore.get_string_object, bucket, key)
+
+    @staticmethod
+    async def get_object_from_json(bucket, key):
+        return await _run(_ObjectStore.get_object_from_json, bucket, key)
+
+    @staticmethod
+    async def get_objects(bucket, keys):
+        return await _run(_ObjectStore.get_objects, bucket, keys)
+
+    @staticmethod
+    async def get_objects_from_json(bucket, keys):
+        return await _run(_ObjectStore.get_objects_from_json, bucket, keys)
+
+    @staticmethod
+    async def get_all_object_names(bucket, prefix=None):
+        return await _run(_ObjectStore.get_all_object_names, bucket, prefix)
+
+    @staticmethod
+    async def iter_object_names(bucket, prefix=None, start_after=None,
+                                limit=None):
+        """Asynchronously iterate over the names of the objects in
+           'bucket' whose keys start with 'prefix', in sorted order. The
+           names are fetched from the object store in batches, e.g.
+
+           async for name in AsyncObjectStore.iter_object_names(bucket):
+               print(name)
+        """
+        names = await _run(_ObjectStore.iter_object_names, bucket, prefix,
+                           start_after, limit)
+
+        while True:
+            batch = await _run(lambda: list(
+                                _itertools.islice(names, _names_batch_size)))
+
+            for name in batch:
+                yield name
+
+            if len(batch) < _names_batch_size:
+                return
+
+    @staticmethod
+    async def get_all_objects(bucket, prefix=None):
+        return await _run(_ObjectStore.get_all_objects, bucket, prefix)
+
+    @staticmethod
+    async def get_all_strings(bucket, prefix=None):
+        return await _run(_ObjectStore.get_all_strings, bucket, prefix)
+
+    @staticmethod
+    async def set_object(bucket, key, data):
+        await _run(_ObjectStore.set_object, bucket, key, data)
+
+    @staticmethod
+    async def get_object_with_etag(bucket, key):
+        return await _run(_ObjectStore.get_object_with_etag, bucket, key)
+
+    @staticmethod
+    async def set_object_if_match(bucket, key, data, etag):
+        return await _run(_ObjectStore.set_object_if_match,
+                          bucket, key, data, etag)
+
+    @staticmethod
+    async def set_object_if_absent(bucket, key, data):
+        return await _run(_ObjectStore.set_object_if_absent,
+                          bucket, key, data)
+
+    @staticmethod
+    async def set_object_from_file(bucket, key, filename, part_size=None):
+        await _run(_ObjectStore.set_object_from_file,
+                   bucket, key, filename, part_size)
+
+    @staticmethod
+    async def set_string_object(bucket, key, string_data):
+        await _run(_ObjectStore.set_string_object, bucket, key, string_data)
+
+    @staticmethod
+    async def set_object_from_json(bucket, key, data):
+        await _run(_ObjectStore.set_object_from_json, bucket, key, data)
+
+    @staticmethod
+    async def log(bucket, message, prefix="log"):
+        await _run(_ObjectStore.log, bucket, message, prefix)
+
+    @staticmethod
+    async def delete_all_objects(bucket, prefix=None):
+        await _run(_ObjectStore.delete_all_objects, bucket, prefix)
+
+    @staticmethod
+    async def get_log(bucket, log="log"):
+        return await _run(_ObjectStore.get_log, bucket, log)
+
+    @staticmethod
+    async def clear_log(bucket, log="log"):
+        await _run(_ObjectStore.clear_log, bucket, log)
+
+    @staticmethod
+    async def delete_object(bucket, key):
+        await _run(_ObjectStore.delete_object, bucket, key)
+
+    @staticmethod
+    async def delete_objects(bucket, keys):
+        return await _run(_ObjectStore.delete_objects, bucket, keys)
+
+    @staticmethod
+    async def clear_all_except(bucket, keys):
+        await _run(_ObjectStore.clear_all_except, bucket, keys)
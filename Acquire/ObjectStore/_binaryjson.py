@@ -0,0 +1,128 @@
+
+import binascii as _binascii
+
+from ._encoding import _Base64String
+from ._errors import ObjectStoreError
+
+__all__ = ["set_binary_json", "clear_binary_json",
+           "to_binary_json", "from_binary_json"]
+
+# the header that starts every binary-encoded object, which is followed
+# by the msgpack encoding of the object. Json cannot start with a zero
+# byte, so plain json objects can still be read
+_header = b"\x00acqb"
+
+# the msgpack extension type used to hold the raw bytes of each string
+# that was created by bytes_to_string (e.g. keys and signatures)
+_base64_type = 1
+
+# the key prefixes whose json objects are written in the binary encoding
+_prefixes = ()
+
+
+def _get_msgpack():
+    """Return the msgpack module, raising an ImportError if it is not
+       installed"""
+    try:
+        import msgpack as _msgpack
+    except:
+        raise ImportError(
+            "Cannot import msgpack. Please install msgpack, e.g. via "
+            "'pip install msgpack' so that you can use the binary "
+            "encoding of json objects")
+
+    return _msgpack
+
+
+def _default(obj):
+    """Return the msgpack-encodable version of 'obj'. This is only called
+       for objects that are not exactly one of the msgpack types, so
+       that the base64 strings from bytes_to_string can be found
+       without walking the object in python
+    """
+    if isinstance(obj, _Base64String):
+        return _get_msgpack().ExtType(_base64_type,
+                                      _binascii.a2b_base64(obj))
+    elif isinstance(obj, str):
+        return str(obj)
+    elif isinstance(obj, int):
+        return int(obj)
+    elif isinstance(obj, float):
+        return float(obj)
+    elif isinstance(obj, (list, tuple)):
+        return list(obj)
+    elif isinstance(obj, dict):
+        return dict(obj)
+
+    raise TypeError("Object of type %s is not JSON serializable"
+                    % obj.__class__.__name__)
+
+
+def _ext_hook(code, data):
+    """Return the object held in the msgpack extension type 'code'"""
+    if code == _base64_type:
+        return _binascii.b2a_base64(data, newline=False).decode("utf-8")
+
+    raise ObjectStoreError("Unknown extension type %d in a binary "
+                           "json object" % code)
+
+
+def set_binary_json(prefix, enabled=True):
+    """Write the json objects that are written via set_object_from_json
+       to keys that start with 'prefix' using the binary encoding (or
+       stop using it if 'enabled' is False). This is the msgpack
+       encoding of the object, in which the strings from bytes_to_string
+       are stored as their raw bytes. Binary objects are always decoded
+       when read, whether or not the encoding is enabled for their
+       prefix. This needs msgpack to be installed, e.g.
+
+       set_binary_json("transactions")
+    """
+    global _prefixes
+
+    prefix = str(prefix)
+
+    if enabled:
+        _get_msgpack()
+
+    prefixes = [p for p in _prefixes if p != prefix]
+
+    if enabled:
+        prefixes.append(prefix)
+
+    _prefixes = tuple(prefixes)
+
+
+def clear_binary_json():
+    """Stop using the binary encoding for the json objects of any prefix"""
+    global _prefixes
+    _prefixes = ()
+
+
+def _is_binary(key):
+    """Return whether or not json objects at 'key' are written in the
+       binary encoding"""
+    return len(_prefixes) > 0 and key.startswith(_prefixes)
+
+
+def to_binary_json(data):
+    """Return the binary encoding of the json-serialisable 'data'"""
+    return _header + _get_msgpack().packb(data, default=_default,
+                                           strict_types=True)
+
+
+def from_binary_json(data):
+    """Return the object decoded from the binary encoding 'data' (as
+       created by to_binary_json)"""
+    if not data.startswith(_header):
+        raise ObjectStoreError("The data is not a binary json object")
+
+    msgpack = _get_msgpack()
+
+    try:
+        return msgpack.unpackb(data[len(_header):], ext_hook=_ext_hook)
+    except ObjectStoreError:
+        raise
+    except Exception as e:
+        raise ObjectStoreError("Cannot decode the binary json object: %s"
+                               % str(e))
@@ -0,0 +1,229 @@
+
+import hashlib as _hashlib
+
+from ._errors import ObjectStoreError
+from ._objstore import ObjectStore as _ObjectStore
+
+__all__ = ["BlobStore"]
+
+# the root of the keys of all content-addressed blobs
+_blob_root = "blobs"
+
+
+def _get_blob_root(owner, checksum):
+    """Return the root of the keys of the blob owned by 'owner' with
+       sha256 'checksum'"""
+    owner = str(owner)
+    checksum = str(checksum)
+
+    if len(owner) == 0 or "/" in owner or "/" in checksum:
+        raise ObjectStoreError("Invalid blob owner '%s' or checksum '%s'"
+                               % (owner, checksum))
+
+    return "%s/%s/%s" % (_blob_root, owner, checksum)
+
+
+def _get_blob_key(owner, checksum):
+    """Return the key of the data of the blob owned by 'owner' with
+       sha256 'checksum'"""
+    return "%s/data" % _get_blob_root(owner, checksum)
+
+
+def _get_info_key(owner, checksum):
+    """Return the key of the info object of the blob owned by 'owner'
+       with sha256 'checksum'. This is written after the data, so
+       marks that the blob is complete
+    """
+    return "%s/info" % _get_blob_root(owner, checksum)
+
+
+def _get_filesize_and_checksum(filename):
+    """Return a tuple of the size in bytes of the passed file and the
+       file's sha256 checksum
+    """
+    sha256 = _hashlib.sha256()
+    size = 0
+
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1048576), b""):
+            sha256.update(chunk)
+            size += len(chunk)
+
+    return (size, str(sha256.hexdigest()))
+
+
+class BlobStore:
+    """This is a content-addressed store of files in the object store.
+       The contents of each file are stored only once per owner (e.g.
+       per account), as a 'blob' under the sha256 checksum of the
+       contents, and the key of each file holds just a small pointer
+       to its blob. Writing a file whose contents the owner has
+       already stored (e.g. the same input file uploaded for many
+       runs) skips the upload entirely and only writes the pointer.
+       Files written via the BlobStore must be read via the
+       BlobStore, e.g.
+
+       BlobStore.set_object_from_file(bucket, account_uid,
+                                      "runs/1/topol.top", filename)
+       data = BlobStore.get_object(bucket, "runs/1/topol.top")
+
+       Blobs are never shared between owners, so an owner cannot
+       find out what anyone else has stored, or read it by claiming
+       its checksum. The checksum of each blob is always calculated
+       here, from the contents that are stored, and checksums that
+       are passed in are only checked against this. The 'owner'
+       must be authenticated by the caller.
+
+       Note that blobs are not removed when the pointers to them
+       are deleted
+    """
+    @staticmethod
+    def get_filesize_and_checksum(filename):
+        """Return a tuple of the size in bytes of the passed file and the
+           file's sha256 checksum (as used to address its blob)
+        """
+        return _get_filesize_and_checksum(filename)
+
+    @staticmethod
+    def get_blob_key(owner, checksum):
+        """Return the key of the data of the blob owned by 'owner' with
+           sha256 'checksum'"""
+        return _get_blob_key(owner, checksum)
+
+    @staticmethod
+    def get_missing_checksums(bucket, owner, checksums):
+        """Return the list of the passed sha256 'checksums' whose blobs
+           are not yet held for 'owner' in 'bucket', i.e. the contents
+           that 'owner' still needs to upload
+        """
+        checksums = list(checksums)
+
+        if len(checksums) == 0:
+            return []
+
+        keys = [_get_info_key(owner, checksum) for checksum in checksums]
+        infos = _ObjectStore.get_objects_from_json(bucket, keys)
+
+        missing = []
+
+        for (checksum, key) in zip(checksums, keys):
+            if infos.get(key) is None and checksum not in missing:
+                missing.append(checksum)
+
+        return missing
+
+    @staticmethod
+    def has_blob(bucket, owner, checksum):
+        """Return whether or not 'bucket' holds the blob owned by
+           'owner' with sha256 'checksum'"""
+        return len(BlobStore.get_missing_checksums(bucket, owner,
+                                                   [checksum])) == 0
+
+    @staticmethod
+    def set_blob_from_file(bucket, owner, filename, checksum=None,
+                           filesize=None, part_size=None):
+        """Store the contents of the file 'filename' as a blob owned by
+           'owner' in 'bucket', unless the blob is already held. The
+           checksum is calculated from the file. If the expected sha256
+           'checksum' or 'filesize' of the file are passed (e.g. from a
+           FileWriteRequest) then an ObjectStoreError is raised if
+           the file does not match. This returns the tuple (checksum,
+           filesize, uploaded), where 'uploaded' is whether or not the
+           contents had to be uploaded
+        """
+        (size, sha256) = _get_filesize_and_checksum(filename)
+
+        if (checksum is not None and str(checksum) != sha256) or \
+                (filesize is not None and int(filesize) != size):
+            raise ObjectStoreError(
+                "The contents of '%s' (sha256 %s, %d bytes) do not match "
+                "the expected sha256 %s and size %s" %
+                (filename, sha256, size, checksum, filesize))
+
+        if BlobStore.has_blob(bucket, owner, sha256):
+            return (sha256, size, False)
+
+        _ObjectStore.set_object_from_file(bucket,
+                                          _get_blob_key(owner, sha256),
+                                          filename, part_size)
+        _ObjectStore.set_object_from_json(bucket,
+                                          _get_info_key(owner, sha256),
+                                          {"checksum": sha256,
+                                           "filesize": size})
+
+        return (sha256, size, True)
+
+    @staticmethod
+    def set_object_from_file(bucket, owner, key, filename, checksum=None,
+                             filesize=None, part_size=None):
+        """Set the value of 'key' in 'bucket' to equal the contents
+           of the file 'filename', storing the contents as a blob owned
+           by 'owner' (if they are not already held) and writing a
+           pointer to the blob at 'key'. This returns whether or not
+           the contents had to be uploaded
+        """
+        (checksum, filesize, uploaded) = BlobStore.set_blob_from_file(
+                                            bucket, owner, filename,
+                                            checksum, filesize, part_size)
+
+        BlobStore.set_pointer(bucket, owner, key, checksum, filesize)
+
+        return uploaded
+
+    @staticmethod
+    def set_pointer(bucket, owner, key, checksum, filesize=None):
+        """Write a pointer at 'key' in 'bucket' to the blob owned by
+           'owner' with sha256 'checksum'. This raises an
+           ObjectStoreError if 'owner' does not hold this blob
+        """
+        if not BlobStore.has_blob(bucket, owner, checksum):
+            raise ObjectStoreError(
+                "There is no blob with checksum '%s' owned by '%s'" %
+                (checksum, owner))
+
+        _ObjectStore.set_object_from_json(bucket, key,
+                                          {"blob": str(checksum),
+                                           "owner": str(owner),
+                                           "filesize": filesize})
+
+    @staticmethod
+    def _get_pointer(bucket, key):
+        """Return the tuple (owner, checksum) of the blob pointed to
+           by the file at 'key' in 'bucket'"""
+        pointer = _ObjectStore.get_object_from_json(bucket, key)
+
+        try:
+            return (pointer["owner"], pointer["blob"])
+        except:
+            raise ObjectStoreError(
+                "There is no BlobStore file at '%s'" % key)
+
+    @staticmethod
+    def get_checksum(bucket, key):
+        """Return the sha256 checksum of the contents of the file at 'key'
+           in 'bucket'"""
+        return BlobStore._get_pointer(bucket, key)[1]
+
+    @staticmethod
+    def get_object(bucket, key):
+        """Return the binary contents of the file at 'key' in 'bucket'"""
+        return _ObjectStore.get_object(
+                    bucket, _get_blob_key(*BlobStore._get_pointer(bucket,
+                                                                  key)))
+
+    @staticmethod
+    def open_object(bucket, key):
+        """Return a read-only file-like object that streams the contents
+           of the file at 'key' in 'bucket'"""
+        return _ObjectStore.open_object(
+                    bucket, _get_blob_key(*BlobStore._get_pointer(bucket,
+                                                                  key)))
+
+    @staticmethod
+    def get_object_as_file(bucket, key, filename):
+        """Write the contents of the file at 'key' in 'bucket' to
+           the file called 'filename'"""
+        return _ObjectStore.get_object_as_file(
+                    bucket, _get_blob_key(*BlobStore._get_pointer(bucket,
+                                                                  key)),
+                    filename)
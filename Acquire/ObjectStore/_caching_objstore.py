@@ -0,0 +1,392 @@
+
+import copy as _copy
+import threading as _threading
+
+from cachetools import TTLCache as _TTLCache
+
+__all__ = ["CachingObjectStore"]
+
+
+def _bucket_id(bucket):
+    """Return a hashable ID for the passed bucket. OCI buckets are
+       dictionaries, so are identified by their namespace and name,
+       while testing buckets are just the path to the directory
+    """
+    try:
+        return (bucket["namespace"], bucket["bucket_name"])
+    except:
+        return str(bucket)
+
+
+class CachingObjectStore:
+    """This is a backend that wraps another object store backend,
+       keeping a read-through cache of the objects that are read
+       via 'get_object' and 'get_object_from_json'. Entries expire
+       after 'ttl' seconds, at most 'maxsize' entries are held (the
+       least recently used are evicted first), and entries are
+       invalidated whenever this backend is used to write or delete
+       the same key or prefix. Each invalidation advances a generation
+       counter, and an object read from the backend is only cached if
+       no invalidation of its key happened while it was being read, so
+       a read that races with a write cannot leave the old object in
+       the cache.
+
+       Note that writes made by other processes are not seen until
+       the cached entry expires. For this reason only keys that start
+       with one of 'prefixes' are cached (or all keys if this is None).
+       Mutex keys are never cached, as these are written by other
+       processes and must always be read from the object store
+
+       Use this by wrapping the real backend, e.g.
+
+       set_object_store_backend(CachingObjectStore(OCI_ObjectStore))
+    """
+    def __init__(self, backend, maxsize=1024, ttl=60, prefixes=None):
+        """Construct the cache around 'backend', holding up to 'maxsize'
+           objects for up to 'ttl' seconds, only caching keys that
+           start with any of the keys in 'prefixes' (or all keys if
+           'prefixes' is None)
+        """
+        if prefixes is not None:
+            prefixes = tuple(str(prefix) for prefix in prefixes)
+
+        self._backend = backend
+        self._cache = _TTLCache(maxsize=int(maxsize), ttl=float(ttl))
+        self._prefixes = prefixes
+        self._lock = _threading.RLock()
+        self._generation = 0
+        self._key_generations = {}
+        self._prefix_generation = 0
+        self._hits = 0
+        self._misses = 0
+
+    def __str__(self):
+        return "CachingObjectStore(%s)" % self._backend.__name__
+
+    def wrapped_backend(self):
+        """Return the backend that is wrapped by this cache"""
+        return self._backend
+
+    def cache_statistics(self):
+        """Return a dictionary of the number of cache hits and misses,
+           and the current and maximum size of the cache
+        """
+        with self._lock:
+            return {"hits": self._hits,
+                    "misses": self._misses,
+                    "size": len(self._cache),
+                    "maxsize": self._cache.maxsize,
+                    "ttl": self._cache.ttl}
+
+    def clear_cache(self):
+        """Remove all entries from the cache"""
+        with self._lock:
+            self._cache.clear()
+
+    def _is_cacheable(self, key):
+        """Return whether or not the object at 'key' can be cached"""
+        if key.startswith("mutexes/"):
+            return False
+        elif self._prefixes is None:
+            return True
+        else:
+            return key.startswith(self._prefixes)
+
+    def _lookup(self, bucket, key, kind):
+        """Return the tuple (found, value) for the cached 'kind' of
+           object at 'key' in 'bucket'. If the object is not found then
+           'value' is the generation that must be passed to '_store'
+           when caching the object that is read from the backend
+        """
+        if not self._is_cacheable(key):
+            return (False, None)
+
+        with self._lock:
+            try:
+                value = self._cache[(_bucket_id(bucket), key, kind)]
+                self._hits += 1
+                return (True, value)
+            except KeyError:
+                self._misses += 1
+                return (False, self._generation)
+
+    def _get_generation(self, bucket_id, key):
+        """Return the generation at which the object at 'key' in the
+           bucket with ID 'bucket_id' was last invalidated"""
+        return max(self._prefix_generation,
+                   self._key_generations.get((bucket_id, key), 0))
+
+    def _store(self, bucket, key, kind, value, generation):
+        """Store the 'kind' of object 'value' at 'key' in the cache,
+           where 'generation' was returned by '_lookup' before the
+           object was read. The object is not stored if 'key' has been
+           invalidated since then, as it may be out of date
+        """
+        if generation is None or not self._is_cacheable(key):
+            return
+
+        bucket_id = _bucket_id(bucket)
+
+        with self._lock:
+            if self._get_generation(bucket_id, key) <= generation:
+                self._cache[(bucket_id, key, kind)] = value
+
+    def _invalidate(self, bucket, key):
+        """Remove all cached objects at 'key' in 'bucket'"""
+        bucket_id = _bucket_id(bucket)
+
+        with self._lock:
+            self._generation += 1
+            self._key_generations[(bucket_id, key)] = self._generation
+
+            for kind in ("data", "json"):
+                self._cache.pop((bucket_id, key, kind), None)
+
+            self._trim_generations()
+
+    def _invalidate_prefix(self, bucket, prefix=None):
+        """Remove all cached objects in 'bucket' whose keys start with
+           'prefix' (or all cached objects in 'bucket' if prefix is None)
+        """
+        bucket_id = _bucket_id(bucket)
+
+        with self._lock:
+            # stop any read that is in progress from caching its object.
+            # This is conservative, as it covers every key
+            self._generation += 1
+            self._prefix_generation = self._generation
+            self._key_generations.clear()
+
+            for entry in list(self._cache.keys()):
+                if entry[0] != bucket_id:
+                    continue
+
+                if prefix is None or entry[1].startswith(prefix):
+                    self._cache.pop(entry, None)
+
+    def _trim_generations(self):
+        """Stop the per-key generations from growing without limit, by
+           replacing them all with a single generation for every key
+           once there are more of them than can be held in the cache
+        """
+        if len(self._key_generations) > 2 * self._cache.maxsize:
+            self._prefix_generation = self._generation
+            self._key_generations.clear()
+
+    def get_object_as_file(self, bucket, key, filename):
+        """Get the object contained in the key 'key' in the passed 'bucket'
+           and writing this to the file called 'filename'"""
+        return self._backend.get_object_as_file(bucket, key, filename)
+
+    def get_object(self, bucket, key):
+        """Return the binary data contained in the key 'key' in the
+           passed bucket"""
+        (found, data) = self._lookup(bucket, key, "data")
+
+        if found:
+            return data
+
+        generation = data
+        data = self._backend.get_object(bucket, key)
+        self._store(bucket, key, "data", data, generation)
+
+        return data
+
+    def open_object(self, bucket, key):
+        """Return a read-only file-like object that streams the binary
+           data contained in the key 'key' in the passed bucket"""
+        return self._backend.open_object(bucket, key)
+
+    def get_string_object(self, bucket, key):
+        """Return the string in 'bucket' associated with 'key'"""
+        return self.get_object(bucket, key).decode("utf-8")
+
+    def get_object_from_json(self, bucket, key):
+        """Return an object constructed from json stored at 'key' in
+           the passed bucket. This returns None if there is no data
+           at this key
+        """
+        (found, data) = self._lookup(bucket, key, "json")
+
+        if not found:
+            generation = data
+            data = self._backend.get_object_from_json(bucket, key)
+
+            if data is None:
+                return None
+
+            self._store(bucket, key, "json", data, generation)
+
+        # return a copy so that the caller cannot change the cached object
+        return _copy.deepcopy(data)
+
+    def get_objects(self, bucket, keys):
+        """Return the binary data contained in all of the passed 'keys'
+           in 'bucket', as a dictionary indexed by key"""
+        objects = {}
+        missing = {}
+
+        for key in keys:
+            (found, data) = self._lookup(bucket, key, "data")
+
+            if found:
+                objects[key] = data
+            else:
+                missing[key] = data
+
+        if len(missing) > 0:
+            for (key, data) in self._backend.get_objects(
+                                            bucket, list(missing)).items():
+                self._store(bucket, key, "data", data, missing[key])
+                objects[key] = data
+
+        return objects
+
+    def get_objects_from_json(self, bucket, keys):
+        """Return the objects constructed from the json stored at all
+           of the passed 'keys' in 'bucket', as a dictionary indexed
+           by key. The value is None for any key that does not
+           hold any data
+        """
+        objects = {}
+        missing = {}
+
+        for key in keys:
+            (found, data) = self._lookup(bucket, key, "json")
+
+            if found:
+                objects[key] = _copy.deepcopy(data)
+            else:
+                missing[key] = data
+
+        if len(missing) > 0:
+            for (key, data) in self._backend.get_objects_from_json(
+                                            bucket, list(missing)).items():
+                if data is not None:
+                    self._store(bucket, key, "json", data, missing[key])
+                    data = _copy.deepcopy(data)
+
+                objects[key] = data
+
+        return objects
+
+    def get_all_object_names(self, bucket, prefix=None):
+        """Returns the names of all objects in the passed bucket"""
+        return self._backend.get_all_object_names(bucket, prefix)
+
+    def iter_object_names(self, bucket, prefix=None, start_after=None,
+                          limit=None):
+        """Iterate over the names of the objects in the passed bucket
+           whose keys start with 'prefix', in sorted order"""
+        return self._backend.iter_object_names(bucket, prefix,
+                                               start_after, limit)
+
+    def get_all_objects(self, bucket, prefix=None):
+        """Return all of the objects in the passed bucket"""
+        return self._backend.get_all_objects(bucket, prefix)
+
+    def get_all_strings(self, bucket, prefix=None):
+        """Return all of the strings in the passed bucket"""
+        return self._backend.get_all_strings(bucket, prefix)
+
+    def set_object(self, bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data'"""
+        try:
+            self._backend.set_object(bucket, key, data)
+        finally:
+            self._invalidate(bucket, key)
+
+    def get_object_with_etag(self, bucket, key):
+        """Return a tuple of the binary data contained in the key 'key'
+           in the passed bucket, together with its ETag. This is never
+           cached, as the ETag must be up to date"""
+        return self._backend.get_object_with_etag(bucket, key)
+
+    def set_object_if_match(self, bucket, key, data, etag):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           the ETag of the object currently at 'key' is 'etag'"""
+        try:
+            return self._backend.set_object_if_match(bucket, key, data, etag)
+        finally:
+            self._invalidate(bucket, key)
+
+    def set_object_if_absent(self, bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           there is no object at 'key'"""
+        try:
+            return self._backend.set_object_if_absent(bucket, key, data)
+        finally:
+            self._invalidate(bucket, key)
+
+    def set_object_from_file(self, bucket, key, filename, part_size=None):
+        """Set the value of 'key' in 'bucket' to equal the contents
+           of the file located by 'filename'"""
+        try:
+            self._backend.set_object_from_file(bucket, key, filename,
+                                               part_size)
+        finally:
+            self._invalidate(bucket, key)
+
+    def set_string_object(self, bucket, key, string_data):
+        """Set the value of 'key' in 'bucket' to the string 'string_data'"""
+        try:
+            self._backend.set_string_object(bucket, key, string_data)
+        finally:
+            self._invalidate(bucket, key)
+
+    def set_object_from_json(self, bucket, key, data):
+        """Set the value of 'key' in 'bucket' to equal to contents
+           of 'data', which has been encoded to json"""
+        try:
+            self._backend.set_object_from_json(bucket, key, data)
+        finally:
+            self._invalidate(bucket, key)
+
+    def log(self, bucket, message, prefix="log"):
+        """Log the the passed message to the object store"""
+        self._backend.log(bucket, message, prefix)
+
+    def delete_all_objects(self, bucket, prefix=None):
+        """Deletes all objects..."""
+        try:
+            self._backend.delete_all_objects(bucket, prefix)
+        finally:
+            self._invalidate_prefix(bucket, prefix)
+
+    def get_log(self, bucket, log="log"):
+        """Return the complete log as an xml string"""
+        return self._backend.get_log(bucket, log)
+
+    def clear_log(self, bucket, log="log"):
+        """Clears out the log"""
+        try:
+            self._backend.clear_log(bucket, log)
+        finally:
+            self._invalidate_prefix(bucket, log)
+
+    def delete_object(self, bucket, key):
+        """Removes the object at 'key'"""
+        try:
+            self._backend.delete_object(bucket, key)
+        finally:
+            self._invalidate(bucket, key)
+
+    def delete_objects(self, bucket, keys):
+        """Delete all of the objects at the passed 'keys' in 'bucket',
+           returning a dictionary of the error for each key whose
+           object could not be deleted"""
+        keys = list(keys)
+
+        try:
+            return self._backend.delete_objects(bucket, keys)
+        finally:
+            for key in keys:
+                self._invalidate(bucket, key)
+
+    def clear_all_except(self, bucket, keys):
+        """Removes all objects from the passed 'bucket' except those
+           whose keys are or start with any key in 'keys'"""
+        try:
+            self._backend.clear_all_except(bucket, keys)
+        finally:
+            self._invalidate_prefix(bucket)
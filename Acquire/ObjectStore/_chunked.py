@@ -0,0 +1,58 @@
+
+import json as _json
+
+__all__ = ["encode_chunk_manifest"]
+
+# the header that starts the manifest of a chunked object. The manifest
+# is stored at the key of the object itself, with the data held in the
+# numbered chunks 'key/1', 'key/2' etc. Json cannot start with a zero
+# byte, and this is different to the header of compressed objects,
+# so a manifest cannot be confused with any object written via
+# set_object_from_json
+_header = b"\x00acqchunked"
+
+
+def encode_chunk_manifest(num_chunks):
+    """Return the manifest that marks the object at a key as being a
+       chunked object whose data is held in the 'num_chunks' chunks
+       'key/1' to 'key/num_chunks'. The manifest is written to the
+       key after each chunk, e.g.
+
+       ObjectStore.set_object(bucket, "%s/%d" % (key, n), chunk)
+       ObjectStore.set_object(bucket, key, encode_chunk_manifest(n))
+    """
+    return _header + _json.dumps({"num_chunks": int(num_chunks)}).encode(
+                                                                    "utf-8")
+
+
+def get_chunk_keys(key, data):
+    """Return the keys of the chunks of the chunked object at 'key' if
+       'data' (the start of the object at 'key') is a chunk manifest,
+       or None if the object at 'key' is not chunked
+    """
+    if not data.startswith(_header):
+        return None
+
+    manifest = _json.loads(data[len(_header):].decode("utf-8"))
+
+    return ["%s/%d" % (key, i)
+            for i in range(1, int(manifest["num_chunks"])+1)]
+
+
+def get_listed_chunk_keys(key, names):
+    """Return the keys of the chunks of the chunked object at 'key' from
+       the 'names' of the objects listed under 'key/'. This is used for
+       chunked objects that were written before chunk manifests were
+       added, which have chunks but no object at 'key'. This returns
+       None if there are no chunks
+    """
+    num_chunks = 0
+
+    for name in names:
+        if name.isdigit():
+            num_chunks = max(num_chunks, int(name))
+
+    if num_chunks == 0:
+        return None
+
+    return ["%s/%d" % (key, i) for i in range(1, num_chunks+1)]
@@ -0,0 +1,140 @@
+
+import json as _json
+import lzma as _lzma
+import zlib as _zlib
+
+from ._errors import ObjectStoreError
+from ._binaryjson import _is_binary
+from ._binaryjson import to_binary_json as _to_binary_json
+from ._binaryjson import from_binary_json as _from_binary_json
+from ._binaryjson import _header as _binary_header
+
+__all__ = ["set_json_compression", "clear_json_compression",
+           "register_compression_codec",
+           "encode_json_object", "decode_json_object"]
+
+# the header that starts every compressed object, which is followed by
+# a single byte giving the length of the codec name, and then the name.
+# Json cannot start with a zero byte, so uncompressed objects written
+# before compression was enabled can still be read
+_header = b"\x00acqz"
+
+# the codecs that can be used, as (compress, decompress) functions
+_codecs = {"zlib": (lambda data: _zlib.compress(data, 6), _zlib.decompress),
+           "lzma": (_lzma.compress, _lzma.decompress)}
+
+# the (prefix, codec, min_size) for each key prefix whose json objects
+# are compressed, sorted so that the longest prefix is matched first
+_prefix_codecs = []
+
+
+def register_compression_codec(name, compress, decompress):
+    """Register the codec called 'name', which uses the function 'compress'
+       to compress bytes and 'decompress' to decompress them. The name is
+       stored in each compressed object, so the codec must be registered
+       in every process that reads these objects
+    """
+    name = str(name)
+
+    if len(name) == 0 or len(name.encode("utf-8")) > 255:
+        raise ObjectStoreError("Invalid compression codec name '%s'" % name)
+
+    _codecs[name] = (compress, decompress)
+
+
+def set_json_compression(prefix, codec="zlib", min_size=256):
+    """Compress the json objects that are written via set_object_from_json
+       to keys that start with 'prefix' using 'codec' (e.g. "zlib" or
+       "lzma"), or stop compressing them if 'codec' is None. Objects
+       smaller than 'min_size' bytes are not compressed. Compressed
+       objects are always decompressed when read, whether or not
+       compression is enabled for their prefix, e.g.
+
+       set_json_compression("ledger", "zlib")
+    """
+    global _prefix_codecs
+
+    prefix = str(prefix)
+
+    if codec is not None and codec not in _codecs:
+        raise ObjectStoreError("There is no compression codec called '%s'. "
+                               "Available codecs are %s" %
+                               (codec, list(_codecs.keys())))
+
+    prefix_codecs = [p for p in _prefix_codecs if p[0] != prefix]
+
+    if codec is not None:
+        prefix_codecs.append((prefix, codec, int(min_size)))
+
+    prefix_codecs.sort(key=lambda p: len(p[0]), reverse=True)
+
+    _prefix_codecs = prefix_codecs
+
+
+def clear_json_compression():
+    """Stop compressing the json objects written to any prefix"""
+    global _prefix_codecs
+    _prefix_codecs = []
+
+
+def _get_codec(key):
+    """Return the (codec, min_size) used for json objects at 'key', or
+       (None, None) if these are not compressed"""
+    for (prefix, codec, min_size) in _prefix_codecs:
+        if key.startswith(prefix):
+            return (codec, min_size)
+
+    return (None, None)
+
+
+def encode_json_object(key, data):
+    """Return the binary data that is stored at 'key' to hold the json
+       encoding of 'data', in the binary encoding and/or compressed if
+       these are enabled for the prefix of 'key'"""
+    if _is_binary(key):
+        try:
+            data = _to_binary_json(data)
+        except OverflowError:
+            # msgpack cannot hold integers of more than 64 bits
+            data = _json.dumps(data).encode("utf-8")
+    else:
+        data = _json.dumps(data).encode("utf-8")
+
+    if len(_prefix_codecs) == 0:
+        return data
+
+    (codec, min_size) = _get_codec(key)
+
+    if codec is None or len(data) < min_size:
+        return data
+
+    name = codec.encode("utf-8")
+
+    return b"".join((_header, bytes([len(name)]), name,
+                     _codecs[codec][0](data)))
+
+
+def decode_json_object(data):
+    """Return the object decoded from the passed binary 'data', which was
+       created by encode_json_object (or is plain json)"""
+    if data.startswith(_binary_header):
+        return _from_binary_json(data)
+
+    if data.startswith(_header):
+        start = len(_header) + 1
+        end = start + data[len(_header)]
+        codec = data[start:end].decode("utf-8")
+
+        try:
+            decompress = _codecs[codec][1]
+        except KeyError:
+            raise ObjectStoreError(
+                "Cannot decompress the object as there is no compression "
+                "codec called '%s'" % codec)
+
+        data = decompress(data[end:])
+
+        if data.startswith(_binary_header):
+            return _from_binary_json(data)
+
+    return _json.loads(data.decode("utf-8"))
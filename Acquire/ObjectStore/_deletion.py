@@ -0,0 +1,70 @@
+
+from ._errors import ObjectStoreError
+
+__all__ = ["PrefixTrie", "check_deleted"]
+
+
+class PrefixTrie:
+    """This is a trie (prefix tree) of a set of keys, which is used to
+       find whether or not a name starts with any of the keys in a
+       single walk along the name, rather than by comparing the
+       name against every key
+    """
+    def __init__(self, keys=None):
+        self._root = {}
+        self._matches_all = False
+
+        if keys is not None:
+            for key in keys:
+                self.add(key)
+
+    def add(self, key):
+        """Add 'key' to the trie"""
+        key = str(key)
+
+        if len(key) == 0:
+            # every name starts with the empty string
+            self._matches_all = True
+            return
+
+        node = self._root
+
+        for c in key:
+            node = node.setdefault(c, {})
+
+        # the None entry marks the end of a key
+        node[None] = True
+
+    def matches(self, name):
+        """Return whether or not 'name' is, or starts with,
+           any of the keys in the trie"""
+        if self._matches_all:
+            return True
+
+        node = self._root
+
+        for c in name:
+            try:
+                node = node[c]
+            except KeyError:
+                return False
+
+            if None in node:
+                return True
+
+        return False
+
+
+def check_deleted(failures):
+    """Raise an ObjectStoreError listing the keys that could not be
+       deleted if 'failures' (a dictionary of the error for each key,
+       as returned by 'delete_objects') is not empty"""
+    if failures is None or len(failures) == 0:
+        return
+
+    keys = sorted(failures.keys())
+
+    raise ObjectStoreError(
+        "Failed to delete %d object(s): %s" %
+        (len(keys), "; ".join("%s: %s" % (key, failures[key])
+                              for key in keys)))
@@ -19,13 +19,21 @@ def encoded_to_string(b):
     return string_to_bytes(b).decode("utf-8")
 
 
+class _Base64String(str):
+    """A string returned by bytes_to_string. This behaves exactly like
+       the base64 string, but is marked so that the binary json encoding
+       can store the bytes that it encodes, rather than the string
+    """
+    __slots__ = ()
+
+
 def bytes_to_string(b):
     """Return the passed binary bytes safely encoded to
        a base64 utf-8 string"""
     if b is None:
         return None
     else:
-        return _base64.b64encode(b).decode("utf-8")
+        return _Base64String(_base64.b64encode(b).decode("utf-8"))
 
 
 def string_to_bytes(s):
@@ -0,0 +1,501 @@
+
+import bisect as _bisect
+import datetime as _datetime
+import hashlib as _hashlib
+import io as _io
+import threading as _threading
+import time as _time
+
+from ._errors import ObjectStoreError
+from ._compression import encode_json_object as _encode_json_object
+from ._compression import decode_json_object as _decode_json_object
+from ._objstorelog import _get_log
+from ._objstorelog import _get_segment_prefix
+from ._deletion import PrefixTrie as _PrefixTrie
+from ._chunked import get_chunk_keys as _get_chunk_keys
+from ._chunked import get_listed_chunk_keys as _get_listed_chunk_keys
+
+__all__ = ["Memory_ObjectStore"]
+
+# all of the in-memory buckets, indexed by bucket name
+_buckets = {}
+_buckets_lock = _threading.Lock()
+
+# the simulated latency (in seconds) added to every call
+_latency = 0.0
+
+
+def _get_etag(data):
+    """Return the ETag of the passed binary data. As for
+       Testing_ObjectStore, this depends only on the contents"""
+    return _hashlib.md5(data).hexdigest()
+
+
+def _normalise_prefix(prefix):
+    """Return 'prefix' without any trailing '/', or None if this leaves
+       an empty prefix, so that e.g. 'a/b/' lists the same objects as
+       'a/b' (as for Testing_ObjectStore)"""
+    if prefix:
+        prefix = prefix.rstrip("/")
+
+    if prefix:
+        return prefix
+    else:
+        return None
+
+
+class _MemoryBucket:
+    """This holds the objects in an in-memory bucket in a dictionary,
+       together with a sorted index of the keys that is used to
+       list the keys that start with a prefix
+    """
+    def __init__(self):
+        self.lock = _threading.RLock()
+        self.objects = {}
+        self.keys = []
+
+    def get(self, key):
+        """Return the data at 'key', raising an ObjectStoreError
+           if there is no object at this key"""
+        try:
+            return self.objects[key]
+        except KeyError:
+            raise ObjectStoreError("No object at key '%s'" % key)
+
+    def set(self, key, data):
+        """Set the object at 'key' equal to 'data'"""
+        data = bytes(data)
+
+        with self.lock:
+            if key not in self.objects:
+                _bisect.insort(self.keys, key)
+
+            self.objects[key] = data
+
+    def delete(self, key):
+        """Remove the object at 'key', if it exists"""
+        with self.lock:
+            if self.objects.pop(key, None) is not None:
+                i = _bisect.bisect_left(self.keys, key)
+                del self.keys[i]
+
+    def names(self, prefix=None, start_after=None):
+        """Return the sorted list of names of objects whose keys start
+           with 'prefix', relative to that prefix, which sort
+           after 'start_after'"""
+        prefix = _normalise_prefix(prefix)
+
+        if prefix:
+            prefix = "%s/" % prefix
+        else:
+            prefix = ""
+
+        if start_after is None:
+            start = prefix
+        else:
+            start = "%s%s\0" % (prefix, start_after)
+
+        names = []
+
+        with self.lock:
+            for i in range(_bisect.bisect_left(self.keys, start),
+                           len(self.keys)):
+                key = self.keys[i]
+
+                if not key.startswith(prefix):
+                    break
+
+                names.append(key[len(prefix):])
+
+        return names
+
+
+def _get_bucket(bucket):
+    """Return the _MemoryBucket called 'bucket', creating it if needed"""
+    bucket = str(bucket)
+
+    try:
+        return _buckets[bucket]
+    except KeyError:
+        pass
+
+    with _buckets_lock:
+        if bucket not in _buckets:
+            _buckets[bucket] = _MemoryBucket()
+
+        return _buckets[bucket]
+
+
+def _wait():
+    """Sleep for the simulated latency of a call"""
+    if _latency > 0:
+        _time.sleep(_latency)
+
+
+def _get_object(bucket, key):
+    """Internal function that returns the data at 'key', joining
+       together the numbered chunks if this is a chunked object"""
+    b = _get_bucket(bucket)
+
+    with b.lock:
+        try:
+            data = b.get(key)
+        except ObjectStoreError:
+            # chunked objects written before chunk manifests were
+            # added have no object at 'key', so are found by listing
+            chunk_keys = _get_listed_chunk_keys(key, b.names(key))
+
+            if chunk_keys is None:
+                raise
+        else:
+            chunk_keys = _get_chunk_keys(key, data)
+
+            if chunk_keys is None:
+                return data
+
+        return b"".join(b.get(chunk_key) for chunk_key in chunk_keys)
+
+
+def _get_objects(bucket, keys):
+    """Internal function that returns the data at all of 'keys'"""
+    b = _get_bucket(bucket)
+    objects = {}
+
+    with b.lock:
+        for key in keys:
+            objects[key] = _get_object(bucket, key)
+
+    return objects
+
+
+def _get_all_objects(bucket, prefix=None):
+    """Internal function that returns all objects under 'prefix'"""
+    b = _get_bucket(bucket)
+    prefix = _normalise_prefix(prefix)
+
+    with b.lock:
+        names = b.names(prefix)
+
+        if prefix:
+            keys = ["%s/%s" % (prefix, name) for name in names]
+        else:
+            keys = names
+
+        return dict(zip(names, (_get_object(bucket, key) for key in keys)))
+
+
+def _get_all_strings(bucket, prefix=None):
+    """Internal function that returns all objects under 'prefix' that
+       can be decoded as strings"""
+    objects = {}
+
+    for (name, data) in _get_all_objects(bucket, prefix).items():
+        try:
+            objects[name] = data.decode("utf-8")
+        except:
+            pass
+
+    return objects
+
+
+def _delete_all_objects(bucket, prefix=None):
+    """Internal function that deletes all objects under 'prefix'"""
+    b = _get_bucket(bucket)
+    prefix = _normalise_prefix(prefix)
+
+    with b.lock:
+        if prefix:
+            keys = ["%s/%s" % (prefix, name) for name in b.names(prefix)]
+        else:
+            keys = list(b.keys)
+
+        for key in keys:
+            b.delete(key)
+
+
+class Memory_ObjectStore:
+    """This is an object store that holds all objects in memory, in
+       dictionaries indexed by key, together with a sorted index of the
+       keys that is used for prefix listing. This is much faster than
+       Testing_ObjectStore, so is useful for high-throughput local runs
+       and benchmarks. A bucket is just a name (e.g. the directory
+       path used for a Testing_ObjectStore bucket) and is created
+       when first used. The objects only exist for the lifetime of
+       the process. Use 'set_latency' to add a simulated latency
+       to every call, e.g. to mimic a remote object store.
+
+       Select this backend before logging in, e.g.
+
+       set_object_store_backend(Memory_ObjectStore)
+    """
+
+    @staticmethod
+    def set_latency(latency):
+        """Set the simulated latency (in seconds) added to every call"""
+        global _latency
+        _latency = float(latency)
+
+    @staticmethod
+    def get_latency():
+        """Return the simulated latency (in seconds) added to every call"""
+        return _latency
+
+    @staticmethod
+    def clear_buckets():
+        """Remove all of the in-memory buckets and their objects"""
+        with _buckets_lock:
+            _buckets.clear()
+
+    @staticmethod
+    def get_object_as_file(bucket, key, filename):
+        """Get the object contained in the key 'key' in the passed 'bucket'
+           and writing this to the file called 'filename'"""
+        _wait()
+        data = _get_object(bucket, key)
+
+        with open(filename, "wb") as FILE:
+            FILE.write(data)
+
+        return filename
+
+    @staticmethod
+    def get_object(bucket, key):
+        """Return the binary data contained in the key 'key' in the
+           passed bucket"""
+        _wait()
+        return _get_object(bucket, key)
+
+    @staticmethod
+    def open_object(bucket, key):
+        """Return a read-only file-like object that reads the binary
+           data contained in the key 'key' in the passed bucket"""
+        _wait()
+        return _io.BufferedReader(_io.BytesIO(_get_object(bucket, key)))
+
+    @staticmethod
+    def get_string_object(bucket, key):
+        """Return the string in 'bucket' associated with 'key'"""
+        _wait()
+        return _get_object(bucket, key).decode("utf-8")
+
+    @staticmethod
+    def get_object_from_json(bucket, key):
+        """Return an object constructed from json stored at 'key' in
+           the passed bucket. This returns None if there is no data
+           at this key
+        """
+        _wait()
+
+        try:
+            data = _get_object(bucket, key)
+        except:
+            return None
+
+        return _decode_json_object(data)
+
+    @staticmethod
+    def get_objects(bucket, keys):
+        """Return the binary data contained in all of the passed 'keys'
+           in 'bucket', as a dictionary indexed by key. This raises
+           an ObjectStoreError if there is no data at any of the keys
+        """
+        _wait()
+        return _get_objects(bucket, keys)
+
+    @staticmethod
+    def get_objects_from_json(bucket, keys):
+        """Return the objects constructed from the json stored at all
+           of the passed 'keys' in 'bucket', as a dictionary indexed
+           by key. The value is None for any key that does not
+           hold any data
+        """
+        _wait()
+        b = _get_bucket(bucket)
+        objects = {}
+
+        with b.lock:
+            for key in keys:
+                try:
+                    objects[key] = b.objects[key]
+                except KeyError:
+                    objects[key] = None
+
+        for (key, data) in objects.items():
+            if data is not None:
+                objects[key] = _decode_json_object(data)
+
+        return objects
+
+    @staticmethod
+    def get_all_object_names(bucket, prefix=None):
+        """Returns the names of all objects in the passed bucket"""
+        _wait()
+        return _get_bucket(bucket).names(prefix)
+
+    @staticmethod
+    def iter_object_names(bucket, prefix=None, start_after=None, limit=None):
+        """Iterate over the names of the objects in the passed bucket
+           whose keys start with 'prefix', in sorted order. If
+           'start_after' is passed then only names that sort after
+           this name are returned, and if 'limit' is passed then
+           at most 'limit' names are returned
+        """
+        _wait()
+        names = _get_bucket(bucket).names(prefix, start_after)
+
+        if limit is not None:
+            names = names[0:int(limit)]
+
+        return iter(names)
+
+    @staticmethod
+    def get_all_objects(bucket, prefix=None):
+        """Return all of the objects in the passed bucket"""
+        _wait()
+        return _get_all_objects(bucket, prefix)
+
+    @staticmethod
+    def get_all_strings(bucket, prefix=None):
+        """Return all of the strings in the passed bucket"""
+        _wait()
+        return _get_all_strings(bucket, prefix)
+
+    @staticmethod
+    def set_object(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data'"""
+        _wait()
+        _get_bucket(bucket).set(key, data)
+
+    @staticmethod
+    def get_object_with_etag(bucket, key):
+        """Return a tuple of the binary data contained in the key 'key'
+           in the passed bucket, together with its ETag"""
+        _wait()
+        data = _get_bucket(bucket).get(key)
+        return (data, _get_etag(data))
+
+    @staticmethod
+    def set_object_if_match(bucket, key, data, etag):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           the ETag of the object currently at 'key' is 'etag'. This
+           returns the new ETag of the object if the write succeeded,
+           or None if the object had been changed (or deleted)"""
+        _wait()
+        b = _get_bucket(bucket)
+
+        with b.lock:
+            try:
+                current = b.objects[key]
+            except KeyError:
+                return None
+
+            if _get_etag(current) != etag:
+                return None
+
+            b.set(key, data)
+
+        return _get_etag(data)
+
+    @staticmethod
+    def set_object_if_absent(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           there is no object at 'key'. This returns the ETag of the
+           new object if the write succeeded, or None if there
+           was already an object at this key"""
+        _wait()
+        b = _get_bucket(bucket)
+
+        with b.lock:
+            if key in b.objects:
+                return None
+
+            b.set(key, data)
+
+        return _get_etag(data)
+
+    @staticmethod
+    def set_object_from_file(bucket, key, filename, part_size=None):
+        """Set the value of 'key' in 'bucket' to equal the contents
+           of the file located by 'filename'. The 'part_size' is
+           ignored as files are copied in one go"""
+        _wait()
+
+        with open(filename, "rb") as FILE:
+            _get_bucket(bucket).set(key, FILE.read())
+
+    @staticmethod
+    def set_string_object(bucket, key, string_data):
+        """Set the value of 'key' in 'bucket' to the string 'string_data'"""
+        _wait()
+        _get_bucket(bucket).set(key, string_data.encode("utf-8"))
+
+    @staticmethod
+    def set_object_from_json(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to equal to contents
+           of 'data', which has been encoded to json"""
+        _wait()
+        _get_bucket(bucket).set(key, _encode_json_object(key, data))
+
+    @staticmethod
+    def log(bucket, message, prefix="log"):
+        """Log the the passed message to the object store in
+           the bucket with key "key/timestamp" (defaults
+           to "log/timestamp"
+        """
+        _wait()
+        _get_bucket(bucket).set(
+            "%s/%s" % (prefix, _datetime.datetime.utcnow().timestamp()),
+            str(message).encode("utf-8"))
+
+    @staticmethod
+    def delete_all_objects(bucket, prefix=None):
+        """Deletes all objects..."""
+        _wait()
+        _delete_all_objects(bucket, prefix)
+
+    @staticmethod
+    def get_log(bucket, log="log"):
+        """Return the complete log as an xml string"""
+        return _get_log(Memory_ObjectStore, bucket, log)
+
+    @staticmethod
+    def clear_log(bucket, log="log"):
+        """Clears out the log"""
+        _wait()
+        _delete_all_objects(bucket, log)
+        _delete_all_objects(bucket, _get_segment_prefix(log))
+
+    @staticmethod
+    def delete_object(bucket, key):
+        """Removes the object at 'key'"""
+        _wait()
+        _get_bucket(bucket).delete(key)
+
+    @staticmethod
+    def delete_objects(bucket, keys):
+        """Delete all of the objects at the passed 'keys' in 'bucket'.
+           This returns a dictionary of the error message for each key
+           whose object could not be deleted, which is always
+           empty for this backend
+        """
+        _wait()
+        b = _get_bucket(bucket)
+
+        with b.lock:
+            for key in keys:
+                b.delete(key)
+
+        return {}
+
+    @staticmethod
+    def clear_all_except(bucket, keys):
+        """Removes all objects from the passed 'bucket' except those
+           whose keys are or start with any key in 'keys'"""
+        _wait()
+        b = _get_bucket(bucket)
+        keep = _PrefixTrie(keys)
+
+        with b.lock:
+            for name in list(b.keys):
+                if not keep.matches(name):
+                    b.delete(name)
@@ -2,6 +2,9 @@
 import uuid
 import datetime as _datetime
 import time as _time
+import random as _random
+import threading as _threading
+import weakref as _weakref
 
 from ._objstore import ObjectStore as _ObjectStore
 
@@ -9,15 +12,129 @@ from ._errors import MutexTimeoutError
 
 __all__ = ["Mutex"]
 
+# The default minimum and maximum time (in seconds) to wait between
+# attempts to lock a mutex that is held by someone else. The wait
+# grows exponentially from the minimum, with random jitter so that
+# waiting threads do not all retry at the same time
+_min_backoff = 0.01
+_max_backoff = 1.0
+
+
+# Process-local registry of the Mutex object in this process that is
+# currently holding (or trying to take) the mutex for each key. Only
+# the registered Mutex competes for the mutex in the object store,
+# while other threads in this process wait on '_local_condition'
+_local_owners = {}
+_local_condition = _threading.Condition()
+
+
+def _get_local_owner(key):
+    """Return the Mutex in this process that owns the mutex for 'key',
+       or None if there is no owner. An owner that has been deleted,
+       unlocked or whose lease has expired is removed from the registry.
+       This must be called while holding '_local_condition'
+    """
+    ref = _local_owners.get(key)
+
+    if ref is None:
+        return None
+
+    owner = ref()
+
+    if owner is not None:
+        if owner._is_acquiring or owner.is_locked():
+            return owner
+
+    del _local_owners[key]
+    return None
+
+
+def _acquire_local(key, mutex, timeout):
+    """Wait for up to 'timeout' seconds to make 'mutex' the owner of the
+       mutex for 'key' in this process, returning whether or not
+       this was successful. The new owner is marked as acquiring the
+       mutex while '_local_condition' is still held, so that no other
+       thread can see it as a stale owner and take its place
+    """
+    endtime = _time.monotonic() + timeout
+
+    with _local_condition:
+        while True:
+            owner = _get_local_owner(key)
+
+            if owner is None or owner is mutex:
+                mutex._is_acquiring = True
+                _local_owners[key] = _weakref.ref(mutex)
+                return True
+
+            remaining = endtime - _time.monotonic()
+
+            if remaining <= 0:
+                return False
+
+            # wake up no later than when the owner's lease expires, as
+            # then we can take over the mutex
+            wait = min(remaining, 1.0)
+            end_lease = owner._end_lease
+
+            if owner._is_locked > 0 and end_lease is not None:
+                lease_left = (end_lease - _datetime.datetime.now()) \
+                                .total_seconds()
+                wait = min(wait, max(lease_left, 0.001))
+
+            _local_condition.wait(wait)
+
+
+def _release_local(key, mutex):
+    """Release the ownership of the mutex for 'key' in this process by
+       'mutex', waking any threads that are waiting for the mutex
+    """
+    with _local_condition:
+        ref = _local_owners.get(key)
+
+        if ref is not None and ref() is mutex:
+            del _local_owners[key]
+            _local_condition.notify_all()
+
+
+def _renew_lease_until_stopped(mutex_ref, stop_event, interval):
+    """Function run in a background thread that renews the lease on the
+       mutex referred to by the weak reference 'mutex_ref' every
+       'interval' seconds, until 'stop_event' is set, the mutex is
+       deleted, or the lease cannot be renewed
+    """
+    while not stop_event.wait(interval):
+        mutex = mutex_ref()
+
+        if mutex is None:
+            return
+
+        try:
+            renewed = mutex._renew_lease()
+        except:
+            renewed = False
+
+        del mutex
+
+        if not renewed:
+            return
+
 
 class Mutex:
     """This class implements a mutex that sits in the object store.
        The mutex is associated with a key. A thread holds this mutex
-       if it has successfully written its secret to this key. If
-       not, then another thread must hold the mutex, and we have
+       if it has successfully written its secret to this key, using
+       a conditional write that only succeeds if the key is empty
+       (or still holds the expired lease of the previous holder).
+       If not, then another thread must hold the mutex, and we have
        to wait...
+
+       Threads in the same process that want the same mutex first
+       queue on a process-local lock, so that only one thread per
+       process polls the object store for each key
     """
-    def __init__(self, key=None, timeout=10, lease_time=10, bucket=None):
+    def __init__(self, key=None, timeout=10, lease_time=10, bucket=None,
+                 auto_renew=False, min_backoff=None, max_backoff=None):
         """Create the mutex. The immediately tries to lock the mutex
            for key 'key' and will block until a lock is successfully
            obtained (or until 'timeout' seconds has been reached, and an
@@ -27,6 +144,14 @@ class Mutex:
            'lease_time' seconds. After this time the mutex will be
            automatically unlocked and made available to lock by
            others. You can renew the lease by re-locking the mutex.
+
+           If 'auto_renew' is True then the lease is renewed automatically
+           by a background thread until the mutex is unlocked, so that
+           a short 'lease_time' can safely be used for a long critical
+           section (the lease will still expire quickly if this process
+           dies). While waiting for the mutex, the time between attempts
+           grows exponentially (with random jitter) from 'min_backoff'
+           to 'max_backoff' seconds
         """
         if key is None:
             key = "mutexes/none"
@@ -43,6 +168,30 @@ class Mutex:
         self._key = key
         self._secret = str(uuid.uuid4())
         self._is_locked = 0
+        self._etag = None
+        self._end_lease = None
+        self._lockstring = None
+        self._lease_time = None
+        self._auto_renew = bool(auto_renew)
+        self._renew_thread = None
+        self._renew_stop = None
+        self._state_lock = _threading.RLock()
+        self._is_acquiring = False
+
+        if min_backoff is None:
+            min_backoff = _min_backoff
+
+        if max_backoff is None:
+            max_backoff = _max_backoff
+
+        self._min_backoff = float(min_backoff)
+        self._max_backoff = max(float(max_backoff), self._min_backoff)
+
+        self._stats = {"num_locks": 0, "num_attempts": 0,
+                       "total_wait_time": 0.0, "max_wait_time": 0.0,
+                       "total_hold_time": 0.0, "max_hold_time": 0.0}
+        self._locked_at = None
+
         self.lock(timeout, lease_time)
 
     def __del__(self):
@@ -65,6 +214,83 @@ class Mutex:
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def statistics(self):
+        """Return a dictionary of statistics about the use of this mutex,
+           namely the number of times it has been locked ('num_locks'),
+           the number of attempts needed to lock it ('num_attempts'),
+           and the total and maximum time in seconds spent waiting
+           to lock it ('total_wait_time', 'max_wait_time') and
+           holding it ('total_hold_time', 'max_hold_time')
+        """
+        with self._state_lock:
+            return dict(self._stats)
+
+    def _record_time(self, name, seconds):
+        """Internal function used to record the time 'seconds' spent
+           waiting for or holding the mutex"""
+        self._stats["total_%s_time" % name] += seconds
+        self._stats["max_%s_time" % name] = max(
+                                self._stats["max_%s_time" % name], seconds)
+
+    def _renew_lease(self, lease_time=None):
+        """Internal function that renews the lease on this mutex for
+           another 'lease_time' seconds (or the current lease time if
+           this is None), using a conditional write so that the lease
+           is only renewed if no-one else has taken the mutex. This
+           returns whether or not the lease was renewed
+        """
+        with self._state_lock:
+            if self._is_locked == 0 or self._etag is None:
+                return False
+
+            if lease_time is None:
+                lease_time = self._lease_time
+
+            end_lease = _datetime.datetime.now() + \
+                _datetime.timedelta(seconds=lease_time)
+            lockstring = "%s %s" % (self._secret, end_lease.timestamp())
+
+            etag = _ObjectStore.set_object_if_match(
+                                self._bucket, self._key,
+                                lockstring.encode("utf-8"), self._etag)
+
+            if etag is None:
+                return False
+
+            self._etag = etag
+            self._end_lease = end_lease
+            self._lockstring = lockstring
+            self._lease_time = lease_time
+
+            return True
+
+    def _start_auto_renew(self):
+        """Internal function that starts the background thread that
+           automatically renews the lease on this mutex"""
+        if not self._auto_renew:
+            return
+
+        self._stop_auto_renew()
+
+        # renew a third of the way through the lease, so that there
+        # is time for a couple of attempts before the lease expires
+        self._renew_stop = _threading.Event()
+        self._renew_thread = _threading.Thread(
+                                target=_renew_lease_until_stopped,
+                                args=(_weakref.ref(self), self._renew_stop,
+                                      self._lease_time / 3.0))
+        self._renew_thread.daemon = True
+        self._renew_thread.start()
+
+    def _stop_auto_renew(self):
+        """Internal function that stops the background thread that
+           automatically renews the lease on this mutex"""
+        if self._renew_stop is not None:
+            self._renew_stop.set()
+
+        self._renew_stop = None
+        self._renew_thread = None
+
     def is_locked(self):
         """Return whether or not this mutex is locked"""
         return self._is_locked > 0 and not self.expired()
@@ -105,17 +331,28 @@ class Mutex:
         if self._is_locked == 0:
             return
 
-        try:
-            holder = _ObjectStore.get_string_object(self._bucket, self._key)
-        except:
-            holder = None
+        self._stop_auto_renew()
 
-        if holder == self._lockstring:
-            # we hold the mutex - delete the key
-            _ObjectStore.delete_object(self._bucket, self._key)
+        with self._state_lock:
+            try:
+                holder = _ObjectStore.get_string_object(self._bucket,
+                                                        self._key)
+            except:
+                holder = None
 
-        self._lockstring = None
-        self._is_locked = 0
+            if holder == self._lockstring:
+                # we hold the mutex - delete the key
+                _ObjectStore.delete_object(self._bucket, self._key)
+
+            _release_local(self._key, self)
+
+            if self._locked_at is not None:
+                self._record_time("hold", _time.monotonic() - self._locked_at)
+                self._locked_at = None
+
+            self._lockstring = None
+            self._etag = None
+            self._is_locked = 0
 
         if self._end_lease < _datetime.datetime.now():
             self._end_lease = None
@@ -167,80 +404,119 @@ class Mutex:
                 self.fully_unlock()
                 self.lock(timeout, lease_time)
             else:
-                self._end_lease = now + _datetime.timedelta(seconds=lease_time)
-
-                self._lockstring = "%s %s" % (self._secret,
-                                              self._end_lease.timestamp())
-
-                _ObjectStore.set_string_object(self._bucket, self._key,
-                                               self._lockstring)
+                # only renew the lease if no-one else has taken the mutex
+                if not self._renew_lease(lease_time):
+                    self._stop_auto_renew()
+                    _release_local(self._key, self)
+                    self._lockstring = None
+                    self._etag = None
+                    self._is_locked = 0
+                    self._end_lease = None
+                    self._locked_at = None
+                    raise MutexTimeoutError(
+                        "The lease on the mutex '%s' was lost before it "
+                        "could be renewed!" % self._key)
 
                 self._is_locked += 1
 
             return
 
-        now = _datetime.datetime.now()
-        endtime = now + _datetime.timedelta(seconds=timeout)
+        start_time = _time.monotonic()
 
-        # This is the first time we are trying to get a lock
-        while now < endtime:
-            # does anyone else hold the lock?
-            try:
-                holder = _ObjectStore.get_string_object(self._bucket,
-                                                        self._key)
-            except:
-                holder = None
-
-            is_held = True
+        # first wait until no other thread in this process is trying
+        # to hold this mutex
+        if not _acquire_local(self._key, self, timeout):
+            raise MutexTimeoutError("Cannot acquire a mutex lock on the "
+                                    "key '%s'" % self._key)
 
-            if holder is None:
-                is_held = False
-            else:
-                end_lease = float(holder.split()[1])
-                if now > _datetime.datetime.fromtimestamp(end_lease):
-                    # the lease from the other holder has expired :-)
-                    is_held = False
-
-            if not is_held:
-                # no-one holds this mutex - try to hold it now
-                self._end_lease = now + _datetime.timedelta(seconds=lease_time)
-
-                self._lockstring = "%s %s" % (self._secret,
-                                              self._end_lease.timestamp())
+        try:
+            self._lock_remote(start_time, timeout, lease_time)
+        except:
+            _release_local(self._key, self)
+            raise
+        finally:
+            self._is_acquiring = False
+
+        self._start_auto_renew()
+
+    def _lock_remote(self, start_time, timeout, lease_time):
+        """Internal function that locks the mutex in the object store,
+           blocking until the mutex is held or until 'timeout' seconds
+           after 'start_time' have passed (raising a MutexTimeoutError).
+           The mutex is held for a maximum of 'lease_time' seconds.
+        """
+        now = _datetime.datetime.now()
+        endtime = now + _datetime.timedelta(
+                        seconds=timeout - (_time.monotonic() - start_time))
+        attempt = 0
 
-                _ObjectStore.set_string_object(self._bucket, self._key,
-                                               self._lockstring)
+        # This is the first time we are trying to get a lock
+        while True:
+            attempt += 1
+            self._end_lease = now + _datetime.timedelta(seconds=lease_time)
+            self._lockstring = "%s %s" % (self._secret,
+                                          self._end_lease.timestamp())
+
+            # try to take the mutex, which only succeeds if no-one
+            # else holds it. This needs only a single request if the
+            # mutex is free
+            etag = _ObjectStore.set_object_if_absent(
+                                self._bucket, self._key,
+                                self._lockstring.encode("utf-8"))
+
+            if etag is None:
+                # someone else holds the mutex - take it only if
+                # their lease has expired (and no-one else has taken
+                # it in the meantime)
+                try:
+                    (holder, holder_etag) = _ObjectStore.get_object_with_etag(
+                                                    self._bucket, self._key)
+                    holder = holder.decode("utf-8")
+                except:
+                    holder = None
+
+                if holder is not None:
+                    end_lease = float(holder.split()[1])
+
+                    if now > _datetime.datetime.fromtimestamp(end_lease):
+                        # the lease from the other holder has expired :-)
+                        etag = _ObjectStore.set_object_if_match(
+                                    self._bucket, self._key,
+                                    self._lockstring.encode("utf-8"),
+                                    holder_etag)
+
+            if etag is not None:
+                # the conditional write succeeded, so we hold the mutex
+                with self._state_lock:
+                    self._etag = etag
+                    self._lease_time = lease_time
+                    self._is_locked = 1
+                    self._locked_at = _time.monotonic()
+                    self._stats["num_locks"] += 1
+                    self._stats["num_attempts"] += attempt
+                    self._record_time("wait", self._locked_at - start_time)
 
-                holder = _ObjectStore.get_string_object(self._bucket,
-                                                        self._key)
-            else:
-                self._lockstring = None
+                return
 
-            if holder == self._lockstring:
-                # it looks like we are the holder - read and write again
-                # just to make sure
-                holder = _ObjectStore.get_string_object(self._bucket,
-                                                        self._key)
+            self._lockstring = None
 
-                if holder == self._lockstring:
-                    # write again just to make sure
-                    _ObjectStore.set_string_object(self._bucket, self._key,
-                                                   self._lockstring)
+            # wait before trying again, backing off exponentially with
+            # random ("full") jitter, but never past the timeout
+            remaining = (endtime - _datetime.datetime.now()).total_seconds()
 
-                    holder = _ObjectStore.get_string_object(self._bucket,
-                                                            self._key)
+            if remaining <= 0:
+                break
 
-            if holder == self._lockstring:
-                # we have read and written our secret to the object store
-                # three times. While a race condition is still possible,
-                # I'd hope it is now highly unlikely - we now hold the mutex
-                self._is_locked = 1
-                return
+            backoff = min(self._max_backoff,
+                          self._min_backoff * (2 ** min(attempt, 32)))
 
-            # only try the lock 4 times a second
-            _time.sleep(0.25)
+            _time.sleep(min(remaining, _random.uniform(self._min_backoff,
+                                                       backoff)))
 
             now = _datetime.datetime.now()
 
+        with self._state_lock:
+            self._stats["num_attempts"] += attempt
+
         raise MutexTimeoutError("Cannot acquire a mutex lock on the "
                                 "key '%s'" % self._key)
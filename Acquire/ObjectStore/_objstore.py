@@ -4,100 +4,404 @@ import datetime as _datetime
 import uuid as _uuid
 import json as _json
 import os as _os
+import time as _time
+import functools as _functools
 
 from ._errors import ObjectStoreError
+from ._statistics import ObjectStoreStatistics as _ObjectStoreStatistics
 
 __all__ = ["ObjectStore", "set_object_store_backend",
            "use_testing_object_store_backend",
+           "use_memory_object_store_backend",
+           "use_sqlite_object_store_backend",
            "use_oci_object_store_backend"]
 
 _objstore_backend = None
 
+# the statistics of calls made via ObjectStore, or None if statistics
+# are not being recorded
+_statistics = None
+
+# the ObjectStoreTrace that is recording the calls made via ObjectStore,
+# or None if calls are not being traced
+_trace = None
+
 
 def use_testing_object_store_backend(backend):
+    """Use the Testing_ObjectStore backend, returning the bucket in the
+       directory 'backend'. If another local backend (e.g.
+       Memory_ObjectStore) has already been set then this is kept,
+       and the same bucket name is returned
+    """
     from ._testing_objstore import Testing_ObjectStore as _Testing_ObjectStore
-    set_object_store_backend(_Testing_ObjectStore)
+
+    if not _is_local_backend(_objstore_backend):
+        set_object_store_backend(_Testing_ObjectStore)
+
     return "%s/testing_objstore" % backend
 
 
+def use_memory_object_store_backend(latency=None):
+    """Use the Memory_ObjectStore backend, optionally setting the
+       simulated 'latency' (in seconds) added to every call"""
+    from ._memory_objstore import Memory_ObjectStore as _Memory_ObjectStore
+    set_object_store_backend(_Memory_ObjectStore)
+
+    if latency is not None:
+        _Memory_ObjectStore.set_latency(latency)
+
+
+def use_sqlite_object_store_backend():
+    """Use the SQLite_ObjectStore backend"""
+    from ._sqlite_objstore import SQLite_ObjectStore as _SQLite_ObjectStore
+    set_object_store_backend(_SQLite_ObjectStore)
+
+
 def use_oci_object_store_backend():
     from ._oci_objstore import OCI_ObjectStore as _OCI_ObjectStore
     set_object_store_backend(_OCI_ObjectStore)
 
 
+def _record_call(statistics, trace, operation, args, kwargs, start,
+                 elapsed, result=None, error=False, size=None):
+    """Internal function that records the call to 'operation', which
+       started at (monotonic) time 'start' and took 'elapsed' seconds,
+       into 'statistics' and 'trace' (either of which may be None)"""
+    if statistics is not None:
+        statistics.record(operation, args, elapsed, result, error=error,
+                          size=size)
+
+    if trace is not None:
+        trace.record(operation, args, kwargs, elapsed, result, error=error,
+                     size=size, start=start)
+
+
+def _record_names(names, record, elapsed):
+    """Internal generator that yields the object names from 'names'
+       (as returned by iter_object_names), adding the time spent
+       fetching the names to 'elapsed'. The total time and number of
+       bytes of names are passed to 'record' once the iteration
+       finishes, fails or is abandoned
+    """
+    size = 0
+    error = False
+    names = iter(names)
+
+    try:
+        while True:
+            start = _time.monotonic()
+
+            try:
+                name = next(names)
+            except StopIteration:
+                return
+            except:
+                error = True
+                raise
+            finally:
+                elapsed += _time.monotonic() - start
+
+            size += len(name)
+            yield name
+    finally:
+        record(elapsed, size, error)
+
+
+class _RecordedStream(_io.RawIOBase):
+    """Internal class that wraps the stream returned by open_object,
+       adding up the time spent reading the stream and the number of
+       bytes read. These are passed to 'record' when the stream is
+       closed (or garbage collected)
+    """
+    def __init__(self, stream, record, elapsed):
+        _io.RawIOBase.__init__(self)
+        self._stream = stream
+        self._record = record
+        self._elapsed = elapsed
+        self._size = 0
+        self._error = False
+
+    def readable(self):
+        """Return whether or not this stream can be read (it can)"""
+        return True
+
+    def seekable(self):
+        """Return whether or not the wrapped stream can seek"""
+        return self._stream.seekable()
+
+    def tell(self):
+        """Return the current position in the stream"""
+        return self._stream.tell()
+
+    def readinto(self, buffer):
+        """Read data into the passed writable 'buffer', returning the
+           number of bytes read (zero at the end of the stream)"""
+        start = _time.monotonic()
+
+        try:
+            nbytes = self._stream.readinto(buffer)
+        except:
+            self._error = True
+            raise
+        finally:
+            self._elapsed += _time.monotonic() - start
+
+        if nbytes:
+            self._size += nbytes
+
+        return nbytes
+
+    def seek(self, offset, whence=_io.SEEK_SET):
+        """Seek to 'offset' in the wrapped stream, counting any data
+           that is skipped as having been read"""
+        start = _time.monotonic()
+        position = self._stream.tell()
+
+        try:
+            result = self._stream.seek(offset, whence)
+        except:
+            self._error = True
+            raise
+        finally:
+            self._elapsed += _time.monotonic() - start
+
+        # skipped data is still read from the object store
+        self._size += max(0, result - position)
+
+        return result
+
+    def close(self):
+        """Close the wrapped stream and record the call"""
+        if self.closed:
+            return
+
+        try:
+            self._stream.close()
+        finally:
+            _io.RawIOBase.close(self)
+            self._record(self._elapsed, self._size, self._error)
+
+
+def _instrument(func):
+    """Decorator that records the time taken, bytes transferred and any
+       error raised by each call to the wrapped ObjectStore function,
+       if statistics have been enabled, and that records the call
+       into the current trace, if calls are being traced. The names
+       returned by iter_object_names and the streams returned by
+       open_object are wrapped, so that the time spent iterating
+       or reading them, and the bytes received, are recorded
+       once they have been used"""
+    operation = func.__name__
+
+    @_functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        statistics = _statistics
+        trace = _trace
+
+        if statistics is None and trace is None:
+            return func(*args, **kwargs)
+
+        start = _time.monotonic()
+
+        try:
+            result = func(*args, **kwargs)
+        except:
+            _record_call(statistics, trace, operation, args, kwargs, start,
+                         _time.monotonic() - start, error=True)
+            raise
+
+        elapsed = _time.monotonic() - start
+
+        if operation in ("iter_object_names", "open_object"):
+            def record(elapsed, size, error):
+                _record_call(statistics, trace, operation, args, kwargs,
+                             start, elapsed, error=error, size=size)
+
+            if operation == "iter_object_names":
+                return _record_names(result, record, elapsed)
+            else:
+                return _io.BufferedReader(_RecordedStream(result, record,
+                                                          elapsed))
+
+        _record_call(statistics, trace, operation, args, kwargs, start,
+                     elapsed, result)
+
+        return result
+
+    return wrapper
+
+
 class ObjectStore:
     @staticmethod
+    @_instrument
     def get_object_as_file(bucket, key, filename):
         return _objstore_backend.get_object_as_file(bucket, key, filename)
 
     @staticmethod
+    @_instrument
     def get_object(bucket, key):
         return _objstore_backend.get_object(bucket, key)
 
     @staticmethod
+    @_instrument
+    def open_object(bucket, key):
+        return _objstore_backend.open_object(bucket, key)
+
+    @staticmethod
+    @_instrument
     def get_string_object(bucket, key):
         return _objstore_backend.get_string_object(bucket, key)
 
     @staticmethod
+    @_instrument
     def get_object_from_json(bucket, key):
         return _objstore_backend.get_object_from_json(bucket, key)
 
     @staticmethod
+    @_instrument
+    def get_objects(bucket, keys):
+        return _objstore_backend.get_objects(bucket, keys)
+
+    @staticmethod
+    @_instrument
+    def get_objects_from_json(bucket, keys):
+        return _objstore_backend.get_objects_from_json(bucket, keys)
+
+    @staticmethod
+    @_instrument
     def get_all_object_names(bucket, prefix=None):
         return _objstore_backend.get_all_object_names(bucket, prefix)
 
     @staticmethod
+    @_instrument
+    def iter_object_names(bucket, prefix=None, start_after=None, limit=None):
+        return _objstore_backend.iter_object_names(bucket, prefix,
+                                                   start_after, limit)
+
+    @staticmethod
+    @_instrument
     def get_all_objects(bucket, prefix=None):
         return _objstore_backend.get_all_objects(bucket, prefix)
 
     @staticmethod
+    @_instrument
     def get_all_strings(bucket, prefix=None):
         return _objstore_backend.get_all_strings(bucket, prefix)
 
     @staticmethod
+    @_instrument
     def set_object(bucket, key, data):
         _objstore_backend.set_object(bucket, key, data)
 
     @staticmethod
-    def set_object_from_file(bucket, key, filename):
-        _objstore_backend.set_object_from_file(bucket, key, filename)
+    @_instrument
+    def get_object_with_etag(bucket, key):
+        return _objstore_backend.get_object_with_etag(bucket, key)
+
+    @staticmethod
+    @_instrument
+    def set_object_if_match(bucket, key, data, etag):
+        return _objstore_backend.set_object_if_match(bucket, key, data, etag)
+
+    @staticmethod
+    @_instrument
+    def set_object_if_absent(bucket, key, data):
+        return _objstore_backend.set_object_if_absent(bucket, key, data)
+
+    @staticmethod
+    @_instrument
+    def set_object_from_file(bucket, key, filename, part_size=None):
+        _objstore_backend.set_object_from_file(bucket, key, filename,
+                                               part_size)
 
     @staticmethod
+    @_instrument
     def set_string_object(bucket, key, string_data):
         _objstore_backend.set_string_object(bucket, key, string_data)
 
     @staticmethod
+    @_instrument
     def set_object_from_json(bucket, key, data):
         _objstore_backend.set_object_from_json(bucket, key, data)
 
     @staticmethod
+    @_instrument
     def log(bucket, message, prefix="log"):
         _objstore_backend.log(bucket, message, prefix)
 
     @staticmethod
+    @_instrument
     def delete_all_objects(bucket, prefix=None):
         _objstore_backend.delete_all_objects(bucket, prefix)
 
     @staticmethod
+    @_instrument
     def get_log(bucket, log="log"):
-        _objstore_backend.get_log(bucket, log)
+        return _objstore_backend.get_log(bucket, log)
 
     @staticmethod
+    @_instrument
     def clear_log(bucket, log="log"):
         _objstore_backend.clear_log(bucket, log)
 
     @staticmethod
+    @_instrument
     def delete_object(bucket, key):
         _objstore_backend.delete_object(bucket, key)
 
     @staticmethod
+    @_instrument
+    def delete_objects(bucket, keys):
+        return _objstore_backend.delete_objects(bucket, keys)
+
+    @staticmethod
+    @_instrument
     def clear_all_except(bucket, keys):
         _objstore_backend.clear_all_except(bucket, keys)
 
+    @staticmethod
+    def enable_statistics(prefix_depth=1):
+        """Start recording statistics of all calls made via ObjectStore,
+           grouping keys by their first 'prefix_depth' parts"""
+        global _statistics
+        _statistics = _ObjectStoreStatistics(prefix_depth)
+
+    @staticmethod
+    def disable_statistics():
+        """Stop recording statistics of calls made via ObjectStore"""
+        global _statistics
+        _statistics = None
+
+    @staticmethod
+    def reset_statistics():
+        """Clear all of the statistics that have been recorded so far"""
+        if _statistics is not None:
+            _statistics.reset()
+
+    @staticmethod
+    def get_statistics():
+        """Return a dictionary snapshot of the call counts, latency
+           histograms, bytes in and out and error counts for each
+           operation (and each key prefix) made via ObjectStore,
+           or None if statistics are not being recorded"""
+        if _statistics is None:
+            return None
+        else:
+            return _statistics.to_data()
+
+
+def _set_trace(trace):
+    """Internal function used by ObjectStoreTrace to start (or stop,
+       if 'trace' is None) recording the calls made via ObjectStore"""
+    global _trace
+    _trace = trace
+
 
 def set_object_store_backend(backend):
     """Set the backend that is used to actually connect to
-       the object store. This can only be set once in the program!
+       the object store. This can only be set once in the program,
+       although the backend can be replaced by a wrapper around
+       itself, e.g. CachingObjectStore(backend)
     """
     global _objstore_backend
 
@@ -105,7 +409,42 @@ def set_object_store_backend(backend):
         return
 
     if _objstore_backend is not None:
-        raise ObjectStoreError("You cannot change the object store "
-                               "backend once it has been already set!")
+        if _get_wrapped_backend(backend) != \
+                _get_wrapped_backend(_objstore_backend):
+            raise ObjectStoreError("You cannot change the object store "
+                                   "backend once it has been already set!")
+
+        # this is the same backend, but either 'backend' is a wrapper
+        # around the current backend (e.g. a CachingObjectStore), in
+        # which case we switch to the wrapper, or the current backend
+        # already wraps 'backend', in which case we keep the wrapper
+        if backend is _get_wrapped_backend(backend):
+            return
 
     _objstore_backend = backend
+
+
+def _is_local_backend(backend):
+    """Return whether or not 'backend' is (or wraps) one of the local
+       backends that can be used in testing mode"""
+    if backend is None:
+        return False
+
+    from ._testing_objstore import Testing_ObjectStore as _Testing_ObjectStore
+    from ._memory_objstore import Memory_ObjectStore as _Memory_ObjectStore
+    from ._sqlite_objstore import SQLite_ObjectStore as _SQLite_ObjectStore
+
+    return _get_wrapped_backend(backend) in (_Testing_ObjectStore,
+                                             _Memory_ObjectStore,
+                                             _SQLite_ObjectStore)
+
+
+def _get_wrapped_backend(backend):
+    """Return the actual backend that is wrapped by 'backend'. Wrapping
+       backends (e.g. CachingObjectStore) provide a 'wrapped_backend'
+       function that returns the backend that they wrap
+    """
+    while hasattr(backend, "wrapped_backend"):
+        backend = backend.wrapped_backend()
+
+    return backend
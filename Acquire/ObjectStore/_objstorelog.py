@@ -0,0 +1,148 @@
+
+import datetime as _datetime
+import threading as _threading
+import uuid as _uuid
+
+from ._compression import decode_json_object as _decode_json_object
+
+__all__ = ["ObjectStoreLog"]
+
+
+def _get_segment_prefix(log):
+    """Return the prefix under which the segments of 'log' are written.
+       Segments are written to 'log.segments/<timestamp>-<uid>', so that
+       they sort in time order, and are kept out of 'log/' as older
+       readers of the log expect every name there to be a timestamp
+    """
+    return "%s.segments" % log
+
+
+class ObjectStoreLog:
+    """This is an append-buffered writer for a log in the object store.
+       Rather than writing a new object for every message (as is done
+       by ObjectStore.log), messages are buffered and written together
+       as a single segment object whenever the buffer holds more than
+       'max_segment_size' bytes of messages, or 'max_segment_age'
+       seconds after the first message in the buffer was logged.
+       Call 'flush' to write the buffer immediately, and 'close' (or
+       use this as a context manager) to write any remaining messages.
+       The log is read using ObjectStore.get_log as normal, e.g.
+
+       with ObjectStoreLog(bucket) as log:
+           log.log("Hello")
+           log.log("World")
+
+       print(ObjectStore.get_log(bucket))
+    """
+    def __init__(self, bucket, log="log", max_segment_size=65536,
+                 max_segment_age=10):
+        self._bucket = bucket
+        self._log = str(log)
+        self._max_segment_size = int(max_segment_size)
+        self._max_segment_age = float(max_segment_age)
+        self._lock = _threading.RLock()
+        self._messages = []
+        self._size = 0
+        self._timer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def __str__(self):
+        return "ObjectStoreLog(log=%s, num_buffered=%d)" % \
+            (self._log, len(self._messages))
+
+    def log(self, message):
+        """Append the passed message to the log"""
+        message = str(message)
+        timestamp = _datetime.datetime.utcnow().timestamp()
+
+        with self._lock:
+            self._messages.append([timestamp, message])
+            self._size += len(message)
+
+            if self._size >= self._max_segment_size:
+                self.flush()
+            elif self._timer is None:
+                self._timer = _threading.Timer(self._max_segment_age,
+                                               self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write all of the buffered messages to a new log segment"""
+        from ._objstore import ObjectStore as _ObjectStore
+
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if len(self._messages) == 0:
+                return
+
+            key = "%s/%017.6f-%s" % (_get_segment_prefix(self._log),
+                                     self._messages[0][0],
+                                     _uuid.uuid4().hex[0:8])
+
+            _ObjectStore.set_object_from_json(self._bucket, key,
+                                              self._messages)
+
+            self._messages = []
+            self._size = 0
+
+    def close(self):
+        """Write any remaining buffered messages"""
+        self.flush()
+
+
+def _get_log(backend, bucket, log="log"):
+    """Return the complete log at 'log' in 'bucket' as an xml string,
+       read using 'backend'. This includes both the segments written
+       by ObjectStoreLog and the individual messages written by
+       ObjectStore.log. All of these are fetched together using
+       'get_objects', which backends can run in parallel
+    """
+    segment_prefix = _get_segment_prefix(log)
+
+    names = backend.get_all_object_names(bucket, log)
+    segment_names = backend.get_all_object_names(bucket, segment_prefix)
+
+    keys = ["%s/%s" % (log, name) for name in names]
+    segment_keys = ["%s/%s" % (segment_prefix, name)
+                    for name in segment_names]
+
+    if len(keys) + len(segment_keys) > 0:
+        objects = backend.get_objects(bucket, keys + segment_keys)
+    else:
+        objects = {}
+
+    messages = []
+
+    for key in segment_keys:
+        messages += _decode_json_object(objects[key])
+
+    for (name, key) in zip(names, keys):
+        try:
+            messages.append([float(name), objects[key].decode("utf-8")])
+        except:
+            pass
+
+    messages.sort(key=lambda m: m[0])
+
+    lines = []
+    lines.append("<log>")
+
+    for (timestamp, message) in messages:
+        lines.append("<logitem>")
+        lines.append("<timestamp>%s</timestamp>" %
+                     _datetime.datetime.fromtimestamp(float(timestamp)))
+        lines.append("<message>%s</message>" % message)
+        lines.append("</logitem>")
+
+    lines.append("</log>")
+
+    return "".join(lines)
@@ -0,0 +1,128 @@
+
+import io as _io
+
+__all__ = ["ObjectStream"]
+
+
+class ObjectStream(_io.RawIOBase):
+    """This is a read-only stream over the data of an object in the
+       object store. The data is read incrementally from a set of
+       sources (e.g. the numbered chunks of a chunked object), each
+       of which is only opened when the stream reaches it, so that
+       the whole object is never held in memory. The stream can
+       only seek forwards, which is performed by reading and
+       discarding the skipped data
+    """
+    def __init__(self, sources):
+        """Construct the stream from the passed list of 'sources'. Each
+           source is a function that returns an iterator over the
+           blocks of bytes for that part of the object
+        """
+        _io.RawIOBase.__init__(self)
+        self._sources = list(sources)
+        self._blocks = None
+        self._block = b""
+        self._offset = 0
+        self._position = 0
+
+    def readable(self):
+        """Return whether or not this stream can be read (it can)"""
+        return True
+
+    def seekable(self):
+        """Return whether or not this stream can seek. This stream
+           can seek, but only forwards"""
+        return True
+
+    def tell(self):
+        """Return the current position in the stream"""
+        return self._position
+
+    def _next_block(self):
+        """Internal function that returns the next non-empty block
+           of data, or None if there is no more data"""
+        while True:
+            if self._blocks is not None:
+                for block in self._blocks:
+                    if len(block) > 0:
+                        return block
+
+                self._close_blocks()
+
+            if len(self._sources) == 0:
+                return None
+
+            self._blocks = iter(self._sources.pop(0)())
+
+    def _close_blocks(self):
+        """Internal function that closes the current source"""
+        try:
+            self._blocks.close()
+        except:
+            pass
+
+        self._blocks = None
+
+    def readinto(self, buffer):
+        """Read data into the passed writable 'buffer', returning the
+           number of bytes read (zero at the end of the stream)"""
+        view = memoryview(buffer).cast("B")
+
+        if len(view) == 0:
+            return 0
+
+        while self._offset >= len(self._block):
+            block = self._next_block()
+
+            if block is None:
+                return 0
+
+            self._block = block
+            self._offset = 0
+
+        count = min(len(view), len(self._block) - self._offset)
+
+        view[0:count] = memoryview(self._block)[self._offset:
+                                                self._offset + count]
+
+        self._offset += count
+        self._position += count
+
+        return count
+
+    def seek(self, offset, whence=_io.SEEK_SET):
+        """Seek forwards to 'offset' (relative to the start of the stream
+           if 'whence' is SEEK_SET, or to the current position if 'whence'
+           is SEEK_CUR), returning the new position. Seeking past the
+           end of the stream leaves the position at the end"""
+        if whence == _io.SEEK_CUR:
+            offset += self._position
+        elif whence != _io.SEEK_SET:
+            raise _io.UnsupportedOperation(
+                "An object stream cannot seek relative to its end")
+
+        if offset < self._position:
+            raise _io.UnsupportedOperation(
+                "An object stream cannot seek backwards (from %d to %d)" %
+                (self._position, offset))
+
+        buffer = bytearray(min(offset - self._position, 1024 * 1024))
+
+        while self._position < offset:
+            view = memoryview(buffer)[0:min(len(buffer),
+                                            offset - self._position)]
+
+            if self.readinto(view) == 0:
+                break
+
+        return self._position
+
+    def close(self):
+        """Close the stream, releasing the current source"""
+        if self._blocks is not None:
+            self._close_blocks()
+
+        self._sources = []
+        self._block = b""
+
+        _io.RawIOBase.close(self)
@@ -4,11 +4,269 @@ import datetime as _datetime
 import uuid as _uuid
 import json as _json
 import os as _os
+import time as _time
+import hashlib as _hashlib
+import base64 as _base64
+import itertools as _itertools
+
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
 
 from ._errors import ObjectStoreError
+from ._compression import encode_json_object as _encode_json_object
+from ._compression import decode_json_object as _decode_json_object
+from ._objstorelog import _get_log
+from ._objstorelog import _get_segment_prefix
+from ._deletion import PrefixTrie as _PrefixTrie
+from ._deletion import check_deleted as _check_deleted
+from ._objstream import ObjectStream as _ObjectStream
+from ._chunked import get_chunk_keys as _get_chunk_keys
+from ._chunked import get_listed_chunk_keys as _get_listed_chunk_keys
 
 __all__ = ["OCI_ObjectStore"]
 
+# The maximum number of requests that will be issued in parallel to
+# the object store when fetching or writing several objects at once
+_max_parallel_requests = 16
+
+# The maximum number of object names to request per page when
+# listing the contents of a bucket
+_max_list_page_size = 1000
+
+# Files that are larger than this are uploaded using a multipart upload,
+# in parts of size _multipart_part_size, with at most _max_parallel_parts
+# parts uploaded (and held in memory) at once. Each part is retried up
+# to _max_part_retries times before the upload is aborted
+_multipart_threshold = 64 * 1024 * 1024
+_multipart_part_size = 32 * 1024 * 1024
+_max_parallel_parts = 4
+_max_part_retries = 3
+
+# OCI requires every part of a multipart upload except the last to be
+# at least this large
+_min_part_size = 10 * 1024 * 1024
+
+
+def _run_in_parallel(func, items):
+    """Internal function that calls 'func' on every item in 'items'
+       using a bounded pool of threads. This returns the list of
+       results, in the same order as 'items'. Any exception raised
+       by 'func' is re-raised in the calling thread
+    """
+    items = list(items)
+
+    if len(items) == 0:
+        return []
+    elif len(items) == 1:
+        return [func(items[0])]
+
+    nthreads = min(len(items), _max_parallel_requests)
+
+    with _ThreadPoolExecutor(max_workers=nthreads) as pool:
+        return list(pool.map(func, items))
+
+
+def _delete_object(bucket, key):
+    """Internal function that deletes the object at 'key' in 'bucket',
+       returning None if this succeeded (or there was no object), or
+       the error message if the deletion failed"""
+    try:
+        bucket["client"].delete_object(bucket["namespace"],
+                                       bucket["bucket_name"],
+                                       key)
+    except Exception as e:
+        if getattr(e, "status", None) == 404:
+            return None
+
+        return str(e)
+
+    return None
+
+
+def _get_response(bucket, key):
+    """Internal function that returns the response from getting
+       the object at 'key' in 'bucket'"""
+    return bucket["client"].get_object(bucket["namespace"],
+                                       bucket["bucket_name"],
+                                       key)
+
+
+def _is_precondition_failure(e):
+    """Internal function that returns whether or not the passed exception
+       was raised because the condition of a conditional write failed"""
+    return getattr(e, "status", None) in (409, 412)
+
+
+def _read_response(response):
+    """Internal function that reads all of the data from the passed
+       get_object response. The streamed blocks are collected into
+       a list and joined once at the end, so that the data is only
+       copied once
+    """
+    blocks = []
+
+    for block in response.data.raw.stream(1024 * 1024,
+                                          decode_content=False):
+        blocks.append(block)
+
+    return b"".join(blocks)
+
+
+def _read_chunk(bucket, key, chunk_key):
+    """Internal function that returns the data in the chunk at
+       'chunk_key' of the chunked object at 'key'"""
+    try:
+        return _read_response(_get_response(bucket, chunk_key))
+    except Exception as e:
+        raise ObjectStoreError("Missing chunk '%s' of the object at key "
+                               "'%s': %s" % (chunk_key, key, str(e)))
+
+
+def _chunk_source(bucket, key, chunk_key):
+    """Internal function that returns a function that opens the
+       chunk at 'chunk_key' of the chunked object at 'key' and returns
+       an iterator over its data. This is used to stream the chunks
+       one after another, only opening each chunk when it is needed
+    """
+    def _open():
+        try:
+            response = _get_response(bucket, chunk_key)
+        except Exception as e:
+            raise ObjectStoreError("Missing chunk '%s' of the object at "
+                                   "key '%s': %s" % (chunk_key, key, str(e)))
+
+        return response.data.raw.stream(1024 * 1024, decode_content=False)
+
+    return _open
+
+
+def _get_blocks(bucket, key):
+    """Internal function that gets the object at 'key' in 'bucket',
+       returning the tuple (blocks, chunk_keys). If the object is the
+       manifest of a chunked object then 'blocks' is None and
+       'chunk_keys' are the keys of its chunks. Otherwise 'chunk_keys'
+       is None and 'blocks' iterates over the blocks of the object's
+       data. Only the first block is read here, so reading a plain
+       object costs only a single request. Chunked objects written
+       before chunk manifests were added have no object at 'key', so
+       are found by listing their chunks
+    """
+    try:
+        response = _get_response(bucket, key)
+    except:
+        chunk_keys = _get_listed_chunk_keys(
+                        key, OCI_ObjectStore.iter_object_names(bucket, key))
+
+        if chunk_keys is None:
+            raise
+
+        return (None, chunk_keys)
+
+    blocks = iter(response.data.raw.stream(1024 * 1024,
+                                           decode_content=False))
+    first = next(blocks, b"")
+
+    chunk_keys = _get_chunk_keys(key, first)
+
+    if chunk_keys is None:
+        return (_itertools.chain([first], blocks), None)
+    else:
+        return (None, chunk_keys)
+
+
+def _upload_part(bucket, key, upload_id, filename, part_num, part_size):
+    """Internal function that uploads part 'part_num' (counting from 1)
+       of the file 'filename' as part of the multipart upload 'upload_id'.
+       The part is read from the file here, so that only the parts that
+       are being uploaded are held in memory. The upload is retried
+       up to _max_part_retries times, and this returns the
+       ETag of the uploaded part
+    """
+    with open(filename, "rb") as f:
+        f.seek((part_num - 1) * part_size)
+        data = f.read(part_size)
+
+    md5 = _base64.b64encode(_hashlib.md5(data).digest()).decode("utf-8")
+
+    attempt = 0
+
+    while True:
+        attempt += 1
+
+        try:
+            response = bucket["client"].upload_part(
+                                bucket["namespace"], bucket["bucket_name"],
+                                key, upload_id, part_num, data,
+                                content_md5=md5)
+            return response.headers["etag"]
+        except Exception as e:
+            if attempt >= _max_part_retries:
+                raise ObjectStoreError(
+                    "Failed to upload part %d of '%s' to '%s': %s" %
+                    (part_num, filename, key, str(e)))
+
+            _time.sleep(0.5 * 2**attempt)
+
+
+def _multipart_upload(bucket, key, filename, part_size):
+    """Internal function that uploads the file 'filename' to 'key' in
+       'bucket' using a multipart upload, uploading the parts of size
+       'part_size' in parallel. The upload is aborted if any part
+       cannot be uploaded
+    """
+    try:
+        from oci.object_storage.models import \
+            CreateMultipartUploadDetails as _CreateMultipartUploadDetails
+        from oci.object_storage.models import \
+            CommitMultipartUploadDetails as _CommitMultipartUploadDetails
+        from oci.object_storage.models import \
+            CommitMultipartUploadPartDetails as \
+            _CommitMultipartUploadPartDetails
+    except:
+        raise ImportError(
+            "Cannot import OCI. Please install OCI, e.g. via "
+            "'pip install oci' so that you can connect to the "
+            "Oracle Cloud Infrastructure")
+
+    size = _os.path.getsize(filename)
+    num_parts = max(1, (size + part_size - 1) // part_size)
+
+    upload_id = bucket["client"].create_multipart_upload(
+                    bucket["namespace"], bucket["bucket_name"],
+                    _CreateMultipartUploadDetails(object=key)).data.upload_id
+
+    part_nums = list(range(1, num_parts+1))
+
+    try:
+        etags = []
+
+        # upload the parts in batches so that only a limited number
+        # of parts are held in memory at any one time
+        for i in range(0, num_parts, _max_parallel_parts):
+            batch = part_nums[i:i+_max_parallel_parts]
+
+            etags += _run_in_parallel(
+                        lambda part_num: _upload_part(bucket, key, upload_id,
+                                                      filename, part_num,
+                                                      part_size), batch)
+
+        parts = [_CommitMultipartUploadPartDetails(part_num=part_num,
+                                                   etag=etag)
+                 for (part_num, etag) in zip(part_nums, etags)]
+
+        bucket["client"].commit_multipart_upload(
+                    bucket["namespace"], bucket["bucket_name"], key,
+                    upload_id,
+                    _CommitMultipartUploadDetails(parts_to_commit=parts))
+    except:
+        try:
+            bucket["client"].abort_multipart_upload(
+                    bucket["namespace"], bucket["bucket_name"], key,
+                    upload_id)
+        except:
+            pass
+
+        raise
+
 
 class OCI_ObjectStore:
     """This is the backend that abstracts using the Oracle Cloud
@@ -21,106 +279,68 @@ class OCI_ObjectStore:
            and writing this to the file called 'filename'"""
 
         try:
-            response = bucket["client"].get_object(bucket["namespace"],
-                                                   bucket["bucket_name"],
-                                                   key)
-            is_chunked = False
+            (blocks, chunk_keys) = _get_blocks(bucket, key)
         except:
-            try:
-                response = bucket["client"].get_object(bucket["namespace"],
-                                                       bucket["bucket_name"],
-                                                       "%s/1" % key)
-                is_chunked = True
-            except:
-                is_chunked = False
-                pass
+            raise ObjectStoreError("No object at key '%s'" % key)
 
-            if not is_chunked:
-                raise ObjectStoreError("No object at key '%s'" % key)
-
-        if not is_chunked:
+        if chunk_keys is None:
             with open(filename, 'wb') as f:
-                for chunk in response.data.raw.stream(1024 * 1024,
-                                                      decode_content=False):
-                    f.write(chunk)
+                for block in blocks:
+                    f.write(block)
 
             return filename
 
-        # the data is chunked - get this out chunk by chunk
+        # the data is chunked - download the chunks in parallel, in
+        # batches so that only a limited number are held in memory,
+        # and write them to the file in order
         with open(filename, 'wb') as f:
-            next_chunk = 1
-            while True:
-                for chunk in response.data.raw.stream(1024 * 1024,
-                                                      decode_content=False):
-                    f.write(chunk)
-
-                # now get and write the rest of the chunks
-                next_chunk += 1
-
-                try:
-                    response = bucket["client"].get_object(
-                        bucket["namespace"], bucket["bucket_name"],
-                        "%s/%d" % (key, next_chunk))
-                except:
-                    break
+            for i in range(0, len(chunk_keys), _max_parallel_requests):
+                batch = chunk_keys[i:i+_max_parallel_requests]
+
+                for data in _run_in_parallel(
+                        lambda k: _read_chunk(bucket, key, k), batch):
+                    f.write(data)
+
+        return filename
 
     @staticmethod
     def get_object(bucket, key):
         """Return the binary data contained in the key 'key' in the
-           passed bucket"""
+           passed bucket. If the data was uploaded as a set of numbered
+           chunks ('key/1', 'key/2' etc.), with a chunk manifest at 'key',
+           then these are downloaded in parallel and joined together"""
 
         try:
-            response = bucket["client"].get_object(bucket["namespace"],
-                                                   bucket["bucket_name"],
-                                                   key)
-            is_chunked = False
+            (blocks, chunk_keys) = _get_blocks(bucket, key)
         except:
-            try:
-                response = bucket["client"].get_object(bucket["namespace"],
-                                                       bucket["bucket_name"],
-                                                       "%s/1" % key)
-                is_chunked = True
-            except:
-                is_chunked = False
-                pass
+            raise ObjectStoreError("No data at key '%s'" % key)
 
-            # Raise the original error
-            if not is_chunked:
-                raise ObjectStoreError("No data at key '%s'" % key)
+        if chunk_keys is None:
+            return b"".join(blocks)
 
-        data = None
-
-        for chunk in response.data.raw.stream(1024 * 1024,
-                                              decode_content=False):
-            if not data:
-                data = chunk
-            else:
-                data += chunk
+        return b"".join(_run_in_parallel(
+                            lambda k: _read_chunk(bucket, key, k),
+                            chunk_keys))
 
-        if is_chunked:
-            # keep going through to find more chunks
-            next_chunk = 1
+    @staticmethod
+    def open_object(bucket, key):
+        """Return a read-only file-like object that streams the binary
+           data contained in the key 'key' in the passed bucket. The
+           data is downloaded as it is read (chunk by chunk for chunked
+           objects), and the stream can only seek forwards"""
 
-            while True:
-                next_chunk += 1
+        try:
+            (blocks, chunk_keys) = _get_blocks(bucket, key)
+        except:
+            raise ObjectStoreError("No data at key '%s'" % key)
 
-                try:
-                    response = bucket["client"].get_object(
-                                        bucket["namespace"],
-                                        bucket["bucket_name"],
-                                        "%s/%d" % (key, next_chunk))
-                except:
-                    response = None
-                    break
-
-                for chunk in response.data.raw.stream(1024 * 1024,
-                                                      decode_content=False):
-                    if not data:
-                        data = chunk
-                    else:
-                        data += chunk
+        if chunk_keys is None:
+            sources = [lambda: blocks]
+        else:
+            sources = [_chunk_source(bucket, key, chunk_key)
+                       for chunk_key in chunk_keys]
 
-        return data
+        return _io.BufferedReader(_ObjectStream(sources), 1024 * 1024)
 
     @staticmethod
     def get_string_object(bucket, key):
@@ -136,43 +356,134 @@ class OCI_ObjectStore:
         data = None
 
         try:
-            data = OCI_ObjectStore.get_string_object(bucket, key)
+            data = OCI_ObjectStore.get_object(bucket, key)
         except:
             return None
 
-        return _json.loads(data)
+        return _decode_json_object(data)
+
+    @staticmethod
+    def get_objects(bucket, keys):
+        """Return the binary data contained in all of the passed 'keys'
+           in 'bucket', as a dictionary indexed by key. The objects
+           are fetched in parallel. This raises an ObjectStoreError
+           if there is no data at any of the keys
+        """
+        keys = list(keys)
+
+        values = _run_in_parallel(
+                    lambda key: OCI_ObjectStore.get_object(bucket, key), keys)
+
+        return dict(zip(keys, values))
+
+    @staticmethod
+    def get_objects_from_json(bucket, keys):
+        """Return the objects constructed from the json stored at all
+           of the passed 'keys' in 'bucket', as a dictionary indexed
+           by key. The objects are fetched in parallel. The value is
+           None for any key that does not hold any data
+        """
+        keys = list(keys)
+
+        values = _run_in_parallel(
+                    lambda key: OCI_ObjectStore.get_object_from_json(bucket,
+                                                                     key),
+                    keys)
+
+        return dict(zip(keys, values))
 
     @staticmethod
     def get_all_object_names(bucket, prefix=None):
         """Returns the names of all objects in the passed bucket"""
-        objects = bucket["client"].list_objects(bucket["namespace"],
-                                                bucket["bucket_name"],
-                                                prefix=prefix).data
+        return list(OCI_ObjectStore.iter_object_names(bucket, prefix))
 
-        names = []
+    @staticmethod
+    def iter_object_names(bucket, prefix=None, start_after=None, limit=None):
+        """Iterate over the names of the objects in the passed bucket
+           whose keys start with 'prefix', in sorted order. The names
+           are requested from the object store one page at a time, so
+           the full listing is never held in memory. If 'start_after'
+           is passed then only names that sort after this name are
+           returned, and if 'limit' is passed then at most 'limit'
+           names are returned
+        """
+        if prefix:
+            # only list the objects that are 'in' the prefix, so that
+            # e.g. the prefix 'a/b' does not also list 'a/bc/d'
+            prefix = "%s/" % prefix
+        else:
+            prefix = None
+
+        if start_after is None:
+            start = None
+        elif prefix:
+            start = "%s%s" % (prefix, start_after)
+        else:
+            start = str(start_after)
+
+        if limit is not None:
+            limit = int(limit)
 
-        for obj in objects.objects:
-            if prefix:
-                if obj.name.startswith(prefix):
-                    names.append(obj.name[len(prefix)+1:])
+        count = 0
+
+        while True:
+            if limit is None:
+                page_size = _max_list_page_size
+            elif count >= limit:
+                return
             else:
-                names.append(obj.name)
+                # request one extra name in case 'start' is returned
+                page_size = min(limit - count + 1, _max_list_page_size)
+
+            objects = bucket["client"].list_objects(bucket["namespace"],
+                                                    bucket["bucket_name"],
+                                                    prefix=prefix,
+                                                    start=start,
+                                                    limit=page_size).data
+
+            for obj in objects.objects:
+                if start_after is not None and obj.name == start:
+                    # the 'start' of the listing is inclusive
+                    continue
+
+                if prefix:
+                    if obj.name.startswith(prefix):
+                        yield obj.name[len(prefix):]
+                    else:
+                        continue
+                else:
+                    yield obj.name
+
+                count += 1
+
+                if limit is not None and count >= limit:
+                    return
+
+            start = objects.next_start_with
 
-        return names
+            if start is None:
+                return
+
+            # the next page starts with the first name that has not
+            # yet been returned, so must be included
+            start_after = None
 
     @staticmethod
     def get_all_objects(bucket, prefix=None):
         """Return all of the objects in the passed bucket"""
-        objects = {}
         names = OCI_ObjectStore.get_all_object_names(bucket, prefix)
 
         if prefix:
-            for name in names:
-                objects[name] = OCI_ObjectStore.get_object(
-                                        bucket, "%s/%s" % (prefix, name))
+            keys = ["%s/%s" % (prefix, name) for name in names]
         else:
-            for name in names:
-                objects[name] = OCI_ObjectStore.get_object(bucket, name)
+            keys = names
+
+        data = OCI_ObjectStore.get_objects(bucket, keys)
+
+        objects = {}
+
+        for (name, key) in zip(names, keys):
+            objects[name] = data[key]
 
         return objects
 
@@ -202,9 +513,85 @@ class OCI_ObjectStore:
                                     key, f)
 
     @staticmethod
-    def set_object_from_file(bucket, key, filename):
+    def get_object_with_etag(bucket, key):
+        """Return a tuple of the binary data contained in the key 'key'
+           in the passed bucket, together with its ETag. The ETag changes
+           whenever the object is changed, so can be passed to
+           'set_object_if_match' to update the object only if no-one
+           else has changed it since it was read"""
+        try:
+            response = _get_response(bucket, key)
+        except:
+            raise ObjectStoreError("No data at key '%s'" % key)
+
+        return (_read_response(response), response.headers["etag"])
+
+    @staticmethod
+    def set_object_if_match(bucket, key, data, etag):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           the ETag of the object currently at 'key' is 'etag'. This
+           returns the new ETag of the object if the write succeeded,
+           or None if the object had been changed (or deleted)"""
+        try:
+            response = bucket["client"].put_object(bucket["namespace"],
+                                                   bucket["bucket_name"],
+                                                   key, _io.BytesIO(data),
+                                                   if_match=etag)
+        except Exception as e:
+            if _is_precondition_failure(e) or getattr(e, "status",
+                                                      None) == 404:
+                return None
+
+            raise ObjectStoreError("Cannot write to key '%s': %s" %
+                                   (key, str(e)))
+
+        return response.headers["etag"]
+
+    @staticmethod
+    def set_object_if_absent(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           there is no object at 'key'. This returns the ETag of the
+           new object if the write succeeded, or None if there
+           was already an object at this key"""
+        try:
+            response = bucket["client"].put_object(bucket["namespace"],
+                                                   bucket["bucket_name"],
+                                                   key, _io.BytesIO(data),
+                                                   if_none_match="*")
+        except Exception as e:
+            if _is_precondition_failure(e):
+                return None
+
+            raise ObjectStoreError("Cannot write to key '%s': %s" %
+                                   (key, str(e)))
+
+        return response.headers["etag"]
+
+    @staticmethod
+    def set_object_from_file(bucket, key, filename, part_size=None):
         """Set the value of 'key' in 'bucket' to equal the contents
-           of the file located by 'filename'"""
+           of the file located by 'filename'. Large files are uploaded
+           in parallel as a multipart upload with parts of 'part_size'
+           bytes, which must be at least the minimum part size allowed
+           by OCI (10 MiB). If 'part_size' is not set, then a default
+           part size is used for files larger than the multipart
+           threshold"""
+
+        if part_size is None:
+            if _os.path.getsize(filename) > _multipart_threshold:
+                part_size = _multipart_part_size
+        else:
+            part_size = int(part_size)
+
+            if part_size < _min_part_size:
+                raise ValueError(
+                    "The part size (%d bytes) must be at least %d bytes" %
+                    (part_size, _min_part_size))
+
+        if part_size is not None and \
+                _os.path.getsize(filename) > part_size:
+            _multipart_upload(bucket, key, filename, part_size)
+            return
 
         with open(filename, 'rb') as f:
             bucket["client"].put_object(bucket["namespace"],
@@ -220,7 +607,8 @@ class OCI_ObjectStore:
     def set_object_from_json(bucket, key, data):
         """Set the value of 'key' in 'bucket' to equal to contents
            of 'data', which has been encoded to json"""
-        OCI_ObjectStore.set_string_object(bucket, key, _json.dumps(data))
+        OCI_ObjectStore.set_object(bucket, key,
+                                   _encode_json_object(key, data))
 
     @staticmethod
     def log(bucket, message, prefix="log"):
@@ -235,50 +623,62 @@ class OCI_ObjectStore:
 
     @staticmethod
     def delete_all_objects(bucket, prefix=None):
-        """Deletes all objects..."""
+        """Deletes all objects whose keys start with 'prefix' (or all
+           objects in the bucket if 'prefix' is None). The objects are
+           deleted in parallel, one page of the listing at a time. This
+           raises an ObjectStoreError listing any objects that could
+           not be deleted, once all deletions have been attempted. The
+           object at 'prefix' itself is also deleted, as the listing
+           only includes the objects under 'prefix/'
+        """
+        failures = {}
 
         if prefix:
-            for obj in OCI_ObjectStore.get_all_object_names(bucket, prefix):
-                if len(obj) == 0:
-                    bucket["client"].delete_object(bucket["namespace"],
-                                                   bucket["bucket_name"],
-                                                   prefix)
-                else:
-                    bucket["client"].delete_object(bucket["namespace"],
-                                                   bucket["bucket_name"],
-                                                   "%s/%s" % (prefix, obj))
+            keys = [prefix]
         else:
-            for obj in OCI_ObjectStore.get_all_object_names(bucket):
-                bucket["client"].delete_object(bucket["namespace"],
-                                               bucket["bucket_name"],
-                                               obj)
+            keys = []
 
-    @staticmethod
-    def get_log(bucket, log="log"):
-        """Return the complete log as an xml string"""
-        objs = OCI_ObjectStore.get_all_strings(bucket, log)
+        for obj in OCI_ObjectStore.iter_object_names(bucket, prefix):
+            if not prefix:
+                keys.append(obj)
+            else:
+                keys.append("%s/%s" % (prefix, obj))
+
+            if len(keys) >= _max_list_page_size:
+                failures.update(OCI_ObjectStore.delete_objects(bucket, keys))
+                keys = []
 
-        lines = []
-        lines.append("<log>")
+        failures.update(OCI_ObjectStore.delete_objects(bucket, keys))
 
-        timestamps = list(objs.keys())
-        timestamps.sort()
+        _check_deleted(failures)
+
+    @staticmethod
+    def delete_objects(bucket, keys):
+        """Delete all of the objects at the passed 'keys' in 'bucket',
+           in parallel. This returns a dictionary of the error message
+           for each key whose object could not be deleted (which is
+           empty if all deletions succeeded). Keys that have no
+           object are not counted as failures
+        """
+        keys = list(keys)
 
-        for timestamp in timestamps:
-            lines.append("<logitem>")
-            lines.append("<timestamp>%s</timestamp>" %
-                         _datetime.datetime.fromtimestamp(float(timestamp)))
-            lines.append("<message>%s</message>" % objs[timestamp])
-            lines.append("</logitem>")
+        errors = _run_in_parallel(lambda key: _delete_object(bucket, key),
+                                  keys)
 
-        lines.append("</log>")
+        return {key: error for (key, error) in zip(keys, errors)
+                if error is not None}
 
-        return "".join(lines)
+    @staticmethod
+    def get_log(bucket, log="log"):
+        """Return the complete log as an xml string"""
+        return _get_log(OCI_ObjectStore, bucket, log)
 
     @staticmethod
     def clear_log(bucket, log="log"):
         """Clears out the log"""
         OCI_ObjectStore.delete_all_objects(bucket, log)
+        OCI_ObjectStore.delete_all_objects(bucket,
+                                           _get_segment_prefix(log))
 
     @staticmethod
     def delete_object(bucket, key):
@@ -293,18 +693,23 @@ class OCI_ObjectStore:
     @staticmethod
     def clear_all_except(bucket, keys):
         """Removes all objects from the passed 'bucket' except those
-           whose keys are or start with any key in 'keys'"""
-        names = OCI_ObjectStore.get_all_object_names(bucket)
+           whose keys are or start with any key in 'keys'. The objects
+           are deleted in parallel, and this raises an ObjectStoreError
+           listing any objects that could not be deleted"""
+        keep = _PrefixTrie(keys)
+        failures = {}
+        names = []
 
-        for name in names:
-            remove = True
+        for name in OCI_ObjectStore.iter_object_names(bucket):
+            if keep.matches(name):
+                continue
+
+            names.append(name)
+
+            if len(names) >= _max_list_page_size:
+                failures.update(OCI_ObjectStore.delete_objects(bucket, names))
+                names = []
 
-            for key in keys:
-                if name.startswith(key):
-                    remove = False
-                    break
+        failures.update(OCI_ObjectStore.delete_objects(bucket, names))
 
-            if remove:
-                bucket["client"].delete_object(bucket["namespace"],
-                                               bucket["bucket_name"],
-                                               name)
+        _check_deleted(failures)
@@ -0,0 +1,393 @@
+
+import hashlib as _hashlib
+import heapq as _heapq
+
+from ._caching_objstore import _bucket_id
+from ._deletion import check_deleted as _check_deleted
+from ._objstorelog import _get_log
+from ._objstorelog import _get_segment_prefix
+
+__all__ = ["ShardedBucket", "ShardedObjectStore"]
+
+
+def _hash(s):
+    """Return a stable (not randomised per process) hash of 's'"""
+    return int(_hashlib.md5(s.encode("utf-8")).hexdigest()[0:8], 16)
+
+
+def _unique(buckets):
+    """Return the passed buckets with any duplicates removed"""
+    seen = set()
+    result = []
+
+    for bucket in buckets:
+        bucket_id = _bucket_id(bucket)
+
+        if bucket_id not in seen:
+            seen.add(bucket_id)
+            result.append(bucket)
+
+    return result
+
+
+class ShardedBucket:
+    """This is a logical bucket whose keys are spread over several
+       real buckets. Keys under each sharded prefix (e.g. 'accounts')
+       are placed in one of that prefix's buckets, chosen using a
+       hash of the first 'depth' parts of the key after the prefix
+       (e.g. the account UID), so that all of the keys that share
+       those parts are held in the same bucket and can be listed
+       together. All other keys are placed in the default bucket.
+       Use this with a ShardedObjectStore backend, e.g.
+
+       bucket = ShardedBucket(default_bucket)
+       bucket.add_shard("accounts", [bucket_0, bucket_1, bucket_2])
+       bucket.add_shard("transactions", [bucket_3])
+    """
+    def __init__(self, default_bucket, shards=None):
+        """Construct from the 'default_bucket' and a list of
+           (prefix, buckets, depth) for each sharded prefix"""
+        self._default = default_bucket
+        self._shards = []
+
+        if shards is not None:
+            for shard in shards:
+                self.add_shard(*shard)
+
+    def __str__(self):
+        return "ShardedBucket(%s, prefixes=%s)" % \
+            (_bucket_id(self._default), [s[0] for s in self._shards])
+
+    def add_shard(self, prefix, buckets, depth=1):
+        """Place the keys that start with 'prefix' into 'buckets', choosing
+           the bucket from the first 'depth' parts of the key after
+           'prefix'. Note that existing objects are not moved"""
+        prefix = str(prefix).rstrip("/")
+        buckets = list(buckets)
+
+        if len(prefix) == 0 or len(buckets) == 0:
+            from ._errors import ObjectStoreError
+            raise ObjectStoreError(
+                "A shard needs a prefix and at least one bucket")
+
+        self._shards = [s for s in self._shards if s[0] != prefix]
+        self._shards.append((prefix, buckets, max(1, int(depth))))
+
+        # match the longest prefix first
+        self._shards.sort(key=lambda s: len(s[0]), reverse=True)
+
+    def default_bucket(self):
+        """Return the bucket that holds all unsharded keys"""
+        return self._default
+
+    def all_buckets(self):
+        """Return all of the real buckets"""
+        buckets = [self._default]
+
+        for shard in self._shards:
+            buckets += shard[1]
+
+        return _unique(buckets)
+
+    def _find_shard(self, key):
+        """Return the tuple (shard, parts) of the shard containing 'key'
+           and the parts of the key after the shard prefix, or
+           (None, None) if the key is not sharded"""
+        for shard in self._shards:
+            prefix = shard[0]
+
+            if key == prefix:
+                return (shard, [])
+            elif key.startswith(prefix) and key[len(prefix)] == "/":
+                return (shard, [p for p in key[len(prefix)+1:].split("/")
+                                if len(p) > 0])
+
+        return (None, None)
+
+    def get_bucket(self, key):
+        """Return the real bucket that holds the object at 'key'"""
+        (shard, parts) = self._find_shard(key)
+
+        if shard is None:
+            return self._default
+
+        buckets = shard[1]
+
+        if len(buckets) == 1:
+            return buckets[0]
+
+        return buckets[_hash("/".join(parts[0:shard[2]])) % len(buckets)]
+
+    def get_buckets(self, prefix=None):
+        """Return the real buckets that may hold objects whose keys
+           start with 'prefix' (or all buckets if 'prefix' is None)"""
+        if not prefix:
+            return self.all_buckets()
+
+        prefix = prefix.rstrip("/")
+
+        (shard, parts) = self._find_shard(prefix)
+
+        if shard is not None:
+            if len(parts) >= shard[2]:
+                # all of these keys share the hashed parts
+                return [self.get_bucket(prefix)]
+            else:
+                return list(shard[1])
+
+        # the prefix is not sharded, but may contain sharded prefixes
+        buckets = [self._default]
+
+        for shard in self._shards:
+            if shard[0].startswith("%s/" % prefix):
+                buckets += shard[1]
+
+        return _unique(buckets)
+
+
+class ShardedObjectStore:
+    """This is a backend that wraps another object store backend so that
+       the keys of a ShardedBucket are transparently read from, and
+       written to, the real bucket that holds them. Listings of
+       prefixes that span several buckets are merged. Buckets that
+       are not ShardedBuckets are passed straight to the wrapped
+       backend. Use this by wrapping the real backend, e.g.
+
+       set_object_store_backend(ShardedObjectStore(OCI_ObjectStore))
+    """
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __str__(self):
+        return "ShardedObjectStore(%s)" % self._backend.__name__
+
+    def wrapped_backend(self):
+        """Return the backend that is wrapped by this object"""
+        return self._backend
+
+    @staticmethod
+    def _bucket(bucket, key):
+        """Return the real bucket that holds 'key'"""
+        if isinstance(bucket, ShardedBucket):
+            return bucket.get_bucket(key)
+        else:
+            return bucket
+
+    @staticmethod
+    def _buckets(bucket, prefix=None):
+        """Return the real buckets that hold keys under 'prefix'"""
+        if isinstance(bucket, ShardedBucket):
+            return bucket.get_buckets(prefix)
+        else:
+            return [bucket]
+
+    @staticmethod
+    def _group(bucket, keys):
+        """Return a list of (real bucket, keys) that groups the passed
+           keys by the real bucket that holds them"""
+        if not isinstance(bucket, ShardedBucket):
+            return [(bucket, list(keys))]
+
+        groups = {}
+
+        for key in keys:
+            real_bucket = bucket.get_bucket(key)
+            bucket_id = _bucket_id(real_bucket)
+
+            try:
+                groups[bucket_id][1].append(key)
+            except KeyError:
+                groups[bucket_id] = (real_bucket, [key])
+
+        return list(groups.values())
+
+    def get_object_as_file(self, bucket, key, filename):
+        """Get the object contained in the key 'key' in the passed 'bucket'
+           and writing this to the file called 'filename'"""
+        return self._backend.get_object_as_file(self._bucket(bucket, key),
+                                                key, filename)
+
+    def get_object(self, bucket, key):
+        """Return the binary data contained in the key 'key' in the
+           passed bucket"""
+        return self._backend.get_object(self._bucket(bucket, key), key)
+
+    def open_object(self, bucket, key):
+        """Return a read-only file-like object that streams the binary
+           data contained in the key 'key' in the passed bucket"""
+        return self._backend.open_object(self._bucket(bucket, key), key)
+
+    def get_string_object(self, bucket, key):
+        """Return the string in 'bucket' associated with 'key'"""
+        return self._backend.get_string_object(self._bucket(bucket, key),
+                                               key)
+
+    def get_object_from_json(self, bucket, key):
+        """Return an object constructed from json stored at 'key' in
+           the passed bucket. This returns None if there is no data
+           at this key
+        """
+        return self._backend.get_object_from_json(self._bucket(bucket, key),
+                                                  key)
+
+    def get_objects(self, bucket, keys):
+        """Return the binary data contained in all of the passed 'keys'
+           in 'bucket', as a dictionary indexed by key"""
+        objects = {}
+
+        for (real_bucket, group) in self._group(bucket, keys):
+            objects.update(self._backend.get_objects(real_bucket, group))
+
+        return objects
+
+    def get_objects_from_json(self, bucket, keys):
+        """Return the objects constructed from the json stored at all
+           of the passed 'keys' in 'bucket', as a dictionary indexed
+           by key"""
+        objects = {}
+
+        for (real_bucket, group) in self._group(bucket, keys):
+            objects.update(self._backend.get_objects_from_json(real_bucket,
+                                                               group))
+
+        return objects
+
+    def get_all_object_names(self, bucket, prefix=None):
+        """Returns the names of all objects in the passed bucket"""
+        names = []
+
+        for real_bucket in self._buckets(bucket, prefix):
+            names += self._backend.get_all_object_names(real_bucket, prefix)
+
+        return names
+
+    def iter_object_names(self, bucket, prefix=None, start_after=None,
+                          limit=None):
+        """Iterate over the names of the objects in the passed bucket
+           whose keys start with 'prefix', in sorted order. The sorted
+           listings of each real bucket are merged together"""
+        buckets = self._buckets(bucket, prefix)
+
+        if len(buckets) == 1:
+            return self._backend.iter_object_names(buckets[0], prefix,
+                                                   start_after, limit)
+
+        names = _heapq.merge(*[self._backend.iter_object_names(
+                                    real_bucket, prefix, start_after, limit)
+                               for real_bucket in buckets])
+
+        if limit is not None:
+            import itertools as _itertools
+            names = _itertools.islice(names, int(limit))
+
+        return names
+
+    def get_all_objects(self, bucket, prefix=None):
+        """Return all of the objects in the passed bucket"""
+        objects = {}
+
+        for real_bucket in self._buckets(bucket, prefix):
+            objects.update(self._backend.get_all_objects(real_bucket, prefix))
+
+        return objects
+
+    def get_all_strings(self, bucket, prefix=None):
+        """Return all of the strings in the passed bucket"""
+        objects = {}
+
+        for real_bucket in self._buckets(bucket, prefix):
+            objects.update(self._backend.get_all_strings(real_bucket, prefix))
+
+        return objects
+
+    def set_object(self, bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data'"""
+        self._backend.set_object(self._bucket(bucket, key), key, data)
+
+    def get_object_with_etag(self, bucket, key):
+        """Return a tuple of the binary data contained in the key 'key'
+           in the passed bucket, together with its ETag"""
+        return self._backend.get_object_with_etag(self._bucket(bucket, key),
+                                                  key)
+
+    def set_object_if_match(self, bucket, key, data, etag):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           the ETag of the object currently at 'key' is 'etag'"""
+        return self._backend.set_object_if_match(self._bucket(bucket, key),
+                                                 key, data, etag)
+
+    def set_object_if_absent(self, bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           there is no object at 'key'"""
+        return self._backend.set_object_if_absent(self._bucket(bucket, key),
+                                                  key, data)
+
+    def set_object_from_file(self, bucket, key, filename, part_size=None):
+        """Set the value of 'key' in 'bucket' to equal the contents
+           of the file located by 'filename'"""
+        self._backend.set_object_from_file(self._bucket(bucket, key), key,
+                                           filename, part_size)
+
+    def set_string_object(self, bucket, key, string_data):
+        """Set the value of 'key' in 'bucket' to the string 'string_data'"""
+        self._backend.set_string_object(self._bucket(bucket, key), key,
+                                        string_data)
+
+    def set_object_from_json(self, bucket, key, data):
+        """Set the value of 'key' in 'bucket' to equal to contents
+           of 'data', which has been encoded to json"""
+        self._backend.set_object_from_json(self._bucket(bucket, key), key,
+                                           data)
+
+    def log(self, bucket, message, prefix="log"):
+        """Log the the passed message to the object store"""
+        self._backend.log(self._bucket(bucket, prefix), message, prefix)
+
+    def delete_all_objects(self, bucket, prefix=None):
+        """Deletes all objects whose keys start with 'prefix'"""
+        for real_bucket in self._buckets(bucket, prefix):
+            self._backend.delete_all_objects(real_bucket, prefix)
+
+    def get_log(self, bucket, log="log"):
+        """Return the complete log as an xml string"""
+        if not isinstance(bucket, ShardedBucket):
+            return self._backend.get_log(bucket, log)
+
+        return _get_log(self, bucket, log)
+
+    def clear_log(self, bucket, log="log"):
+        """Clears out the log"""
+        buckets = self._buckets(bucket, log) + \
+            self._buckets(bucket, _get_segment_prefix(log))
+
+        for real_bucket in _unique(buckets):
+            self._backend.clear_log(real_bucket, log)
+
+    def delete_object(self, bucket, key):
+        """Removes the object at 'key'"""
+        self._backend.delete_object(self._bucket(bucket, key), key)
+
+    def delete_objects(self, bucket, keys):
+        """Delete all of the objects at the passed 'keys' in 'bucket',
+           returning a dictionary of the error for each key whose
+           object could not be deleted"""
+        failures = {}
+
+        for (real_bucket, group) in self._group(bucket, keys):
+            failures.update(self._backend.delete_objects(real_bucket, group))
+
+        return failures
+
+    def clear_all_except(self, bucket, keys):
+        """Removes all objects from the passed 'bucket' except those
+           whose keys are or start with any key in 'keys'"""
+        keys = list(keys)
+        failures = {}
+
+        for real_bucket in self._buckets(bucket):
+            try:
+                self._backend.clear_all_except(real_bucket, keys)
+            except Exception as e:
+                failures[str(_bucket_id(real_bucket))] = str(e)
+
+        _check_deleted(failures)
@@ -0,0 +1,507 @@
+
+import datetime as _datetime
+import hashlib as _hashlib
+import io as _io
+import os as _os
+import sqlite3 as _sqlite3
+import threading as _threading
+
+from contextlib import contextmanager as _contextmanager
+
+from ._errors import ObjectStoreError
+from ._compression import encode_json_object as _encode_json_object
+from ._compression import decode_json_object as _decode_json_object
+from ._objstorelog import _get_log
+from ._objstorelog import _get_segment_prefix
+from ._deletion import PrefixTrie as _PrefixTrie
+from ._chunked import get_chunk_keys as _get_chunk_keys
+from ._chunked import get_listed_chunk_keys as _get_listed_chunk_keys
+
+__all__ = ["SQLite_ObjectStore"]
+
+# the name of the database file that is created in each bucket directory
+_database_name = "objects.sqlite"
+
+# how long (in seconds) to wait for another writer to release the database
+_busy_timeout = 60
+
+# the connections to the bucket databases, one set per thread
+_connections = _threading.local()
+
+
+def _get_etag(data):
+    """Return the ETag of the passed binary data. As for
+       Testing_ObjectStore, this depends only on the contents"""
+    return _hashlib.md5(data).hexdigest()
+
+
+def _connect(bucket):
+    """Return this thread's connection to the database for 'bucket',
+       creating the database (in WAL mode) if it doesn't exist. The
+       objects are held in a table whose primary key is the object
+       key, so the keys are indexed in sorted order
+    """
+    bucket = str(bucket)
+
+    try:
+        return _connections.databases[bucket]
+    except AttributeError:
+        _connections.databases = {}
+    except KeyError:
+        pass
+
+    _os.makedirs(bucket, exist_ok=True)
+
+    # autocommit mode - explicit transactions are used where needed
+    connection = _sqlite3.connect("%s/%s" % (bucket, _database_name),
+                                  timeout=_busy_timeout,
+                                  isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("CREATE TABLE IF NOT EXISTS objects "
+                       "(key TEXT PRIMARY KEY, data BLOB NOT NULL) "
+                       "WITHOUT ROWID")
+
+    _connections.databases[bucket] = connection
+
+    return connection
+
+
+@_contextmanager
+def _transaction(connection, begin="BEGIN"):
+    """Run the body of the 'with' block in a transaction on 'connection',
+       started with 'begin'. The transaction is committed if the body
+       completes (or returns), and is rolled back if it raises, so
+       that a failure part way through never leaves partial changes
+    """
+    connection.execute(begin)
+
+    try:
+        yield
+    except:
+        connection.execute("ROLLBACK")
+        raise
+
+    connection.execute("COMMIT")
+
+
+def _normalise_prefix(prefix):
+    """Return 'prefix' without any trailing '/', or None if this leaves
+       an empty prefix, so that e.g. 'a/b/' lists the same objects as
+       'a/b' (as for Testing_ObjectStore)"""
+    if prefix:
+        prefix = prefix.rstrip("/")
+
+    if prefix:
+        return prefix
+    else:
+        return None
+
+
+def _prefix_range(prefix):
+    """Return the (lower, upper) bounds of the keys that start with the
+       directory 'prefix', i.e. 'prefix/' up to (but excluding) 'prefix0',
+       as '0' is the character that sorts immediately after '/'
+    """
+    return ("%s/" % prefix, "%s0" % prefix)
+
+
+def _get_names(connection, prefix=None, start_after=None, limit=None):
+    """Return the sorted names (relative to 'prefix') of the objects whose
+       keys start with 'prefix' that sort after 'start_after'"""
+    prefix = _normalise_prefix(prefix)
+
+    if prefix:
+        (lower, upper) = _prefix_range(prefix)
+    else:
+        (lower, upper) = ("", None)
+
+    conditions = ["key >= ?"]
+    values = [lower]
+
+    if upper is not None:
+        conditions.append("key < ?")
+        values.append(upper)
+
+    if start_after is not None:
+        conditions.append("key > ?")
+        values.append("%s%s" % (lower, start_after))
+
+    sql = "SELECT key FROM objects WHERE %s ORDER BY key" % \
+        " AND ".join(conditions)
+
+    if limit is not None:
+        sql += " LIMIT %d" % int(limit)
+
+    return [row[0][len(lower):] for row in connection.execute(sql, values)]
+
+
+def _get_data(connection, key):
+    """Return the data at 'key', or None if there is no object"""
+    row = connection.execute("SELECT data FROM objects WHERE key = ?",
+                             (key,)).fetchone()
+
+    if row is None:
+        return None
+    else:
+        return bytes(row[0])
+
+
+def _join_chunks(connection, key, data):
+    """Internal function that returns the data of the object at 'key',
+       where 'data' is the data stored at 'key' (or None if there is
+       none), joining together the numbered chunks if this is a
+       chunked object. Chunked objects written before chunk manifests
+       were added have no data at 'key', so are found by listing.
+       This returns None if there is no object at 'key'
+    """
+    if data is None:
+        chunk_keys = _get_listed_chunk_keys(key, _get_names(connection, key))
+    else:
+        chunk_keys = _get_chunk_keys(key, data)
+
+    if chunk_keys is None:
+        return data
+
+    chunks = []
+
+    for chunk_key in chunk_keys:
+        chunk = _get_data(connection, chunk_key)
+
+        if chunk is None:
+            raise ObjectStoreError("No object at key '%s'" % chunk_key)
+
+        chunks.append(chunk)
+
+    return b"".join(chunks)
+
+
+def _get_object(bucket, key):
+    """Internal function that returns the data at 'key', joining
+       together the numbered chunks if this is a chunked object"""
+    connection = _connect(bucket)
+    data = _join_chunks(connection, key, _get_data(connection, key))
+
+    if data is None:
+        raise ObjectStoreError("No object at key '%s'" % key)
+
+    return data
+
+
+def _get_objects(bucket, keys, join_chunks=False):
+    """Internal function that returns the data at all of 'keys'
+       (or None for the keys with no data), read in a single
+       transaction so that the objects are consistent. The
+       chunks of chunked objects are joined if 'join_chunks'
+    """
+    connection = _connect(bucket)
+    objects = {}
+
+    with _transaction(connection):
+        for key in keys:
+            data = _get_data(connection, key)
+
+            if join_chunks:
+                data = _join_chunks(connection, key, data)
+
+            objects[key] = data
+
+    return objects
+
+
+def _set_object(bucket, key, data):
+    """Internal function that sets the object at 'key' to 'data'"""
+    _connect(bucket).execute("INSERT OR REPLACE INTO objects (key, data) "
+                             "VALUES (?, ?)", (key, bytes(data)))
+
+
+def _get_all_objects(bucket, prefix=None):
+    """Internal function that returns all objects under 'prefix'"""
+    prefix = _normalise_prefix(prefix)
+
+    if prefix:
+        (lower, upper) = _prefix_range(prefix)
+        rows = _connect(bucket).execute(
+                "SELECT key, data FROM objects WHERE key >= ? AND key < ? "
+                "ORDER BY key", (lower, upper))
+    else:
+        lower = ""
+        rows = _connect(bucket).execute(
+                "SELECT key, data FROM objects ORDER BY key")
+
+    connection = _connect(bucket)
+
+    return {row[0][len(lower):]: _join_chunks(connection, row[0],
+                                              bytes(row[1]))
+            for row in rows.fetchall()}
+
+
+def _get_all_strings(bucket, prefix=None):
+    """Internal function that returns all objects under 'prefix' that
+       can be decoded as strings"""
+    objects = {}
+
+    for (name, data) in _get_all_objects(bucket, prefix).items():
+        try:
+            objects[name] = data.decode("utf-8")
+        except:
+            pass
+
+    return objects
+
+
+def _delete_all_objects(bucket, prefix=None):
+    """Internal function that deletes all objects under 'prefix'"""
+    prefix = _normalise_prefix(prefix)
+
+    if prefix:
+        _connect(bucket).execute(
+            "DELETE FROM objects WHERE key >= ? AND key < ?",
+            _prefix_range(prefix))
+    else:
+        _connect(bucket).execute("DELETE FROM objects")
+
+
+class SQLite_ObjectStore:
+    """This is an object store that holds all of the objects in a bucket
+       in a single SQLite database file in the bucket directory (e.g.
+       the directory used for a Testing_ObjectStore bucket). The objects
+       are stored in a table indexed by key, so listing the keys
+       under a prefix is a range scan of the index rather than a walk
+       over the directory tree, and there is no file per object. The
+       database is used in WAL mode so that readers do not block the
+       writer, with one connection per thread, and conditional writes
+       are made in transactions so are atomic between processes.
+
+       Select this backend before logging in, e.g.
+
+       set_object_store_backend(SQLite_ObjectStore)
+    """
+
+    @staticmethod
+    def get_object_as_file(bucket, key, filename):
+        """Get the object contained in the key 'key' in the passed 'bucket'
+           and writing this to the file called 'filename'"""
+        data = _get_object(bucket, key)
+
+        with open(filename, "wb") as FILE:
+            FILE.write(data)
+
+        return filename
+
+    @staticmethod
+    def get_object(bucket, key):
+        """Return the binary data contained in the key 'key' in the
+           passed bucket"""
+        return _get_object(bucket, key)
+
+    @staticmethod
+    def open_object(bucket, key):
+        """Return a read-only file-like object that reads the binary
+           data contained in the key 'key' in the passed bucket"""
+        return _io.BufferedReader(_io.BytesIO(_get_object(bucket, key)))
+
+    @staticmethod
+    def get_string_object(bucket, key):
+        """Return the string in 'bucket' associated with 'key'"""
+        return _get_object(bucket, key).decode("utf-8")
+
+    @staticmethod
+    def get_object_from_json(bucket, key):
+        """Return an object constructed from json stored at 'key' in
+           the passed bucket. This returns None if there is no data
+           at this key
+        """
+        try:
+            data = _get_object(bucket, key)
+        except:
+            return None
+
+        return _decode_json_object(data)
+
+    @staticmethod
+    def get_objects(bucket, keys):
+        """Return the binary data contained in all of the passed 'keys'
+           in 'bucket', as a dictionary indexed by key. This raises
+           an ObjectStoreError if there is no data at any of the keys
+        """
+        objects = _get_objects(bucket, keys, join_chunks=True)
+
+        for (key, data) in objects.items():
+            if data is None:
+                raise ObjectStoreError("No object at key '%s'" % key)
+
+        return objects
+
+    @staticmethod
+    def get_objects_from_json(bucket, keys):
+        """Return the objects constructed from the json stored at all
+           of the passed 'keys' in 'bucket', as a dictionary indexed
+           by key. The value is None for any key that does not
+           hold any data
+        """
+        objects = _get_objects(bucket, keys)
+
+        for (key, data) in objects.items():
+            if data is not None:
+                objects[key] = _decode_json_object(data)
+
+        return objects
+
+    @staticmethod
+    def get_all_object_names(bucket, prefix=None):
+        """Returns the names of all objects in the passed bucket"""
+        return _get_names(_connect(bucket), prefix)
+
+    @staticmethod
+    def iter_object_names(bucket, prefix=None, start_after=None, limit=None):
+        """Iterate over the names of the objects in the passed bucket
+           whose keys start with 'prefix', in sorted order. If
+           'start_after' is passed then only names that sort after
+           this name are returned, and if 'limit' is passed then
+           at most 'limit' names are returned
+        """
+        return iter(_get_names(_connect(bucket), prefix, start_after, limit))
+
+    @staticmethod
+    def get_all_objects(bucket, prefix=None):
+        """Return all of the objects in the passed bucket"""
+        return _get_all_objects(bucket, prefix)
+
+    @staticmethod
+    def get_all_strings(bucket, prefix=None):
+        """Return all of the strings in the passed bucket"""
+        return _get_all_strings(bucket, prefix)
+
+    @staticmethod
+    def set_object(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data'"""
+        _set_object(bucket, key, data)
+
+    @staticmethod
+    def get_object_with_etag(bucket, key):
+        """Return a tuple of the binary data contained in the key 'key'
+           in the passed bucket, together with its ETag"""
+        data = _get_data(_connect(bucket), key)
+
+        if data is None:
+            raise ObjectStoreError("No object at key '%s'" % key)
+
+        return (data, _get_etag(data))
+
+    @staticmethod
+    def set_object_if_match(bucket, key, data, etag):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           the ETag of the object currently at 'key' is 'etag'. This
+           returns the new ETag of the object if the write succeeded,
+           or None if the object had been changed (or deleted)"""
+        connection = _connect(bucket)
+
+        # take the write lock before reading, so that no other
+        # process can change the object between the read and write
+        with _transaction(connection, "BEGIN IMMEDIATE"):
+            current = _get_data(connection, key)
+
+            if current is None or _get_etag(current) != etag:
+                return None
+
+            connection.execute("UPDATE objects SET data = ? WHERE key = ?",
+                               (bytes(data), key))
+
+        return _get_etag(data)
+
+    @staticmethod
+    def set_object_if_absent(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           there is no object at 'key'. This returns the ETag of the
+           new object if the write succeeded, or None if there
+           was already an object at this key"""
+        cursor = _connect(bucket).execute(
+                    "INSERT OR IGNORE INTO objects (key, data) VALUES (?, ?)",
+                    (key, bytes(data)))
+
+        if cursor.rowcount != 1:
+            return None
+
+        return _get_etag(data)
+
+    @staticmethod
+    def set_object_from_file(bucket, key, filename, part_size=None):
+        """Set the value of 'key' in 'bucket' to equal the contents
+           of the file located by 'filename'. The 'part_size' is
+           ignored as files are copied in one go"""
+        with open(filename, "rb") as FILE:
+            _set_object(bucket, key, FILE.read())
+
+    @staticmethod
+    def set_string_object(bucket, key, string_data):
+        """Set the value of 'key' in 'bucket' to the string 'string_data'"""
+        _set_object(bucket, key, string_data.encode("utf-8"))
+
+    @staticmethod
+    def set_object_from_json(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to equal to contents
+           of 'data', which has been encoded to json"""
+        _set_object(bucket, key, _encode_json_object(key, data))
+
+    @staticmethod
+    def log(bucket, message, prefix="log"):
+        """Log the the passed message to the object store in
+           the bucket with key "key/timestamp" (defaults
+           to "log/timestamp"
+        """
+        _set_object(bucket,
+                    "%s/%s" % (prefix,
+                               _datetime.datetime.utcnow().timestamp()),
+                    str(message).encode("utf-8"))
+
+    @staticmethod
+    def delete_all_objects(bucket, prefix=None):
+        """Deletes all objects..."""
+        _delete_all_objects(bucket, prefix)
+
+    @staticmethod
+    def get_log(bucket, log="log"):
+        """Return the complete log as an xml string"""
+        return _get_log(SQLite_ObjectStore, bucket, log)
+
+    @staticmethod
+    def clear_log(bucket, log="log"):
+        """Clears out the log"""
+        _delete_all_objects(bucket, log)
+        _delete_all_objects(bucket, _get_segment_prefix(log))
+
+    @staticmethod
+    def delete_object(bucket, key):
+        """Removes the object at 'key'"""
+        _connect(bucket).execute("DELETE FROM objects WHERE key = ?", (key,))
+
+    @staticmethod
+    def delete_objects(bucket, keys):
+        """Delete all of the objects at the passed 'keys' in 'bucket'
+           in a single transaction. This returns a dictionary of the
+           error message for each key whose object could not be
+           deleted, which is always empty for this backend
+        """
+        connection = _connect(bucket)
+
+        with _transaction(connection, "BEGIN IMMEDIATE"):
+            connection.executemany("DELETE FROM objects WHERE key = ?",
+                                   [(key,) for key in keys])
+
+        return {}
+
+    @staticmethod
+    def clear_all_except(bucket, keys):
+        """Removes all objects from the passed 'bucket' except those
+           whose keys are or start with any key in 'keys'"""
+        keep = _PrefixTrie(keys)
+        connection = _connect(bucket)
+
+        with _transaction(connection, "BEGIN IMMEDIATE"):
+            names = [row[0] for row in
+                     connection.execute("SELECT key FROM objects")]
+
+            connection.executemany("DELETE FROM objects WHERE key = ?",
+                                   [(name,) for name in names
+                                    if not keep.matches(name)])
@@ -0,0 +1,190 @@
+
+import json as _json
+import threading as _threading
+
+__all__ = ["ObjectStoreStatistics"]
+
+# The upper bounds (in milliseconds) of the buckets of the
+# latency histograms
+_latency_buckets = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+def _size_of(value):
+    """Return the number of bytes (or characters) held in 'value', which
+       is the value passed to, or returned from, an object store call"""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    elif isinstance(value, dict):
+        return sum(_size_of(v) for v in value.values())
+    elif isinstance(value, tuple) and len(value) > 0:
+        # e.g. the (data, etag) returned from get_object_with_etag
+        return _size_of(value[0])
+    else:
+        return 0
+
+
+def _json_size(value):
+    """Return the number of bytes in the json encoding of 'value', which
+       is the object passed to, or returned from, a json object store
+       call (or 0 if there is no object)"""
+    if value is None:
+        return 0
+
+    try:
+        return len(_json.dumps(value))
+    except:
+        return 0
+
+
+class _CallStatistics:
+    """This class holds the statistics for a set of calls"""
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.histogram = [0] * (len(_latency_buckets) + 1)
+
+    def record(self, seconds, bytes_in, bytes_out, error):
+        """Record a call that took 'seconds'"""
+        self.count += 1
+
+        if error:
+            self.errors += 1
+
+        self.total_time += seconds
+        self.max_time = max(self.max_time, seconds)
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+        ms = 1000.0 * seconds
+
+        for (i, bound) in enumerate(_latency_buckets):
+            if ms <= bound:
+                self.histogram[i] += 1
+                return
+
+        self.histogram[-1] += 1
+
+    def to_data(self):
+        """Return a json-serialisable dictionary of these statistics"""
+        histogram = {}
+
+        for (i, bound) in enumerate(_latency_buckets):
+            if self.histogram[i] > 0:
+                histogram["<=%dms" % bound] = self.histogram[i]
+
+        if self.histogram[-1] > 0:
+            histogram[">%dms" % _latency_buckets[-1]] = self.histogram[-1]
+
+        return {"count": self.count,
+                "errors": self.errors,
+                "total_time": self.total_time,
+                "mean_time": self.total_time / self.count,
+                "max_time": self.max_time,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "histogram": histogram}
+
+
+class ObjectStoreStatistics:
+    """This class records the number of calls, their latency, the
+       number of bytes transferred into and out of the object store and
+       the number of errors for each ObjectStore operation, both in
+       total and per key prefix. The key prefix is the first
+       'prefix_depth' parts of the key, e.g. 'accounts' for the key
+       'accounts/1234/balance' if 'prefix_depth' is 1
+    """
+    def __init__(self, prefix_depth=1):
+        self._prefix_depth = int(prefix_depth)
+        self._lock = _threading.Lock()
+        self._operations = {}
+        self._prefixes = {}
+
+    def _get_prefix(self, key):
+        """Return the prefix of the passed key"""
+        if isinstance(key, (list, tuple)):
+            if len(key) == 0:
+                return ""
+
+            key = key[0]
+
+        if not isinstance(key, str):
+            return ""
+
+        return "/".join(key.split("/")[0:self._prefix_depth])
+
+    def record(self, operation, args, seconds, result=None, error=False,
+               size=None):
+        """Record the call to ObjectStore.'operation' with arguments
+           'args' (of which the first is the bucket, and the second
+           is the key, keys or prefix) that took 'seconds' and which
+           returned 'result'. If 'size' is passed then this is the
+           number of bytes received (e.g. for a stream that has
+           been read after the call returned)
+        """
+        if len(args) > 1:
+            prefix = self._get_prefix(args[1])
+        else:
+            prefix = ""
+
+        # data being written is the third argument of the set functions.
+        # The json functions count the bytes of the json encoding
+        bytes_out = 0
+        bytes_in = 0
+
+        if operation.startswith("set_") and len(args) > 2:
+            if "json" in operation:
+                bytes_out = _json_size(args[2])
+            else:
+                bytes_out = _size_of(args[2])
+        elif size is not None:
+            bytes_in = size
+        elif operation == "get_objects_from_json" and result is not None:
+            bytes_in = sum(_json_size(value) for value in result.values())
+        elif "json" in operation:
+            bytes_in = _json_size(result)
+        else:
+            bytes_in = _size_of(result)
+
+        with self._lock:
+            for (stats, key) in [(self._operations, operation),
+                                 (self._prefixes, (operation, prefix))]:
+                try:
+                    s = stats[key]
+                except KeyError:
+                    s = _CallStatistics()
+                    stats[key] = s
+
+                s.record(seconds, bytes_in, bytes_out, error)
+
+    def reset(self):
+        """Clear all of the recorded statistics"""
+        with self._lock:
+            self._operations = {}
+            self._prefixes = {}
+
+    def to_data(self):
+        """Return a json-serialisable dictionary snapshot of the
+           statistics, with the statistics per operation in
+           'operations', and per operation for each key
+           prefix in 'prefixes'
+        """
+        with self._lock:
+            operations = {}
+
+            for (operation, stats) in self._operations.items():
+                operations[operation] = stats.to_data()
+
+            prefixes = {}
+
+            for ((operation, prefix), stats) in self._prefixes.items():
+                try:
+                    prefixes[prefix][operation] = stats.to_data()
+                except KeyError:
+                    prefixes[prefix] = {operation: stats.to_data()}
+
+        return {"operations": operations,
+                "prefixes": prefixes}
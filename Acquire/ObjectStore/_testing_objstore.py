@@ -6,14 +6,47 @@ import uuid as _uuid
 import json as _json
 import glob as _glob
 import threading
+import io as _io
+import hashlib as _hashlib
 
 from ._errors import ObjectStoreError
+from ._compression import encode_json_object as _encode_json_object
+from ._compression import decode_json_object as _decode_json_object
+from ._objstorelog import _get_log
+from ._objstorelog import _get_segment_prefix
+from ._deletion import PrefixTrie as _PrefixTrie
+from ._chunked import get_chunk_keys as _get_chunk_keys
+from ._chunked import get_listed_chunk_keys as _get_listed_chunk_keys
+from ._deletion import check_deleted as _check_deleted
+from ._objstream import ObjectStream as _ObjectStream
 
 _rlock = threading.RLock()
 
 __all__ = ["Testing_ObjectStore"]
 
 
+def _get_etag(data):
+    """Return the ETag of the passed binary data. Unlike a real object
+       store, this depends only on the contents of the object"""
+    return _hashlib.md5(data).hexdigest()
+
+
+def _file_source(filename):
+    """Return a function that opens 'filename' and returns an iterator
+       over the blocks of data in the file"""
+    def _open():
+        with open(filename, "rb") as FILE:
+            while True:
+                block = FILE.read(1024 * 1024)
+
+                if not block:
+                    return
+
+                yield block
+
+    return _open
+
+
 class Testing_ObjectStore:
     """This is a dummy object store that writes objects to
        the standard posix filesystem when running tests
@@ -24,10 +57,19 @@ class Testing_ObjectStore:
         """Get the object contained in the key 'key' in the passed 'bucket'
            and writing this to the file called 'filename'"""
 
-        if not _os.path.exists("%s/%s._data" % (bucket, key)):
-            raise ObjectStoreError("No object at key '%s'" % key)
+        with _rlock:
+            chunk_keys = Testing_ObjectStore._get_chunk_keys(bucket, key)
 
-        _shutil.copy("%s/%s._data" % (bucket, key), filename)
+            if chunk_keys is None:
+                _shutil.copy("%s/%s._data" % (bucket, key), filename)
+                return filename
+
+            with open(filename, "wb") as FILE:
+                for data in Testing_ObjectStore.get_objects(
+                                            bucket, chunk_keys).values():
+                    FILE.write(data)
+
+        return filename
 
     @staticmethod
     def get_object(bucket, key):
@@ -35,11 +77,71 @@ class Testing_ObjectStore:
            passed bucket"""
 
         with _rlock:
-            if _os.path.exists("%s/%s._data" % (bucket, key)):
-                return open("%s/%s._data" % (bucket, key), "rb").read()
+            return Testing_ObjectStore._read_object(bucket, key)
+
+    @staticmethod
+    def open_object(bucket, key):
+        """Return a read-only file-like object that streams the binary
+           data contained in the key 'key' in the passed bucket. The
+           stream can only seek forwards"""
+
+        with _rlock:
+            chunk_keys = Testing_ObjectStore._get_chunk_keys(bucket, key)
+
+            if chunk_keys is None:
+                sources = [_file_source("%s/%s._data" % (bucket, key))]
             else:
+                sources = [_file_source("%s/%s._data" % (bucket, chunk_key))
+                           for chunk_key in chunk_keys]
+
+        return _io.BufferedReader(_ObjectStream(sources))
+
+    @staticmethod
+    def _get_chunk_keys(bucket, key):
+        """Return the keys of the numbered chunks ('key/1', 'key/2' etc.)
+           that together hold the data for the object at 'key', as
+           listed in the chunk manifest stored at 'key', or None if
+           the object at 'key' is not chunked. Chunked objects written
+           before chunk manifests were added have no object at 'key',
+           so are found from the chunk files. This raises an
+           ObjectStoreError if there is no object at 'key'
+        """
+        try:
+            with open("%s/%s._data" % (bucket, key), "rb") as FILE:
+                start = FILE.read(1024)
+        except:
+            names = [_os.path.basename(filename)[0:-6] for filename in
+                     _glob.glob("%s/%s/*._data" % (bucket, key))]
+
+            chunk_keys = _get_listed_chunk_keys(key, names)
+
+            if chunk_keys is None:
                 raise ObjectStoreError("No object at key '%s'" % key)
 
+            return chunk_keys
+
+        return _get_chunk_keys(key, start)
+
+    @staticmethod
+    def _read_object(bucket, key):
+        """Return the binary data of the object at 'key', joining
+           together the numbered chunks if this is a chunked object"""
+        chunk_keys = Testing_ObjectStore._get_chunk_keys(bucket, key)
+
+        if chunk_keys is None:
+            chunk_keys = [key]
+
+        data = []
+
+        for chunk_key in chunk_keys:
+            try:
+                with open("%s/%s._data" % (bucket, chunk_key), "rb") as FILE:
+                    data.append(FILE.read())
+            except:
+                raise ObjectStoreError("No object at key '%s'" % chunk_key)
+
+        return b"".join(data)
+
     @staticmethod
     def get_string_object(bucket, key):
         """Return the string in 'bucket' associated with 'key'"""
@@ -55,11 +157,49 @@ class Testing_ObjectStore:
         data = None
 
         try:
-            data = Testing_ObjectStore.get_string_object(bucket, key)
+            data = Testing_ObjectStore.get_object(bucket, key)
         except:
             return None
 
-        return _json.loads(data)
+        return _decode_json_object(data)
+
+    @staticmethod
+    def get_objects(bucket, keys):
+        """Return the binary data contained in all of the passed 'keys'
+           in 'bucket', as a dictionary indexed by key. This raises
+           an ObjectStoreError if there is no data at any of the keys
+        """
+        objects = {}
+
+        with _rlock:
+            for key in keys:
+                objects[key] = Testing_ObjectStore._read_object(bucket, key)
+
+        return objects
+
+    @staticmethod
+    def get_objects_from_json(bucket, keys):
+        """Return the objects constructed from the json stored at all
+           of the passed 'keys' in 'bucket', as a dictionary indexed
+           by key. The value is None for any key that does not
+           hold any data
+        """
+        objects = {}
+
+        with _rlock:
+            for key in keys:
+                filename = "%s/%s._data" % (bucket, key)
+
+                try:
+                    with open(filename, "rb") as FILE:
+                        data = FILE.read()
+                except:
+                    objects[key] = None
+                    continue
+
+                objects[key] = _decode_json_object(data)
+
+        return objects
 
     @staticmethod
     def get_all_object_names(bucket, prefix=None):
@@ -84,20 +224,46 @@ class Testing_ObjectStore:
 
         return object_names
 
+    @staticmethod
+    def iter_object_names(bucket, prefix=None, start_after=None, limit=None):
+        """Iterate over the names of the objects in the passed bucket
+           whose keys start with 'prefix', in sorted order. If
+           'start_after' is passed then only names that sort after
+           this name are returned, and if 'limit' is passed then
+           at most 'limit' names are returned
+        """
+        names = Testing_ObjectStore.get_all_object_names(bucket, prefix)
+        names.sort()
+
+        count = 0
+
+        for name in names:
+            if limit is not None and count >= limit:
+                return
+
+            if start_after is not None and name <= start_after:
+                continue
+
+            yield name
+            count += 1
+
     @staticmethod
     def get_all_objects(bucket, prefix=None):
         """Return all of the objects in the passed bucket"""
 
-        objects = {}
         names = Testing_ObjectStore.get_all_object_names(bucket, prefix)
 
         if prefix:
-            for name in names:
-                objects[name] = Testing_ObjectStore.get_object(
-                                    bucket, "%s/%s" % (prefix, name))
+            keys = ["%s/%s" % (prefix, name) for name in names]
         else:
-            for name in names:
-                objects[name] = Testing_ObjectStore.get_object(bucket, name)
+            keys = names
+
+        data = Testing_ObjectStore.get_objects(bucket, keys)
+
+        objects = {}
+
+        for (name, key) in zip(names, keys):
+            objects[name] = data[key]
 
         return objects
 
@@ -137,9 +303,82 @@ class Testing_ObjectStore:
                     FILE.flush()
 
     @staticmethod
-    def set_object_from_file(bucket, key, filename):
+    def get_object_with_etag(bucket, key):
+        """Return a tuple of the binary data contained in the key 'key'
+           in the passed bucket, together with its ETag"""
+        with _rlock:
+            filename = "%s/%s._data" % (bucket, key)
+
+            try:
+                with open(filename, "rb") as FILE:
+                    data = FILE.read()
+            except:
+                raise ObjectStoreError("No object at key '%s'" % key)
+
+        return (data, _get_etag(data))
+
+    @staticmethod
+    def set_object_if_match(bucket, key, data, etag):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           the ETag of the object currently at 'key' is 'etag'. This
+           returns the new ETag of the object if the write succeeded,
+           or None if the object had been changed (or deleted). Note
+           that this is only atomic between threads in this process"""
+        filename = "%s/%s._data" % (bucket, key)
+
+        with _rlock:
+            try:
+                with open(filename, "rb") as FILE:
+                    current = FILE.read()
+            except:
+                return None
+
+            if _get_etag(current) != etag:
+                return None
+
+            # write to a temporary file and then atomically rename this
+            # over the object, so that readers never see a partial write
+            tmpfile = "%s.%s" % (filename, _uuid.uuid4())
+
+            with open(tmpfile, "wb") as FILE:
+                FILE.write(data)
+
+            _os.replace(tmpfile, filename)
+
+        return _get_etag(data)
+
+    @staticmethod
+    def set_object_if_absent(bucket, key, data):
+        """Set the value of 'key' in 'bucket' to binary 'data' only if
+           there is no object at 'key'. This returns the ETag of the
+           new object if the write succeeded, or None if there
+           was already an object at this key"""
+        filename = "%s/%s._data" % (bucket, key)
+
+        with _rlock:
+            _os.makedirs(_os.path.dirname(filename), exist_ok=True)
+
+            # write to a temporary file and then hard-link this to the
+            # object - the link is atomic and fails if the object exists
+            tmpfile = "%s.%s" % (filename, _uuid.uuid4())
+
+            with open(tmpfile, "wb") as FILE:
+                FILE.write(data)
+
+            try:
+                _os.link(tmpfile, filename)
+            except FileExistsError:
+                return None
+            finally:
+                _os.remove(tmpfile)
+
+        return _get_etag(data)
+
+    @staticmethod
+    def set_object_from_file(bucket, key, filename, part_size=None):
         """Set the value of 'key' in 'bucket' to equal the contents
-           of the file located by 'filename'"""
+           of the file located by 'filename'. The 'part_size' is
+           ignored as files are copied in one go"""
 
         Testing_ObjectStore.set_object(bucket, key,
                                         open(filename, 'rb').read())
@@ -154,7 +393,8 @@ class Testing_ObjectStore:
     def set_object_from_json(bucket, key, data):
         """Set the value of 'key' in 'bucket' to equal to contents
            of 'data', which has been encoded to json"""
-        Testing_ObjectStore.set_string_object(bucket, key, _json.dumps(data))
+        Testing_ObjectStore.set_object(bucket, key,
+                                       _encode_json_object(key, data))
 
     @staticmethod
     def log(bucket, message, prefix="log"):
@@ -178,29 +418,14 @@ class Testing_ObjectStore:
     @staticmethod
     def get_log(bucket, log="log"):
         """Return the complete log as an xml string"""
-        objs = Testing_ObjectStore.get_all_strings(bucket, log)
-
-        lines = []
-        lines.append("<log>")
-
-        timestamps = list(objs.keys())
-        timestamps.sort()
-
-        for timestamp in timestamps:
-            lines.append("<logitem>")
-            lines.append("<timestamp>%s</timestamp>" %
-                         _datetime.datetime.fromtimestamp(float(timestamp)))
-            lines.append("<message>%s</message>" % objs[timestamp])
-            lines.append("</logitem>")
-
-        lines.append("</log>")
-
-        return "".join(lines)
+        return _get_log(Testing_ObjectStore, bucket, log)
 
     @staticmethod
     def clear_log(bucket, log="log"):
         """Clears out the log"""
         Testing_ObjectStore.delete_all_objects(bucket, log)
+        Testing_ObjectStore.delete_all_objects(bucket,
+                                               _get_segment_prefix(log))
 
     @staticmethod
     def delete_object(bucket, key):
@@ -211,19 +436,35 @@ class Testing_ObjectStore:
             pass
 
     @staticmethod
-    def clear_all_except(bucket, keys):
-        """Removes all objects from the passed 'bucket' except those
-           whose keys are or start with any key in 'keys'"""
+    def delete_objects(bucket, keys):
+        """Delete all of the objects at the passed 'keys' in 'bucket'.
+           This returns a dictionary of the error message for each key
+           whose object could not be deleted (which is empty if all
+           deletions succeeded). Keys that have no object are not
+           counted as failures
+        """
+        failures = {}
 
-        names = Testing_ObjectStore.get_all_object_names(bucket)
+        for key in keys:
+            try:
+                _os.remove("%s/%s._data" % (bucket, key))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                failures[key] = str(e)
 
-        for name in names:
-            remove = True
+        return failures
 
-            for key in keys:
-                if name.startswith(key):
-                    remove = False
-                    break
+    @staticmethod
+    def clear_all_except(bucket, keys):
+        """Removes all objects from the passed 'bucket' except those
+           whose keys are or start with any key in 'keys'. This raises
+           an ObjectStoreError listing any objects that could
+           not be deleted"""
+        keep = _PrefixTrie(keys)
+
+        names = [name for name in
+                 Testing_ObjectStore.get_all_object_names(bucket)
+                 if not keep.matches(name)]
 
-            if remove:
-                Testing_ObjectStore.delete_object(bucket, key)
+        _check_deleted(Testing_ObjectStore.delete_objects(bucket, names))
@@ -0,0 +1,374 @@
+
+import json as _json
+import os as _os
+import tempfile as _tempfile
+import threading as _threading
+import time as _time
+
+__all__ = ["ObjectStoreTrace"]
+
+# The operations that act on a single key, on a list of keys, or on
+# a key prefix, and the operations that write data
+_key_operations = ["get_object_as_file", "get_object", "open_object",
+                   "get_string_object", "get_object_from_json",
+                   "get_object_with_etag", "delete_object"]
+_keys_operations = ["get_objects", "get_objects_from_json",
+                    "delete_objects", "clear_all_except"]
+_prefix_operations = ["get_all_object_names", "iter_object_names",
+                      "get_all_objects", "get_all_strings",
+                      "delete_all_objects", "get_log", "clear_log"]
+_write_operations = ["set_object", "set_string_object",
+                     "set_object_from_json", "set_object_from_file",
+                     "set_object_if_match", "set_object_if_absent"]
+
+
+def _get_size(value):
+    """Return the size of the passed payload or result in bytes"""
+    if value is None:
+        return 0
+    elif isinstance(value, (bytes, bytearray)):
+        return len(value)
+    elif isinstance(value, str):
+        return len(value.encode("utf-8"))
+    elif isinstance(value, tuple) and len(value) > 0:
+        return _get_size(value[0])
+    elif isinstance(value, list):
+        return 0
+    elif isinstance(value, dict):
+        return len(_json.dumps(value))
+    else:
+        return 0
+
+
+def _get_json_size(value):
+    """Return the size in bytes of the json encoding of 'value'"""
+    if value is None:
+        return 0
+
+    try:
+        return len(_json.dumps(value))
+    except:
+        return 0
+
+
+class ObjectStoreTrace:
+    """This class records the sequence of calls made via ObjectStore
+       (the operation, key, payload size and timing of each call), e.g.
+       while running a service function, so that the trace can be
+       saved and replayed later against any backend, with injected
+       latency. Only the sizes of the payloads are recorded, so the
+       trace does not contain any of the stored data. Use this as
+       a context manager, e.g.
+
+       with ObjectStoreTrace() as trace:
+           run(args)
+
+       trace.replay(bucket, latency=0.05)
+    """
+    def __init__(self, calls=None):
+        """Construct an empty trace, or a trace of the passed 'calls'"""
+        if calls is None:
+            calls = []
+
+        self._calls = calls
+        self._lock = _threading.Lock()
+        self._start = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.stop()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __str__(self):
+        return "ObjectStoreTrace(num_calls=%d)" % len(self._calls)
+
+    def start(self):
+        """Start recording all calls made via ObjectStore"""
+        from ._objstore import _set_trace
+        self._start = _time.monotonic()
+        _set_trace(self)
+
+    def stop(self):
+        """Stop recording calls made via ObjectStore"""
+        from ._objstore import _set_trace
+        _set_trace(None)
+
+    def calls(self):
+        """Return the list of recorded calls"""
+        return list(self._calls)
+
+    def record(self, operation, args, kwargs, seconds, result=None,
+               error=False, size=None, start=None):
+        """Record the call to ObjectStore.'operation' with arguments
+           'args' and 'kwargs' that started at (monotonic) time 'start'
+           (or 'seconds' ago if this is None), took 'seconds' and
+           returned 'result'. If 'size' is passed then this is the
+           number of bytes received (e.g. for a stream that has
+           been read after the call returned)
+        """
+        call = {"operation": operation,
+                "time": seconds,
+                "error": bool(error)}
+
+        if self._start is not None:
+            if start is None:
+                start = _time.monotonic() - seconds
+
+            call["start"] = start - self._start
+
+        if operation == "log":
+            call["key"] = kwargs.get("prefix", args[2] if len(args) > 2
+                                     else "log")
+            call["size"] = _get_size(str(args[1]))
+        elif len(args) > 1:
+            key = args[1]
+
+            if isinstance(key, (list, tuple)):
+                key = [str(k) for k in key]
+            elif key is not None:
+                key = str(key)
+
+            call["key"] = key
+
+            if operation in _write_operations:
+                if operation == "set_object_from_file":
+                    try:
+                        call["size"] = _os.path.getsize(args[2])
+                    except:
+                        call["size"] = 0
+                elif operation == "set_object_from_json" and len(args) > 2:
+                    call["size"] = _get_json_size(args[2])
+                elif len(args) > 2:
+                    call["size"] = _get_size(args[2])
+                else:
+                    call["size"] = 0
+            elif size is not None:
+                call["size"] = size
+            elif operation == "get_object_from_json":
+                call["size"] = _get_json_size(result)
+            else:
+                call["size"] = _get_size(result)
+
+        if operation == "iter_object_names":
+            # iter_object_names(bucket, prefix, start_after, limit)
+            for (i, arg) in [(2, "start_after"), (3, "limit")]:
+                if arg in kwargs:
+                    call[arg] = kwargs[arg]
+                elif len(args) > i:
+                    call[arg] = args[i]
+
+        with self._lock:
+            self._calls.append(call)
+
+    def summary(self):
+        """Return a dictionary summarising the trace, giving the number
+           of calls (round trips), bytes and time for each operation
+        """
+        operations = {}
+
+        for call in self._calls:
+            try:
+                s = operations[call["operation"]]
+            except KeyError:
+                s = {"count": 0, "errors": 0, "bytes": 0, "time": 0.0}
+                operations[call["operation"]] = s
+
+            s["count"] += 1
+            s["bytes"] += call.get("size", 0)
+            s["time"] += call["time"]
+
+            if call["error"]:
+                s["errors"] += 1
+
+        return {"num_calls": len(self._calls),
+                "total_time": sum(c["time"] for c in self._calls),
+                "operations": operations}
+
+    def to_data(self):
+        """Return a json-serialisable dictionary of this trace"""
+        return {"calls": self.calls()}
+
+    @staticmethod
+    def from_data(data):
+        """Construct a trace from the passed json-decoded dictionary"""
+        if data is None:
+            return ObjectStoreTrace()
+
+        return ObjectStoreTrace(list(data["calls"]))
+
+    def save(self, filename):
+        """Save this trace as json to the file 'filename'"""
+        with open(filename, "w") as FILE:
+            _json.dump(self.to_data(), FILE)
+
+    @staticmethod
+    def load(filename):
+        """Load and return the trace saved to the file 'filename'"""
+        with open(filename, "r") as FILE:
+            return ObjectStoreTrace.from_data(_json.load(FILE))
+
+    def _seed(self, backend, bucket):
+        """Internal function that writes placeholder objects for every
+           key that is successfully read in the trace before it has
+           been written, so that the replayed reads succeed
+        """
+        written = set()
+
+        for call in self._calls:
+            operation = call["operation"]
+            key = call.get("key")
+
+            if operation in _write_operations:
+                written.add(key)
+            elif call["error"] or operation not in _key_operations:
+                continue
+            elif operation == "delete_object":
+                written.discard(key)
+            elif key not in written:
+                if operation == "get_object_from_json":
+                    backend.set_object_from_json(
+                        bucket, key, _placeholder_json(call["size"]))
+                else:
+                    backend.set_object(bucket, key,
+                                       b"x" * call.get("size", 0))
+
+                written.add(key)
+
+    def replay(self, bucket, backend=None, latency=0.0, seed=True):
+        """Replay this trace against 'bucket' using 'backend' (or the
+           current ObjectStore backend if this is None), injecting
+           'latency' seconds of delay into every call to simulate the
+           round trip to a remote object store. Placeholder data of the
+           recorded size is written and read in place of the original
+           data. If 'seed' is True then placeholder objects are first
+           written for the keys that are read before being written.
+           A conditional 'set_object_if_match' on a key whose ETag has
+           not been seen in the replay uses the ETag of the current
+           object, which is read (untimed) before the call. The call
+           is skipped if there is no object, as it could not have
+           matched. This returns a summary of the replay, with the
+           time taken and the number of calls, errors and skipped
+           calls per operation
+        """
+        if backend is None:
+            from ._objstore import ObjectStore as backend
+
+        latency = float(latency)
+
+        if seed:
+            self._seed(backend, bucket)
+
+        etags = {}
+        operations = {}
+        start = _time.monotonic()
+
+        for call in self._calls:
+            operation = call["operation"]
+
+            try:
+                s = operations[operation]
+            except KeyError:
+                s = {"count": 0, "errors": 0, "skipped": 0, "time": 0.0}
+                operations[operation] = s
+
+            if operation == "set_object_if_match" and \
+                    call.get("key") not in etags:
+                try:
+                    etags[call["key"]] = backend.get_object_with_etag(
+                                                bucket, call["key"])[1]
+                except:
+                    s["skipped"] += 1
+                    continue
+
+            call_start = _time.monotonic()
+            error = False
+
+            if latency > 0:
+                _time.sleep(latency)
+
+            try:
+                _replay_call(backend, bucket, call, etags)
+            except:
+                error = True
+
+            elapsed = _time.monotonic() - call_start
+
+            s["count"] += 1
+            s["time"] += elapsed
+
+            if error:
+                s["errors"] += 1
+
+        return {"num_calls": len(self._calls),
+                "latency": latency,
+                "total_time": _time.monotonic() - start,
+                "operations": operations}
+
+
+def _placeholder_json(size):
+    """Return a json-serialisable placeholder object that encodes
+       to approximately 'size' bytes"""
+    return {"data": "x" * max(0, size - 12)}
+
+
+def _replay_call(backend, bucket, call, etags):
+    """Internal function that replays the single recorded 'call' against
+       'backend', using 'etags' to hold the ETags of objects read or
+       written during the replay
+    """
+    operation = call["operation"]
+    key = call.get("key")
+    size = call.get("size", 0)
+    func = getattr(backend, operation)
+
+    if operation == "get_object_as_file":
+        (handle, filename) = _tempfile.mkstemp()
+        _os.close(handle)
+
+        try:
+            func(bucket, key, filename)
+        finally:
+            _os.unlink(filename)
+    elif operation == "open_object":
+        with func(bucket, key) as f:
+            f.read()
+    elif operation == "get_object_with_etag":
+        etags[key] = func(bucket, key)[1]
+    elif operation == "iter_object_names":
+        list(func(bucket, key, call.get("start_after"), call.get("limit")))
+    elif operation in _key_operations or operation in _keys_operations \
+            or operation in _prefix_operations:
+        func(bucket, key)
+    elif operation == "log":
+        func(bucket, "x" * size, key)
+    elif operation == "set_object_from_json":
+        func(bucket, key, _placeholder_json(size))
+    elif operation == "set_string_object":
+        func(bucket, key, "x" * size)
+    elif operation == "set_object_from_file":
+        (handle, filename) = _tempfile.mkstemp()
+
+        try:
+            with _os.fdopen(handle, "wb") as FILE:
+                FILE.write(b"x" * size)
+
+            func(bucket, key, filename)
+        finally:
+            _os.unlink(filename)
+    elif operation == "set_object_if_match":
+        etag = func(bucket, key, b"x" * size, etags[key])
+
+        if etag is not None:
+            etags[key] = etag
+    elif operation == "set_object_if_absent":
+        etag = func(bucket, key, b"x" * size)
+
+        if etag is not None:
+            etags[key] = etag
+    else:
+        func(bucket, key, b"x" * size)
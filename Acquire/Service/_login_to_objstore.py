@@ -97,4 +97,35 @@ def login_to_service_account(testing_dir=None):
         raise ServiceAccountError(
              "Error connecting to the service account: %s" % str(e))
 
+    # the service may spread its keys over several buckets, described
+    # by a list of {"prefix", "buckets", "depth"} for each sharded prefix
+    shards = bucket_data.get("shards")
+
+    if shards:
+        from Acquire.ObjectStore import ShardedBucket as _ShardedBucket
+        from Acquire.ObjectStore import ShardedObjectStore \
+            as _ShardedObjectStore
+        from Acquire.ObjectStore._oci_objstore import OCI_ObjectStore \
+            as _OCI_ObjectStore
+        from Acquire.ObjectStore import set_object_store_backend as \
+            _set_object_store_backend
+
+        account_bucket = _ShardedBucket(account_bucket)
+
+        try:
+            for shard in shards:
+                buckets = [_OCIAccount.create_and_connect_to_bucket(
+                                    access_data,
+                                    bucket_data["compartment"],
+                                    bucket) for bucket in shard["buckets"]]
+
+                account_bucket.add_shard(shard["prefix"], buckets,
+                                         shard.get("depth", 1))
+        except Exception as e:
+            raise ServiceAccountError(
+                "Error connecting to the sharded buckets of the service "
+                "account: %s" % str(e))
+
+        _set_object_store_backend(_ShardedObjectStore(_OCI_ObjectStore))
+
     return account_bucket
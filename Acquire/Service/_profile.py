@@ -6,8 +6,10 @@ if _os.getenv("PROFILE") == "1":
     import cProfile as _cProfile
     import tempfile as _tempfile
     from Acquire.ObjectStore import bytes_to_string as _bytes_to_string
+    from Acquire.ObjectStore import ObjectStore as _ObjectStore
 
     def start_profile():
+        _ObjectStore.enable_statistics()
         pr = _cProfile.Profile()
         pr.enable()
         return pr
@@ -20,6 +22,7 @@ if _os.getenv("PROFILE") == "1":
             data = FILE.read()
         _os.unlink(t)
         results["profile_data"] = _bytes_to_string(data)
+        results["object_store_statistics"] = _ObjectStore.get_statistics()
 
 else:
     profiling_code = False
@@ -1,8 +1,10 @@
 
+import asyncio
+
 from Acquire.Service import login_to_service_account
 from Acquire.Service import create_return_value
 
-from Acquire.ObjectStore import ObjectStore
+from Acquire.ObjectStore import AsyncObjectStore
 
 from Acquire.Identity import UserAccount, LoginSession
 
@@ -11,7 +13,7 @@ class InvalidSessionError(Exception):
     pass
 
 
-def run(args):
+async def run(args):
     """This function will allow anyone to query the current login
        status of the session with passed UID"""
 
@@ -32,21 +34,29 @@ def run(args):
     user_session_key = "sessions/%s/%s" % \
         (user_account.sanitised_name(), session_uid)
 
+    expired_session_key = "expired_sessions/%s/%s" % \
+        (user_account.sanitised_name(), session_uid)
+
+    # the session is either current or expired, so look in both
+    # places at the same time rather than one after the other
+    (data, expired_data) = await asyncio.gather(
+        AsyncObjectStore.get_object_from_json(bucket, user_session_key),
+        AsyncObjectStore.get_object_from_json(bucket, expired_session_key),
+        return_exceptions=True)
+
     try:
-        login_session = LoginSession.from_data(
-                            ObjectStore.get_object_from_json(
-                                bucket, user_session_key))
+        if isinstance(data, Exception):
+            raise data
+
+        login_session = LoginSession.from_data(data)
     except:
         login_session = None
 
     if login_session is None:
-        user_session_key = "expired_sessions/%s/%s" % \
-                                (user_account.sanitised_name(),
-                                    session_uid)
+        if isinstance(expired_data, Exception):
+            raise expired_data
 
-        login_session = LoginSession.from_data(
-                            ObjectStore.get_object_from_json(
-                                bucket, user_session_key))
+        login_session = LoginSession.from_data(expired_data)
 
     if login_session is None:
         raise InvalidSessionError(
@@ -145,8 +145,8 @@ def run(args):
     # login sessions at once - this prevents denial of service
     user_session_root = "sessions/%s" % user_account.sanitised_name()
 
-    open_sessions = ObjectStore.get_all_object_names(bucket,
-                                                     user_session_root)
+    open_sessions = ObjectStore.iter_object_names(bucket,
+                                                  user_session_root)
 
     # take the opportunity to prune old user login sessions
     prune_expired_sessions(bucket, user_account,
@@ -45,7 +45,7 @@ async def handler(ctx, data=None, loop=None):
             result = _get_keys(args)
         elif function == "get_status":
             from get_status import run as _get_status
-            result = _get_status(args)
+            result = await _get_status(args)
         elif function == "login":
             from login import run as _login
             result = _login(args)
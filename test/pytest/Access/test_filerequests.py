@@ -63,3 +63,53 @@ def test_filewriterequest():
     with pytest.raises(PermissionError):
         r2.authorisation().verify(r2.resource_key(),
                                   testing_key=testkey)
+
+
+def test_filewriterequest_blobstore(tmpdir):
+    from Acquire.ObjectStore import BlobStore, ObjectStoreError
+    from Acquire.Service import login_to_service_account
+
+    bucket = login_to_service_account(str(tmpdir.mkdir("blobstore")))
+
+    basedir = os.path.dirname(os.path.abspath(__file__))
+    filenames = [os.path.abspath(__file__),
+                 os.path.abspath("%s/../Accounting/test_account.py" % basedir)]
+
+    r = FileWriteRequest(source=filenames, destination="run1/",
+                         testing_key=PrivateKey())
+
+    assert(r.upload_to_blobstore(bucket) == r.destination_keys())
+
+    for (key, filename) in zip(r.destination_keys(), filenames):
+        assert(BlobStore.get_object(bucket, key) ==
+               open(filename, "rb").read())
+
+    # identical contents are not uploaded again
+    r2 = FileWriteRequest(source=filenames, destination="run2/",
+                          testing_key=PrivateKey())
+
+    assert(r2.upload_to_blobstore(bucket) == [])
+
+    for (key, filename) in zip(r2.destination_keys(), filenames):
+        assert(BlobStore.get_object(bucket, key) ==
+               open(filename, "rb").read())
+
+    # blobs are not shared with (or visible to) other owners
+    checksum = BlobStore.get_checksum(bucket, r.destination_keys()[0])
+    assert(BlobStore.get_missing_checksums(bucket, "something",
+                                           [checksum]) == [])
+    assert(BlobStore.get_missing_checksums(bucket, "other", [checksum]) ==
+           [checksum])
+
+    with pytest.raises(ObjectStoreError):
+        BlobStore.set_pointer(bucket, "other", "stolen", checksum)
+
+    # the checksum of the contents is checked, not trusted
+    with pytest.raises(ObjectStoreError):
+        BlobStore.set_object_from_file(bucket, "other", "wrong",
+                                       filenames[1], checksum=checksum)
+
+    assert(BlobStore.set_object_from_file(bucket, "other", "mine",
+                                          filenames[0]))
+    assert(BlobStore.get_object(bucket, "mine") ==
+           open(filenames[0], "rb").read())
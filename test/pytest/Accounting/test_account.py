@@ -312,3 +312,168 @@ def test_pending_transactions(random_transaction):
     assert(starting_balance2 + value == ending_balance2)
     assert(starting_liability2 == ending_liability2)
     assert(starting_receivable1 == ending_receivable1)
+
+
+def test_balance_checkpoint(account1, account2, bucket, monkeypatch):
+    import Acquire.Accounting._account as _account
+    from Acquire.ObjectStore import ObjectStore
+
+    # settle every line item into the checkpoint straight away
+    monkeypatch.setattr(_account, "_checkpoint_lag", -1)
+
+    for i in range(0, 3):
+        Ledger.perform(Transaction(5, "checkpoint %d" % i), account1,
+                       account2, Authorisation(), is_provisional=False,
+                       bucket=bucket)
+
+    balance = account1.balance()
+
+    checkpoint = ObjectStore.get_object_from_json(
+                    bucket, account1._get_checkpoint_key())
+    assert(checkpoint is not None)
+    assert(create_decimal(checkpoint["balance"]) == balance)
+
+    # a freshly loaded account continues from the checkpoint
+    fresh = Account(uid=account1.uid(), bucket=bucket)
+    assert(fresh._load_checkpoint(bucket, datetime.datetime.now()))
+    assert(fresh.balance() == balance)
+
+    Ledger.perform(Transaction(5, "after checkpoint"), account1, account2,
+                   Authorisation(), is_provisional=False, bucket=bucket)
+
+    fresh = Account(uid=account1.uid(), bucket=bucket)
+    assert(fresh.balance() == balance - 5)
+    assert(account1.balance() == balance - 5)
+
+
+def test_partitioned_line_items(bucket):
+    from Acquire.Accounting import TransactionInfo, TransactionCode
+    from Acquire.ObjectStore import ObjectStore
+
+    account = Account("Partitioned", "Partitioned account", bucket=bucket)
+    other = Account("Other", "Other partitioned account", bucket=bucket)
+    other.set_overdraft_limit(100)
+
+    Ledger.perform(Transaction(10, "partitioned"), other, account,
+                   Authorisation(), is_provisional=False, bucket=bucket)
+
+    now = datetime.datetime.now()
+    names = ObjectStore.get_all_object_names(bucket, account._key())
+    assert(any("T%02d" % now.hour in name for name in names))
+    assert(account.balance() == 10)
+
+    # line items written directly under the day by older versions
+    # are still read for accounts created before partitioning
+    legacy_key = "%s/%4d-%02d-%02d/%s/abcdefgh/%s" % (
+                    account._key(), now.year, now.month, now.day,
+                    now.timestamp(),
+                    TransactionInfo.encode(TransactionCode.CREDIT, 5))
+    ObjectStore.set_object_from_json(bucket, legacy_key, {})
+
+    account._partitioned_from = None
+    account._last_update_ordinal = None
+    ObjectStore.delete_object(bucket, account._get_checkpoint_key())
+    assert(account.balance() == 15)
+
+
+def test_day_line_item_listing(bucket):
+    from Acquire.Accounting import TransactionInfo, TransactionCode
+    from Acquire.ObjectStore import ObjectStore, ObjectStoreTrace
+
+    account = Account("Day listing", "Day listing account", bucket=bucket)
+    day = datetime.datetime(2018, 6, 1)
+
+    # legacy line items directly under the day, and line items in
+    # the partitions of each hour, written out of time order
+    keys = []
+
+    for hour in (23, 5, 0, 14):
+        for (partition, minute) in (("2018-06-01", 30),
+                                    ("2018-06-01T%02d00" % hour, 10)):
+            timestamp = (day + datetime.timedelta(
+                            hours=hour, minutes=minute)).timestamp()
+            key = "%s/%s/%s/abcdefgh/%s" % (
+                    account._key(), partition, timestamp,
+                    TransactionInfo.encode(TransactionCode.CREDIT, hour))
+            ObjectStore.set_object_from_json(bucket, key, {})
+            keys.append(key)
+
+    account._partitioned_from = day.toordinal() + 1
+
+    # the whole day is read in a single listing
+    with ObjectStoreTrace() as trace:
+        day_keys = account._get_transaction_keys_between(
+                        day, day + datetime.timedelta(hours=23, minutes=59),
+                        bucket=bucket)
+
+    operations = trace.summary()["operations"]
+    assert(operations["iter_object_names"]["count"] == 1)
+    assert(day_keys == sorted(keys, key=lambda k: float(k.split("/")[-3])))
+
+    # ...and gives the same line items as listing each partition
+    day_keys = account._get_transaction_keys_between(
+                        day + datetime.timedelta(hours=5),
+                        day + datetime.timedelta(hours=23, minutes=59),
+                        bucket=bucket)
+    hour_keys = account._get_transaction_keys_between(
+                        day + datetime.timedelta(hours=5),
+                        day + datetime.timedelta(hours=14, minutes=20),
+                        bucket=bucket)
+    assert(day_keys[0:len(hour_keys)] == hour_keys)
+    assert(len(day_keys) == 6)
+    assert(len(hour_keys) == 3)
+
+    # accounts created before partitioning only look for line items
+    # under the day for days before they are next loaded
+    account._partitioned_from = None
+    account._save_account(bucket)
+
+    account = Account(uid=account.uid(), bucket=bucket)
+    partitioned_from = datetime.datetime.now().toordinal() + 1
+    assert(account._partitioned_from == partitioned_from)
+
+    # the day is only recorded once, and never overwritten
+    data = ObjectStore.get_object_from_json(bucket, account._key())
+    assert(data["partitioned_from"] == partitioned_from)
+    assert(account._save_partitioned_from(bucket, 5) == partitioned_from)
+
+
+def test_debit_balance_evaluation(bucket):
+    from Acquire.Accounting import InsufficientFundsError
+    from Acquire.ObjectStore import ObjectStoreTrace
+
+    account = Account("Debit", "Debit evaluation account", bucket=bucket)
+    account.set_overdraft_limit(10)
+    account.balance()
+
+    with ObjectStoreTrace() as trace:
+        account._debit(Transaction(8, "debit"), Authorisation(),
+                       is_provisional=False, bucket=bucket)
+
+    # one listing to evaluate the balance, and one narrow listing
+    # of the line items written since then
+    operations = trace.summary()["operations"]
+    assert(operations["iter_object_names"]["count"] <= 2)
+
+    with pytest.raises(InsufficientFundsError):
+        account._debit(Transaction(5, "debit"), Authorisation(),
+                       is_provisional=False, bucket=bucket)
+
+    assert(account.balance() == -8)
+
+
+def test_daily_limit(bucket):
+    account = Account("Daily", "Daily limit account", bucket=bucket)
+    other = Account("Daily other", "Other daily limit account",
+                    bucket=bucket)
+    account.set_overdraft_limit(100)
+    account._maximum_daily_limit = create_decimal(20)
+
+    assert(account.available_balance() == 20)
+
+    Ledger.perform(Transaction(8, "spend"), account, other,
+                   Authorisation(), is_provisional=False, bucket=bucket)
+
+    # the spend today counts against the daily limit, not the overdraft
+    assert(account.balance() == -8)
+    assert(account.available_balance() == 12)
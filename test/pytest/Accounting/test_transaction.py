@@ -95,3 +95,52 @@ def test_split(random_large_value):
     total = Transaction.round(total)
 
     assert(total == Transaction.round(value))
+
+
+def test_fixedpoint():
+    from Acquire.Accounting import FixedPoint, create_decimal
+
+    a = FixedPoint("000100.005000")
+    b = FixedPoint(create_decimal(0.25))
+
+    assert(a == create_decimal("100.005"))
+    assert(str(a + b) == str(create_decimal("100.255")))
+    assert(str(b - a) == str(create_decimal("-99.755")))
+    assert(a - 100 == FixedPoint("0.005"))
+    assert(create_decimal(1) - b == FixedPoint(0.75))
+    assert(b < a and a > 100 and -a < 0)
+    assert(FixedPoint(0.1234567) == create_decimal(0.1234567))
+    assert((a + b).to_decimal() == create_decimal("100.255"))
+    assert(hash(FixedPoint(3)) == hash(3))
+
+    values = Transaction.split(2500000.5, "split")
+    assert(sum(t.value() for t in values) == create_decimal(2500000.5))
+
+
+def test_sum_transaction_values():
+    from Acquire.Accounting import TransactionInfo, TransactionCode
+
+    keys = []
+
+    for (i, code) in enumerate(TransactionCode):
+        value = create_decimal(1000.0 * random.random())
+        keys.append("accounts/uid/2018-01-01T0000/%d/abcdefgh/%s" %
+                    (i, TransactionInfo.encode(code, value)))
+
+        if code in (TransactionCode.SENT_RECEIPT,
+                    TransactionCode.RECEIVED_RECEIPT):
+            keys.append("accounts/uid/2018-01-01T0000/%d/abcdefgh/%s" %
+                        (i, TransactionInfo.encode(code, value, value / 2)))
+
+    expected = {}
+
+    for key in keys:
+        v = TransactionInfo(key)
+        total = expected.get(v._code, (0, 0))
+        expected[v._code] = (total[0] + v.value().micro(),
+                             total[1] + v.receipted_value().micro())
+
+    assert(TransactionInfo.sum_values(keys[0:2]) ==
+           TransactionInfo._sum_values_slowly(keys[0:2]))
+    assert(TransactionInfo.sum_values(keys) == expected)
+    assert(TransactionInfo.sum_values([]) == {})
@@ -75,3 +75,83 @@ def test_mutex(bucket):
         m.fully_unlock()
 
     assert(not m.is_locked())
+
+
+def test_mutex_auto_renew(bucket):
+    m = Mutex("ObjectStore.test_mutex_auto_renew", lease_time=0.3,
+              auto_renew=True)
+
+    # the background thread should keep renewing the short lease
+    time.sleep(1.0)
+
+    assert(m.is_locked())
+    assert(not m.expired())
+
+    with pytest.raises(MutexTimeoutError):
+        Mutex("ObjectStore.test_mutex_auto_renew", timeout=0.2,
+              min_backoff=0.01, max_backoff=0.05)
+
+    m.unlock()
+    assert(not m.is_locked())
+
+    stats = m.statistics()
+    assert(stats["num_locks"] == 1)
+    assert(stats["num_attempts"] == 1)
+    assert(stats["total_hold_time"] >= 1.0)
+
+    m2 = Mutex("ObjectStore.test_mutex_auto_renew", timeout=1)
+    assert(m2.is_locked())
+    m2.unlock()
+
+
+def test_mutex_threads(bucket):
+    import threading
+    from Acquire.ObjectStore import ObjectStore
+
+    key = "ObjectStore/test_mutex_threads"
+    ObjectStore.set_object_from_json(bucket, key, 0)
+    stats = []
+
+    def increment():
+        for i in range(0, 5):
+            m = Mutex(key, timeout=20, bucket=bucket)
+            value = ObjectStore.get_object_from_json(bucket, key)
+            ObjectStore.set_object_from_json(bucket, key, value + 1)
+            m.unlock()
+            stats.append(m.statistics())
+
+    threads = [threading.Thread(target=increment) for i in range(0, 4)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert(ObjectStore.get_object_from_json(bucket, key) == 20)
+
+    # threads queue locally, so each lock should need only one
+    # attempt to take the mutex in the object store
+    for stat in stats:
+        assert(stat["num_attempts"] == 1)
+
+
+def test_mutex_local_owner(bucket):
+    from Acquire.ObjectStore._mutex import _acquire_local, _release_local
+
+    m1 = Mutex("ObjectStore.test_mutex_local_owner", bucket=bucket)
+    m1.unlock()
+    m2 = Mutex("ObjectStore.test_mutex_local_owner", bucket=bucket)
+    m2.unlock()
+
+    # a mutex that has just become the local owner, but has not yet
+    # started locking the object store, must not be replaced
+    assert(_acquire_local(m1._key, m1, 0))
+    assert(not _acquire_local(m2._key, m2, 0))
+
+    _release_local(m1._key, m1)
+    m1._is_acquiring = False
+
+    assert(_acquire_local(m2._key, m2, 0))
+    _release_local(m2._key, m2)
+    m2._is_acquiring = False
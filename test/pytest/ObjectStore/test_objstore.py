@@ -6,7 +6,7 @@ import pytest
 # instead create and use a fake object store locally
 import os
 
-from Acquire.ObjectStore import ObjectStore
+from Acquire.ObjectStore import ObjectStore, ObjectStoreError
 from Acquire.Service import login_to_service_account
 
 
@@ -49,3 +49,797 @@ def test_objstore(bucket):
 
     for name in names:
         assert(name in keys)
+
+
+def test_get_objects(bucket):
+    keys = ["multi/%d" % i for i in range(0, 10)]
+
+    for (i, key) in enumerate(keys):
+        ObjectStore.set_object_from_json(bucket, key, {"value": i})
+
+    objects = ObjectStore.get_objects_from_json(bucket, keys + ["multi/none"])
+
+    assert(len(objects) == len(keys) + 1)
+    assert(objects["multi/none"] is None)
+
+    for (i, key) in enumerate(keys):
+        assert(objects[key] == {"value": i})
+
+    objects = ObjectStore.get_objects(bucket, keys)
+
+    assert(len(objects) == len(keys))
+
+    for key in keys:
+        assert(objects[key] == ObjectStore.get_object(bucket, key))
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.get_objects(bucket, keys + ["multi/none"])
+
+
+def test_iter_object_names(bucket):
+    keys = ["iter/%03d" % i for i in range(0, 20)]
+
+    for key in keys:
+        ObjectStore.set_string_object(bucket, key, key)
+
+    names = list(ObjectStore.iter_object_names(bucket, "iter"))
+    assert(names == ["%03d" % i for i in range(0, 20)])
+
+    names = list(ObjectStore.iter_object_names(bucket, "iter",
+                                               start_after="004", limit=5))
+    assert(names == ["%03d" % i for i in range(5, 10)])
+
+    names = list(ObjectStore.iter_object_names(bucket, "iter",
+                                               start_after="019"))
+    assert(len(names) == 0)
+
+
+def test_caching_objstore(bucket):
+    from Acquire.ObjectStore import CachingObjectStore
+    from Acquire.ObjectStore._testing_objstore import Testing_ObjectStore
+
+    cache = CachingObjectStore(Testing_ObjectStore, maxsize=10, ttl=60,
+                               prefixes=["cached/"])
+
+    cache.set_object_from_json(bucket, "cached/a", {"value": 1})
+    cache.set_object_from_json(bucket, "uncached/a", {"value": 1})
+
+    assert(cache.get_object_from_json(bucket, "cached/a") == {"value": 1})
+    assert(cache.get_object_from_json(bucket, "cached/a") == {"value": 1})
+    assert(cache.get_object_from_json(bucket, "uncached/a") == {"value": 1})
+
+    stats = cache.cache_statistics()
+    assert(stats["hits"] == 1)
+    assert(stats["misses"] == 1)
+    assert(stats["size"] == 1)
+
+    # changing the returned object must not change the cache
+    cache.get_object_from_json(bucket, "cached/a")["value"] = 5
+    assert(cache.get_object_from_json(bucket, "cached/a") == {"value": 1})
+
+    # writes through the cache must invalidate the entry
+    cache.set_object_from_json(bucket, "cached/a", {"value": 2})
+    assert(cache.get_object_from_json(bucket, "cached/a") == {"value": 2})
+
+    cache.delete_all_objects(bucket, "cached")
+    assert(cache.get_object_from_json(bucket, "cached/a") is None)
+    assert(cache.cache_statistics()["size"] == 0)
+
+    # a read that races with a write must not leave the old object cached
+    class _RacingBackend(Testing_ObjectStore):
+        @staticmethod
+        def set_object_from_json(bucket, key, data):
+            racing.get_object_from_json(bucket, key)
+            Testing_ObjectStore.set_object_from_json(bucket, key, data)
+
+    racing = CachingObjectStore(_RacingBackend, maxsize=10, ttl=60)
+
+    racing.set_object_from_json(bucket, "cached/b", {"value": 1})
+    racing.set_object_from_json(bucket, "cached/b", {"value": 2})
+    assert(racing.get_object_from_json(bucket, "cached/b") == {"value": 2})
+
+    # ...nor must a write that completes while the old object is read
+    class _SlowReadBackend(Testing_ObjectStore):
+        @staticmethod
+        def get_object_from_json(bucket, key):
+            data = Testing_ObjectStore.get_object_from_json(bucket, key)
+            slow.set_object_from_json(bucket, key, {"value": 4})
+            return data
+
+    slow = CachingObjectStore(_SlowReadBackend, maxsize=10, ttl=60)
+
+    slow.set_object_from_json(bucket, "cached/c", {"value": 3})
+    assert(slow.get_object_from_json(bucket, "cached/c") == {"value": 3})
+    assert(slow.cache_statistics()["size"] == 0)
+
+
+def test_chunked_object(bucket):
+    from Acquire.ObjectStore import encode_chunk_manifest
+
+    chunks = [("chunk %d " % i).encode("utf-8") * 100 for i in range(0, 12)]
+
+    for (i, chunk) in enumerate(chunks):
+        ObjectStore.set_object(bucket, "chunked/%d" % (i+1), chunk)
+
+    # chunked objects written without a manifest are found by listing
+    assert(ObjectStore.get_object(bucket, "chunked") == b"".join(chunks))
+
+    # the manifest says how many chunks have been completely written
+    ObjectStore.set_object(bucket, "chunked", encode_chunk_manifest(10))
+
+    assert(ObjectStore.get_object(bucket, "chunked") ==
+           b"".join(chunks[0:10]))
+
+    ObjectStore.set_object(bucket, "chunked", encode_chunk_manifest(12))
+
+    assert(ObjectStore.get_object(bucket, "chunked") == b"".join(chunks))
+    assert(ObjectStore.get_objects(bucket, ["chunked"]) ==
+           {"chunked": b"".join(chunks)})
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.get_object(bucket, "chunked_missing")
+
+
+def test_open_object(bucket):
+    from Acquire.ObjectStore import encode_chunk_manifest
+
+    chunks = [("stream %d " % i).encode("utf-8") * 1000 for i in range(0, 5)]
+
+    for (i, chunk) in enumerate(chunks):
+        ObjectStore.set_object(bucket, "streamed/%d" % (i+1), chunk)
+
+    ObjectStore.set_object(bucket, "streamed", encode_chunk_manifest(5))
+
+    data = b"".join(chunks)
+
+    with ObjectStore.open_object(bucket, "streamed") as f:
+        assert(f.read(10) == data[0:10])
+        f.seek(len(chunks[0]) + 5)
+        assert(f.tell() == len(chunks[0]) + 5)
+        assert(f.read() == data[len(chunks[0]) + 5:])
+        assert(f.read() == b"")
+
+    with ObjectStore.open_object(bucket, "streamed/2") as f:
+        assert(f.read() == chunks[1])
+
+    with pytest.raises(ObjectStoreError):
+        ObjectStore.open_object(bucket, "streamed_missing")
+
+
+def test_conditional_writes(bucket):
+    etag = ObjectStore.set_object_if_absent(bucket, "cas/key", b"first")
+    assert(etag is not None)
+    assert(ObjectStore.set_object_if_absent(bucket, "cas/key", b"x") is None)
+
+    (data, read_etag) = ObjectStore.get_object_with_etag(bucket, "cas/key")
+    assert(data == b"first")
+    assert(read_etag == etag)
+
+    etag = ObjectStore.set_object_if_match(bucket, "cas/key", b"second", etag)
+    assert(etag is not None)
+    assert(ObjectStore.get_object(bucket, "cas/key") == b"second")
+
+    # the old etag is now stale, so this write must fail
+    assert(ObjectStore.set_object_if_match(bucket, "cas/key", b"third",
+                                           read_etag) is None)
+    assert(ObjectStore.get_object(bucket, "cas/key") == b"second")
+    assert(ObjectStore.set_object_if_match(bucket, "cas/missing", b"x",
+                                           etag) is None)
+
+
+def test_statistics(bucket):
+    assert(ObjectStore.get_statistics() is None)
+
+    ObjectStore.enable_statistics()
+
+    try:
+        ObjectStore.set_object(bucket, "stats/a", b"12345")
+        ObjectStore.set_object(bucket, "other/a", b"123")
+        assert(ObjectStore.get_object(bucket, "stats/a") == b"12345")
+
+        with pytest.raises(ObjectStoreError):
+            ObjectStore.get_object(bucket, "stats/missing")
+
+        ObjectStore.set_object_from_json(bucket, "stats/j", {"a": 1})
+        assert(ObjectStore.get_object_from_json(bucket, "stats/j") ==
+               {"a": 1})
+
+        # streams and names are counted as they are read
+        with ObjectStore.open_object(bucket, "stats/a") as f:
+            assert(f.read() == b"12345")
+
+        names = ObjectStore.iter_object_names(bucket, "stats")
+        assert(sorted(names) == ["a", "j"])
+
+        stats = ObjectStore.get_statistics()
+    finally:
+        ObjectStore.disable_statistics()
+
+    assert(stats["operations"]["set_object"]["count"] == 2)
+    assert(stats["operations"]["set_object"]["bytes_out"] == 8)
+    assert(stats["operations"]["get_object"]["count"] == 2)
+    assert(stats["operations"]["get_object"]["errors"] == 1)
+    assert(stats["operations"]["get_object"]["bytes_in"] == 5)
+    assert(sum(stats["operations"]["get_object"]["histogram"].values()) == 2)
+
+    assert(stats["operations"]["set_object_from_json"]["bytes_out"] == 8)
+    assert(stats["operations"]["get_object_from_json"]["bytes_in"] == 8)
+    assert(stats["operations"]["open_object"]["bytes_in"] == 5)
+    assert(stats["operations"]["iter_object_names"]["count"] == 1)
+    assert(stats["operations"]["iter_object_names"]["bytes_in"] == 2)
+
+    assert(stats["prefixes"]["stats"]["set_object"]["count"] == 1)
+    assert(stats["prefixes"]["other"]["set_object"]["bytes_out"] == 3)
+
+
+def test_trace_replay(bucket, tmpdir):
+    from Acquire.ObjectStore import ObjectStoreTrace
+    from Acquire.ObjectStore._testing_objstore import Testing_ObjectStore
+
+    ObjectStore.set_object(bucket, "trace/existing", b"1234567890")
+
+    with ObjectStoreTrace() as trace:
+        ObjectStore.get_object(bucket, "trace/existing")
+        ObjectStore.set_object_from_json(bucket, "trace/a", {"x": [1, 2]})
+        ObjectStore.get_object_from_json(bucket, "trace/a")
+        names = ObjectStore.get_all_object_names(bucket, "trace")
+
+        with pytest.raises(ObjectStoreError):
+            ObjectStore.get_object(bucket, "trace/missing")
+
+    assert(len(names) == 2)
+    assert(len(trace) == 5)
+
+    calls = trace.calls()
+    assert(calls[0]["operation"] == "get_object")
+    assert(calls[0]["key"] == "trace/existing")
+    assert(calls[0]["size"] == 10)
+    assert(calls[4]["error"])
+
+    trace = ObjectStoreTrace.from_data(trace.to_data())
+
+    # replay against an empty bucket, which is seeded with the
+    # objects read by the trace
+    replay_bucket = str(tmpdir.mkdir("replay"))
+    results = trace.replay(replay_bucket, backend=Testing_ObjectStore,
+                           latency=0.01)
+
+    assert(results["num_calls"] == 5)
+    assert(results["total_time"] >= 0.05)
+    assert(results["operations"]["get_object"]["count"] == 2)
+    assert(results["operations"]["get_object"]["errors"] == 1)
+    assert(results["operations"]["get_object_from_json"]["errors"] == 0)
+    assert(Testing_ObjectStore.get_object(
+                replay_bucket, "trace/existing") == b"x" * 10)
+
+    # a conditional write whose ETag was read outside of the trace uses
+    # the ETag of the current object, and is skipped if there is none
+    (_, etag) = ObjectStore.get_object_with_etag(bucket, "trace/existing")
+
+    with ObjectStoreTrace() as trace:
+        ObjectStore.set_object_if_match(bucket, "trace/existing", b"1", etag)
+        ObjectStore.set_object_if_match(bucket, "trace/unseen", b"1", etag)
+        names = list(ObjectStore.iter_object_names(bucket, "trace"))
+
+    # listed names are recorded once they have been iterated
+    assert(trace.calls()[2]["size"] == sum(len(name) for name in names))
+
+    # paging arguments are recorded whether passed by position or name
+    with ObjectStoreTrace() as paged:
+        list(ObjectStore.iter_object_names(bucket, "trace", "a", 1))
+        list(ObjectStore.iter_object_names(bucket, "trace",
+                                           start_after="a", limit=1))
+
+    for call in paged.calls():
+        assert(call["start_after"] == "a")
+        assert(call["limit"] == 1)
+
+    results = trace.replay(replay_bucket, backend=Testing_ObjectStore)
+
+    assert(results["operations"]["set_object_if_match"]["count"] == 1)
+    assert(results["operations"]["set_object_if_match"]["skipped"] == 1)
+    assert(Testing_ObjectStore.get_object(
+                replay_bucket, "trace/existing") == b"x")
+
+    with pytest.raises(ObjectStoreError):
+        Testing_ObjectStore.get_object(replay_bucket, "trace/unseen")
+
+
+def test_binary_json(bucket):
+    import os as _os
+    from Acquire.ObjectStore import set_binary_json, clear_binary_json, \
+        set_json_compression, clear_json_compression, \
+        to_binary_json, from_binary_json, bytes_to_string
+
+    pytest.importorskip("msgpack")
+
+    data = {"signature": bytes_to_string(_os.urandom(256)),
+            "short": "abcd", "not_base64": "hello world! \u0192",
+            "values": [1, -5, 3.25, None, True, False, [], {}],
+            "nested": {"key": bytes_to_string(b"0123456789abcdef" * 4)}}
+
+    encoded = to_binary_json(data)
+    assert(from_binary_json(encoded) == data)
+
+    with pytest.raises(ObjectStoreError):
+        from_binary_json(encoded[0:-3])
+
+    try:
+        set_binary_json("binary/")
+        set_json_compression("binary/compressed", "zlib", min_size=0)
+
+        ObjectStore.set_object_from_json(bucket, "binary/a", data)
+        ObjectStore.set_object_from_json(bucket, "binary/compressed/a", data)
+        ObjectStore.set_object_from_json(bucket, "binary/big", [2**70])
+        ObjectStore.set_object_from_json(bucket, "plain/a", data)
+    finally:
+        clear_binary_json()
+        clear_json_compression()
+
+    # the base64 strings are stored as their raw bytes
+    raw = ObjectStore.get_object(bucket, "binary/a")
+    assert(raw == encoded)
+    assert(len(raw) < len(ObjectStore.get_object(bucket, "plain/a")) - 80)
+
+    for key in ["binary/a", "binary/compressed/a", "plain/a"]:
+        assert(ObjectStore.get_object_from_json(bucket, key) == data)
+
+    # integers too large for msgpack are written as json
+    assert(ObjectStore.get_object_from_json(bucket, "binary/big") == [2**70])
+
+
+def test_memory_objstore():
+    from Acquire.ObjectStore import encode_chunk_manifest
+    from Acquire.ObjectStore._memory_objstore import Memory_ObjectStore
+
+    bucket = "test_memory_objstore"
+
+    try:
+        for key in ["b/2", "a/1", "b/1", "b/10", "bb/1", "c"]:
+            Memory_ObjectStore.set_object(bucket, key, key.encode("utf-8"))
+
+        assert(Memory_ObjectStore.get_object(bucket, "b/10") == b"b/10")
+        assert(Memory_ObjectStore.get_all_object_names(bucket, "b") ==
+               ["1", "10", "2"])
+        assert(Memory_ObjectStore.get_all_object_names(bucket, "b/") ==
+               ["1", "10", "2"])
+        assert(Memory_ObjectStore.get_all_objects(bucket, "b/")["1"] ==
+               b"b/1")
+        assert(list(Memory_ObjectStore.iter_object_names(
+                bucket, "b", start_after="1", limit=1)) == ["10"])
+        assert(len(Memory_ObjectStore.get_all_object_names(bucket)) == 6)
+
+        with pytest.raises(ObjectStoreError):
+            Memory_ObjectStore.get_object(bucket, "b")
+
+        Memory_ObjectStore.delete_all_objects(bucket, "b")
+        assert(Memory_ObjectStore.get_all_object_names(bucket) ==
+               ["a/1", "bb/1", "c"])
+
+        # chunked objects are read with or without a manifest
+        Memory_ObjectStore.set_object(bucket, "e/d/1", b"x")
+        Memory_ObjectStore.set_object(bucket, "e/d/2", b"y")
+        assert(Memory_ObjectStore.get_object(bucket, "e/d") == b"xy")
+        Memory_ObjectStore.set_object(bucket, "e/d", encode_chunk_manifest(2))
+        assert(Memory_ObjectStore.get_objects(bucket, ["e/d"]) ==
+               {"e/d": b"xy"})
+        assert(Memory_ObjectStore.get_all_objects(bucket, "e") ==
+               {"d": b"xy", "d/1": b"x", "d/2": b"y"})
+        Memory_ObjectStore.delete_all_objects(bucket, "e")
+
+        Memory_ObjectStore.set_object_from_json(bucket, "j", {"a": 1})
+        assert(Memory_ObjectStore.get_objects_from_json(
+                bucket, ["j", "missing"]) == {"j": {"a": 1}, "missing": None})
+
+        etag = Memory_ObjectStore.set_object_if_absent(bucket, "x", b"1")
+        assert(etag is not None)
+        assert(Memory_ObjectStore.set_object_if_absent(bucket, "x", b"2")
+               is None)
+        assert(Memory_ObjectStore.set_object_if_match(bucket, "x", b"3",
+                                                      "wrong") is None)
+        assert(Memory_ObjectStore.set_object_if_match(bucket, "x", b"3",
+                                                      etag) is not None)
+        assert(Memory_ObjectStore.get_object(bucket, "x") == b"3")
+
+        Memory_ObjectStore.clear_all_except(bucket, ["a", "x"])
+        assert(Memory_ObjectStore.get_all_object_names(bucket) ==
+               ["a/1", "x"])
+    finally:
+        Memory_ObjectStore.clear_buckets()
+
+
+def test_sqlite_objstore(tmpdir):
+    from Acquire.ObjectStore import encode_chunk_manifest
+    from Acquire.ObjectStore._sqlite_objstore import SQLite_ObjectStore
+
+    bucket = str(tmpdir.mkdir("sqlite"))
+
+    for key in ["b/2", "a/1", "b/1", "b/10", "bb/1", "c"]:
+        SQLite_ObjectStore.set_object(bucket, key, key.encode("utf-8"))
+
+    assert(SQLite_ObjectStore.get_object(bucket, "b/10") == b"b/10")
+    assert(SQLite_ObjectStore.get_all_object_names(bucket, "b") ==
+           ["1", "10", "2"])
+    assert(SQLite_ObjectStore.get_all_object_names(bucket, "b/") ==
+           ["1", "10", "2"])
+    assert(SQLite_ObjectStore.get_all_objects(bucket, "b/")["1"] == b"b/1")
+    assert(list(SQLite_ObjectStore.iter_object_names(
+            bucket, "b", start_after="1", limit=1)) == ["10"])
+
+    with pytest.raises(ObjectStoreError):
+        SQLite_ObjectStore.get_object(bucket, "b")
+
+    SQLite_ObjectStore.delete_all_objects(bucket, "b")
+    assert(SQLite_ObjectStore.get_all_object_names(bucket) ==
+           ["a/1", "bb/1", "c"])
+
+    # chunked objects are read with or without a manifest
+    SQLite_ObjectStore.set_object(bucket, "e/d/1", b"x")
+    SQLite_ObjectStore.set_object(bucket, "e/d/2", b"y")
+    assert(SQLite_ObjectStore.get_object(bucket, "e/d") == b"xy")
+    SQLite_ObjectStore.set_object(bucket, "e/d", encode_chunk_manifest(2))
+    assert(SQLite_ObjectStore.get_objects(bucket, ["e/d"]) == {"e/d": b"xy"})
+    assert(SQLite_ObjectStore.get_all_objects(bucket, "e") ==
+           {"d": b"xy", "d/1": b"x", "d/2": b"y"})
+    SQLite_ObjectStore.delete_all_objects(bucket, "e")
+
+    etag = SQLite_ObjectStore.set_object_if_absent(bucket, "x", b"1")
+    assert(etag is not None)
+    assert(SQLite_ObjectStore.set_object_if_absent(bucket, "x", b"2")
+           is None)
+    assert(SQLite_ObjectStore.set_object_if_match(bucket, "x", b"3",
+                                                  "wrong") is None)
+    assert(SQLite_ObjectStore.set_object_if_match(bucket, "x", b"3",
+                                                  etag) is not None)
+    assert(SQLite_ObjectStore.get_object(bucket, "x") == b"3")
+
+    # a deletion that fails part way through deletes nothing
+    with pytest.raises(Exception):
+        SQLite_ObjectStore.delete_objects(bucket, ["x", {"bad": "key"}])
+
+    assert(SQLite_ObjectStore.get_object(bucket, "x") == b"3")
+
+    # objects written by other threads (using their own connections)
+    # are visible, and conditional writes are atomic between them
+    import threading
+
+    SQLite_ObjectStore.set_object(bucket, "counter", b"0")
+
+    def _increment():
+        for i in range(20):
+            while True:
+                (data, etag) = SQLite_ObjectStore.get_object_with_etag(
+                                                    bucket, "counter")
+                data = str(int(data) + 1).encode("utf-8")
+
+                if SQLite_ObjectStore.set_object_if_match(
+                        bucket, "counter", data, etag) is not None:
+                    break
+
+    threads = [threading.Thread(target=_increment) for i in range(4)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert(SQLite_ObjectStore.get_object(bucket, "counter") == b"80")
+
+
+def test_json_compression(bucket):
+    from Acquire.ObjectStore import set_json_compression, \
+        clear_json_compression
+
+    data = {"records": [{"name": "value %d" % i} for i in range(100)]}
+
+    ObjectStore.set_object_from_json(bucket, "compress/old", data)
+
+    try:
+        set_json_compression("compress/", "zlib")
+        set_json_compression("compress/lzma", "lzma")
+
+        ObjectStore.set_object_from_json(bucket, "compress/new", data)
+        ObjectStore.set_object_from_json(bucket, "compress/lzma/new", data)
+        ObjectStore.set_object_from_json(bucket, "compress/small", [1])
+
+        with pytest.raises(ObjectStoreError):
+            set_json_compression("compress/", "unknown")
+    finally:
+        clear_json_compression()
+
+    raw = ObjectStore.get_object(bucket, "compress/new")
+    assert(len(raw) < len(ObjectStore.get_object(bucket, "compress/old")))
+    assert(raw.startswith(b"\x00acqz\x04zlib"))
+    assert(ObjectStore.get_object(
+        bucket, "compress/lzma/new").startswith(b"\x00acqz\x04lzma"))
+    assert(ObjectStore.get_object(bucket, "compress/small") == b"[1]")
+
+    # compressed and uncompressed objects are both read back
+    for key in ["compress/old", "compress/new", "compress/lzma/new"]:
+        assert(ObjectStore.get_object_from_json(bucket, key) == data)
+
+    objects = ObjectStore.get_objects_from_json(
+                    bucket, ["compress/old", "compress/new"])
+    assert(objects["compress/new"] == data)
+
+
+def test_async_objstore(bucket):
+    import asyncio
+    from Acquire.ObjectStore import AsyncObjectStore
+
+    async def _run():
+        await asyncio.gather(*[AsyncObjectStore.set_object_from_json(
+                                    bucket, "async/%d" % i, {"i": i})
+                               for i in range(10)])
+
+        values = await asyncio.gather(
+                    *[AsyncObjectStore.get_object_from_json(
+                        bucket, "async/%d" % i) for i in range(10)])
+
+        names = [name async for name in
+                 AsyncObjectStore.iter_object_names(bucket, "async",
+                                                    start_after="5")]
+
+        return (values, names)
+
+    loop = asyncio.new_event_loop()
+
+    try:
+        (values, names) = loop.run_until_complete(_run())
+    finally:
+        loop.close()
+
+    assert(values == [{"i": i} for i in range(10)])
+    assert(names == ["6", "7", "8", "9"])
+
+
+def test_segmented_log(bucket):
+    from Acquire.ObjectStore import ObjectStoreLog
+
+    ObjectStore.clear_log(bucket, "seglog")
+    ObjectStore.log(bucket, "single message", "seglog")
+
+    with ObjectStoreLog(bucket, "seglog", max_segment_size=20) as log:
+        for i in range(5):
+            log.log("message %d" % i)
+
+    # the first three (9 byte) messages fill a 20 byte segment, and
+    # the last two are written on close
+    # segments are kept out of 'seglog/', where older readers expect
+    # every name to be a timestamp
+    names = ObjectStore.get_all_object_names(bucket, "seglog")
+    assert(len(names) == 1)
+    float(names[0])
+
+    names = ObjectStore.get_all_object_names(bucket, "seglog.segments")
+    assert(len(names) == 2)
+
+    text = ObjectStore.get_log(bucket, "seglog")
+    assert(text.startswith("<log><logitem>"))
+    assert(text.count("<logitem>") == 6)
+
+    positions = [text.index(m) for m in ["single message"] +
+                 ["message %d" % i for i in range(5)]]
+    assert(positions == sorted(positions))
+
+    # messages are flushed after 'max_segment_age' seconds
+    import time
+    log = ObjectStoreLog(bucket, "seglog", max_segment_age=0.05)
+    log.log("timed message")
+    time.sleep(0.5)
+    assert("timed message" in ObjectStore.get_log(bucket, "seglog"))
+
+    ObjectStore.clear_log(bucket, "seglog")
+    assert(ObjectStore.get_all_object_names(bucket, "seglog.segments") == [])
+    assert("<logitem>" not in ObjectStore.get_log(bucket, "seglog"))
+
+
+def test_bulk_delete(tmpdir):
+    from Acquire.ObjectStore._testing_objstore import Testing_ObjectStore
+    from Acquire.ObjectStore._deletion import PrefixTrie
+
+    trie = PrefixTrie(["input.tar.bz2", "interim/run", "output/"])
+    assert(trie.matches("input.tar.bz2"))
+    assert(trie.matches("interim/run.log"))
+    assert(trie.matches("output/a/b"))
+    assert(not trie.matches("input.tar"))
+    assert(not trie.matches("interim/x"))
+    assert(not trie.matches("output"))
+    assert(PrefixTrie([""]).matches("anything"))
+
+    bucket = str(tmpdir.mkdir("bulk"))
+
+    for key in ["input.tar.bz2", "log/1", "log/2", "output/a", "status"]:
+        Testing_ObjectStore.set_object(bucket, key, b"x")
+
+    assert(Testing_ObjectStore.delete_objects(
+                bucket, ["log/1", "missing"]) == {})
+
+    Testing_ObjectStore.clear_all_except(bucket, ["input.tar.bz2", "output"])
+
+    assert(sorted(Testing_ObjectStore.get_all_object_names(bucket)) ==
+           ["input.tar.bz2", "output/a"])
+
+
+def test_sharded_objstore(tmpdir):
+    from Acquire.ObjectStore import ShardedBucket, ShardedObjectStore
+    from Acquire.ObjectStore._testing_objstore import Testing_ObjectStore
+
+    buckets = [str(tmpdir.mkdir("shard%d" % i)) for i in range(0, 4)]
+
+    bucket = ShardedBucket(buckets[0])
+    bucket.add_shard("accounts", buckets[1:4])
+
+    backend = ShardedObjectStore(Testing_ObjectStore)
+
+    keys = ["accounts/%03d/item/%d" % (i, j)
+            for i in range(0, 20) for j in range(0, 3)]
+
+    for key in keys:
+        backend.set_string_object(bucket, key, key)
+
+    backend.set_string_object(bucket, "identity/user", "user")
+
+    # all keys of an account are held together in one bucket
+    for i in range(0, 20):
+        prefix = "accounts/%03d" % i
+        assert(len(bucket.get_buckets(prefix)) == 1)
+        assert(len(backend.get_all_object_names(bucket, prefix)) == 3)
+
+    # the accounts are spread over every shard
+    for shard in buckets[1:4]:
+        assert(len(Testing_ObjectStore.get_all_object_names(shard)) > 0)
+
+    assert(Testing_ObjectStore.get_all_object_names(buckets[0]) ==
+           ["identity/user"])
+
+    names = list(backend.iter_object_names(bucket, "accounts"))
+    assert(names == sorted(key[len("accounts/"):] for key in keys))
+    assert(list(backend.iter_object_names(bucket, "accounts", names[9],
+                                          limit=5)) == names[10:15])
+
+    assert(len(backend.get_all_object_names(bucket)) == len(keys) + 1)
+
+    objects = backend.get_objects(bucket, keys[0:10] + ["identity/user"])
+    assert(objects["identity/user"] == b"user")
+    assert(objects[keys[5]] == keys[5].encode("utf-8"))
+
+    assert(backend.delete_objects(bucket, keys[0:30]) == {})
+    assert(len(backend.get_all_object_names(bucket, "accounts")) == 30)
+
+    backend.delete_all_objects(bucket, "accounts")
+    assert(backend.get_all_object_names(bucket, "accounts") == [])
+    assert(backend.get_string_object(bucket, "identity/user") == "user")
+
+
+def test_oci_multipart_upload(tmpdir, monkeypatch):
+    import sys
+    import types
+    from Acquire.ObjectStore import _oci_objstore
+    from Acquire.ObjectStore._oci_objstore import OCI_ObjectStore
+
+    # the upload details are only passed through to the client, so
+    # simple records can stand in for the OCI models
+    class _Details:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    models = types.ModuleType("oci.object_storage.models")
+    models.CreateMultipartUploadDetails = _Details
+    models.CommitMultipartUploadDetails = _Details
+    models.CommitMultipartUploadPartDetails = _Details
+    monkeypatch.setitem(sys.modules, "oci.object_storage.models", models)
+    monkeypatch.setattr(_oci_objstore, "_max_part_retries", 1)
+
+    class _Response:
+        def __init__(self, data=None, headers=None):
+            self.data = data
+            self.headers = headers
+
+    class _Client:
+        def __init__(self, fail_part=None):
+            self.fail_part = fail_part
+            self.parts = {}
+            self.committed = None
+            self.aborted = False
+
+        def create_multipart_upload(self, namespace, bucket_name, details):
+            return _Response(data=_Details(upload_id="upload"))
+
+        def upload_part(self, namespace, bucket_name, key, upload_id,
+                        part_num, data, content_md5=None):
+            if part_num == self.fail_part:
+                raise IOError("Failed to upload part %d" % part_num)
+
+            self.parts[part_num] = data
+            return _Response(headers={"etag": "etag%d" % part_num})
+
+        def commit_multipart_upload(self, namespace, bucket_name, key,
+                                    upload_id, details):
+            self.committed = [(part.part_num, part.etag)
+                              for part in details.parts_to_commit]
+
+        def abort_multipart_upload(self, namespace, bucket_name, key,
+                                   upload_id):
+            self.aborted = True
+
+    filename = str(tmpdir.join("multipart"))
+    data = b"".join([("part %d " % i).encode("utf-8") * 50
+                     for i in range(0, 20)])
+
+    with open(filename, "wb") as FILE:
+        FILE.write(data)
+
+    part_size = 1000
+    num_parts = (len(data) + part_size - 1) // part_size
+
+    client = _Client()
+    bucket = {"client": client, "namespace": "ns", "bucket_name": "test"}
+
+    _oci_objstore._multipart_upload(bucket, "key", filename, part_size)
+
+    # the parts are numbered from 1, with a short last part, and all
+    # are committed in order
+    assert(sorted(client.parts.keys()) == list(range(1, num_parts+1)))
+    assert(b"".join(client.parts[i] for i in range(1, num_parts+1)) == data)
+    assert(len(client.parts[num_parts]) == len(data) % part_size)
+    assert(client.committed == [(i, "etag%d" % i)
+                                for i in range(1, num_parts+1)])
+    assert(not client.aborted)
+
+    # a part that cannot be uploaded aborts the whole upload
+    client = _Client(fail_part=3)
+    bucket["client"] = client
+
+    with pytest.raises(ObjectStoreError):
+        _oci_objstore._multipart_upload(bucket, "key", filename, part_size)
+
+    assert(client.aborted)
+    assert(client.committed is None)
+
+    # parts must be at least as large as the OCI minimum
+    with pytest.raises(ValueError):
+        OCI_ObjectStore.set_object_from_file(bucket, "key", filename,
+                                             part_size)
+
+
+def test_oci_delete_all_objects():
+    from Acquire.ObjectStore._oci_objstore import OCI_ObjectStore
+
+    class _Record:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    class _NotFound(Exception):
+        status = 404
+
+    class _Client:
+        def __init__(self, keys):
+            self.keys = set(keys)
+
+        def list_objects(self, namespace, bucket_name, prefix=None,
+                         start=None, limit=None):
+            names = sorted(key for key in self.keys
+                           if prefix is None or key.startswith(prefix))
+            objects = [_Record(name=name) for name in names
+                       if start is None or name >= start]
+            return _Record(data=_Record(objects=objects,
+                                        next_start_with=None))
+
+        def delete_object(self, namespace, bucket_name, key):
+            if key not in self.keys:
+                raise _NotFound(key)
+
+            self.keys.remove(key)
+
+    client = _Client(["a", "a/1", "a/2/x", "ab/1", "b"])
+    bucket = {"client": client, "namespace": "ns", "bucket_name": "bucket"}
+
+    # the object at the prefix itself is deleted, but not its siblings
+    OCI_ObjectStore.delete_all_objects(bucket, "a")
+    assert(sorted(client.keys) == ["ab/1", "b"])
+
+    OCI_ObjectStore.delete_all_objects(bucket, "missing")
+    OCI_ObjectStore.delete_all_objects(bucket)
+    assert(len(client.keys) == 0)